@@ -31,8 +31,13 @@ from FieldSpecifier import FieldSpecifier
 from DataRecord import DataRecord
 from ADT_Semantics import checkSemantics
 from FieldValue import FieldValue
+from Arrays import newArray, decodeArray, encodeArray, toList
+from Codecs import AddressCodec
 
 class ADT_BasicList(object):
+    # Lists of fixed-length numbers (e.g., interface indexes, MPLS labels, AS paths) are kept in
+    # a compact sequence (see Arrays), decoded and encoded in one sweep; FieldValues are only
+    # built for them when requested through getValues/getValue. Other lists keep FieldValues.
     _strSemantic = struct.Struct('!B')
 
     def __init__(self):
@@ -40,6 +45,8 @@ class ADT_BasicList(object):
         self.field = None
         self.fieldId = None
         self.values = []
+        self.array = None
+        self.arrayType = None
 
     def __del__(self):
         for v in self.values: del v
@@ -47,6 +54,13 @@ class ADT_BasicList(object):
         del self.field
         del self.fieldId
         del self.values
+        del self.array
+
+    def _setField(self, field):
+        self.field = field
+        self.fieldId = field.getId()
+        if(not field.variableLength):
+            self.arrayType = field.getCodec().arrayType
 
     @classmethod
     def create(cls, semantic, field):
@@ -54,50 +68,84 @@ class ADT_BasicList(object):
         checkType('field', (FieldSpecifier,), field)
         obj = cls()
         obj.semantic = semantic
-        obj.field = field
-        obj.fieldId = field.getId()
+        obj._setField(field)
+        if(obj.arrayType is not None): obj.array = newArray(obj.arrayType)
         return(obj)
 
     @classmethod
-    def read(cls, rawData, length, domain):
+    def read(cls, rawData, length, context):
         baseOffset = rawData.tell()
         if(length < ADT_BasicList._strSemantic.size):
             raise Exception('Insufficient data to read semantic field of a BasicList')
         data = rawData.read(ADT_BasicList._strSemantic.size)
         obj = cls()
         (obj.semantic,) = ADT_BasicList._strSemantic.unpack_from(data)
-        obj.field = FieldSpecifier.read(rawData)
-        obj.fieldId = obj.field.getId()
+        obj._setField(FieldSpecifier.read(rawData))
         
-        length -= (rawData.tell() - baseOffset + 1)
+        length -= (rawData.tell() - baseOffset)
+        validator = obj.field.getValidator()
+        if((validator is not None) and (not context.shouldValidate())): validator = None
+        arrayType = obj.arrayType
+        if((arrayType is not None) and ((length % arrayType.itemSize) == 0)):
+            obj.array = decodeArray(arrayType, rawData.read(length))
+            if(validator is not None):
+                for value in obj.array: validator(value)
+            return(obj)
+
         baseOffset = rawData.tell()
         while((rawData.tell() - baseOffset) < length):
-            value = FieldValue.read(obj.field, rawData, domain)
+            value = FieldValue.read(obj.field, rawData, context)
             obj.values.append(value)
+        if(validator is not None):
+            for value in obj.values: validator(value.value)
         return(obj)
     
     def getSemantic(self): return(self.semantic)
     def getFieldId(self): return(self.fieldId)
     def getField(self): return(self.field)
 
+    # compact sequence of the values, or None when the list keeps FieldValues
+    def getArray(self): return(self.array)
+
     def addValue(self, value):
+        if(self.array is not None):
+            # addresses are kept as integers, whatever the form (tuple of bytes, text) they come in
+            codec = self.field.getCodec()
+            if(isinstance(codec, AddressCodec)): value = codec._toInteger(value)
+        validator = self.field.getValidator()
+        if(validator is not None): validator(value)
+        if(self.array is not None):
+            self.array = newArray(self.arrayType, self.array)
+            self.array.append(value)
+            return
         recordLength = [0]
         self.values.append(FieldValue.create(self.field, value, recordLength))
 
-    def getNumValues(self): return(len(self.values))
-    def getValues(self): return(self.values)
+    def getNumValues(self):
+        if(self.array is not None): return(len(self.array))
+        return(len(self.values))
+
+    def getValues(self):
+        if(self.array is not None):
+            recordLength = [0]
+            return([FieldValue.create(self.field, value, recordLength) for value in toList(self.array)])
+        return(self.values)
 
     def getValue(self, index):
         checkInteger('index', index)
-        maxIndex = len(self.values)-1
+        maxIndex = self.getNumValues()-1
         if(index < 0 or index > maxIndex):
             raise Exception('Out of range index(%d) must be between 0 and length-1(%d)' % (
                             index, maxIndex))
+        if(self.array is not None):
+            return(FieldValue.create(self.field, toList(self.array[index:index+1])[0], [0]))
         return(self.values[index])
     
     def _computeLength(self):
         length = 5 # 1 byte for semantic + 2 bytes for fieldId + 2 bytes for field length
         if(self.field.isEnterprise()): length += 4 # enterprise number
+        if(self.array is not None):
+            return(length + len(self.array) * self.arrayType.itemSize)
         for value in self.values:
             length += value._computeLength()
         return(length)
@@ -108,13 +156,20 @@ class ADT_BasicList(object):
 
     def write(self, rawData):
         self._writeHeader(rawData)
+        if(self.array is not None):
+            rawData.write(encodeArray(self.arrayType, self.array))
+            return
         for value in self.values:
             value.write(rawData)
 
     def toJSON(self):
+        if(self.array is not None):
+            values = [{self.field.name: value} for value in toList(self.array)]
+        else:
+            values = map(lambda s: s.toJSON(), self.values)
         d = {
             'fieldId': self.fieldId,
-            'values': map(lambda s: s.toJSON(), self.values)
+            'values': values
         }
         if(self.field.isEnterprise()): d['pen'] = self.field.getEnterpriseNumber()
         return(d)
@@ -11,12 +11,18 @@
 # +-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+
 
 import json, struct
+from cStringIO import StringIO
 from Lib.ParameterChecking import checkType, checkInteger, checkAttr
 from TemplateRecord import TemplateRecord
 from DataRecord import DataRecord
 from ADT_Semantics import checkSemantics
 
 class ADT_SubTemplateList(object):
+    # Lists read from the wire keep their content raw when their records are not validated; they
+    # are decoded all at once the first time they are accessed, so lists only forwarded (e.g.,
+    # written again) are never decoded. Lists to validate are decoded and validated when read, so
+    # invalid data is reported by Session.readMessage. The template is bound when the list is
+    # read, and nested lists are resolved through the DecodingContext of the record.
     _str = struct.Struct('!BH')
     
     def __init__(self):
@@ -24,6 +30,8 @@ class ADT_SubTemplateList(object):
         self.template = None
         self.templateId = None
         self.records = []
+        self.rawRecords = None
+        self.context = None
 
     def __del__(self):
         for r in self.records: del r
@@ -31,6 +39,8 @@ class ADT_SubTemplateList(object):
         del self.template
         del self.templateId
         del self.records
+        del self.rawRecords
+        del self.context
 
     @classmethod
     def create(cls, semantic, template):
@@ -43,20 +53,48 @@ class ADT_SubTemplateList(object):
         return(obj)
 
     @classmethod
-    def read(cls, rawData, length, domain):
+    def read(cls, rawData, length, context):
         if(length < ADT_SubTemplateList._str.size):
             raise Exception('Insufficient data to read a FieldValue_SubTemplateList field')
         obj = cls()
         data = rawData.read(ADT_SubTemplateList._str.size)
         (obj.semantic, obj.templateId) = ADT_SubTemplateList._str.unpack_from(data)
-        obj.template = domain.getCollectorTemplate(obj.templateId)
-        baseOffset = rawData.tell()
-        length -= ADT_SubTemplateList._str.size
-        while((rawData.tell() - baseOffset) < length):
-            record = DataRecord.read(obj.template, rawData, domain)
-            obj.records.append(record)
+        obj.template = context.getCollectorTemplate(obj.templateId)
+        obj.rawRecords = rawData.read(length - ADT_SubTemplateList._str.size)
+        obj.context = context
+        if(context.shouldValidate()): obj._decodeRecords(True)
         return(obj)
 
+    @classmethod
+    def concatenate(cls, lists):
+        # list with the records of the given lists (e.g., pages), raw if none of them was decoded
+        first = lists[0]
+        obj = cls.create(first.semantic, first.template)
+        if(all([(l.rawRecords is not None) and (l.template is first.template) for l in lists])):
+            obj.rawRecords = ''.join([l.rawRecords for l in lists])
+            obj.context = first.context
+        else:
+            for l in lists: obj.records.extend(l.getRecords())
+        return(obj)
+
+    def isDecoded(self): return(self.rawRecords is None)
+
+    def _decodeRecords(self, validate=False):
+        if(self.rawRecords is None): return
+        context = self.context
+        rawData = StringIO(self.rawRecords)
+        length = len(self.rawRecords)
+        records = []
+        try:
+            while(rawData.tell() < length):
+                records.append(DataRecord.read(self.template, rawData, context, validate))
+        except Exception as e:
+            raise Exception('Invalid subTemplateList of Template(%d) in Domain(%d): %s' % (
+                            self.templateId, context.obsDomainId, str(e)))
+        self.records = records
+        self.rawRecords = None
+        self.context = None
+
     @classmethod
     def fromJSON(cls, data):
         obj = cls()
@@ -77,15 +115,22 @@ class ADT_SubTemplateList(object):
     def getTemplateId(self): return(self.templateId)
     def getTemplate(self): return(self.template)
 
-    def addDataRecord(self, values):
+    def addDataRecord(self, values, validate=True):
         checkType('values', (dict,), values)
-        self.records.append(DataRecord.create(self.template, values))
+        self._decodeRecords()
+        self.records.append(DataRecord.create(self.template, values, validate))
+
+    def getNumRecords(self):
+        self._decodeRecords()
+        return(len(self.records))
 
-    def getNumRecords(self): return(len(self.records))
-    def getRecords(self): return(self.records)
+    def getRecords(self):
+        self._decodeRecords()
+        return(self.records)
 
     def getRecord(self, index):
         checkInteger('index', index)
+        self._decodeRecords()
         maxIndex = len(self.records)-1
         if(index < 0 or index > maxIndex):
             raise Exception('Out of range index(%d) must be between 0 and length-1(%d)' % (
@@ -93,10 +138,28 @@ class ADT_SubTemplateList(object):
         return(self.records[index])
     
     def sortRecords(self, fieldName, ascending=True):
-        self.records.sort(key=lambda x: x.getField(fieldName), reverse=(not ascending))
+        # the position of the key column is looked up once; records built with a different
+        # layout (e.g., created with paddingOctets) fall back to a lookup by name
+        self._decodeRecords()
+        if(len(self.records) == 0): return
+        values = self.records[0].values
+        index = None
+        for i in xrange(len(values)):
+            if(values[i].field.name == fieldName):
+                index = i
+                break
+        if(index is None): raise Exception('Field(%s) not found' % fieldName)
+        field = values[index].field
+
+        def getKey(record):
+            values = record.values
+            if((index < len(values)) and (values[index].field is field)): return(values[index].value)
+            return(record.getField(fieldName))
+        self.records.sort(key=getKey, reverse=(not ascending))
     
     def _computeLength(self):
         length = 3 # 1 byte for semantic + 2 bytes for templateId
+        if(self.rawRecords is not None): return(length + len(self.rawRecords))
         for record in self.records:
             length += record._computeLength()
         return(length)
@@ -106,10 +169,14 @@ class ADT_SubTemplateList(object):
 
     def write(self, rawData):
         self._writeHeader(rawData)
+        if(self.rawRecords is not None):
+            rawData.write(self.rawRecords)
+            return
         for record in self.records:
             record.write(rawData)
 
     def toJSON(self):
+        self._decodeRecords()
         return({
             'templateId': self.templateId,
             'template': self.template.toJSON(),
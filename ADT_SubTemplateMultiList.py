@@ -0,0 +1,190 @@
+# Reference: https://tools.ietf.org/html/rfc6313#section-4.5.3
+# subTemplateMultiList encoding:
+#  0                   1                   2                   3
+#  0 1 2 3 4 5 6 7 8 9 0 1 2 3 4 5 6 7 8 9 0 1 2 3 4 5 6 7 8 9 0 1
+# +-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+
+# |   Semantic    |         Template ID X         |Data Records...|
+# +-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+
+# | ... Length X  |      Data Record X.1 Content ...              |
+# +-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+
+# |                              ...                              |
+# +-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+
+# |         Template ID Y         |    Data Records Length Y      |
+# +-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+
+# |      Data Record Y.1 Content ...                              |
+# +-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+
+# |                              ...                              |
+# +-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+
+#
+# Data Records Length includes the 4 bytes of the Template ID and the Length fields.
+
+import json, struct
+from cStringIO import StringIO
+from Lib.ParameterChecking import checkType, checkInteger, checkAttr
+from TemplateRecord import TemplateRecord
+from DataRecord import DataRecord
+from ADT_Semantics import checkSemantics
+
+class ADT_SubTemplateMultiList(object):
+    # Records are kept in blocks of consecutive records of the same template. As subTemplateLists,
+    # lists read from the wire bind the templates of their blocks when read, and decode and
+    # validate their records then, or the first time they are accessed if not validated.
+    _strSemantic = struct.Struct('!B')
+    _strBlock = struct.Struct('!HH')
+
+    def __init__(self):
+        self.semantic = None
+        self.blocks = []        # [[template, records], ...]
+        self.rawBlocks = None   # [(template, rawRecords), ...] while not decoded
+        self.context = None
+
+    def __del__(self):
+        del self.semantic
+        del self.blocks
+        del self.rawBlocks
+        del self.context
+
+    @classmethod
+    def create(cls, semantic):
+        checkSemantics(semantic)
+        obj = cls()
+        obj.semantic = semantic
+        return(obj)
+
+    @classmethod
+    def read(cls, rawData, length, context):
+        if(length < ADT_SubTemplateMultiList._strSemantic.size):
+            raise Exception('Insufficient data to read semantic field of a SubTemplateMultiList')
+        obj = cls()
+        data = rawData.read(ADT_SubTemplateMultiList._strSemantic.size)
+        (obj.semantic,) = ADT_SubTemplateMultiList._strSemantic.unpack_from(data)
+        length -= ADT_SubTemplateMultiList._strSemantic.size
+        obj.rawBlocks = []
+        while(length > 0):
+            if(length < ADT_SubTemplateMultiList._strBlock.size):
+                raise Exception('Insufficient data to read a block of a SubTemplateMultiList')
+            data = rawData.read(ADT_SubTemplateMultiList._strBlock.size)
+            (templateId, blockLength) = ADT_SubTemplateMultiList._strBlock.unpack_from(data)
+            if((blockLength < ADT_SubTemplateMultiList._strBlock.size) or (blockLength > length)):
+                raise Exception('Invalid length(%d) of a block of a SubTemplateMultiList' % blockLength)
+            template = context.getCollectorTemplate(templateId)
+            obj.rawBlocks.append((template, rawData.read(blockLength - ADT_SubTemplateMultiList._strBlock.size)))
+            length -= blockLength
+        obj.context = context
+        if(context.shouldValidate()): obj._decodeRecords(True)
+        return(obj)
+
+    def isDecoded(self): return(self.rawBlocks is None)
+
+    def _decodeRecords(self, validate=False):
+        if(self.rawBlocks is None): return
+        context = self.context
+        blocks = []
+        for template,rawRecords in self.rawBlocks:
+            rawData = StringIO(rawRecords)
+            records = []
+            try:
+                while(rawData.tell() < len(rawRecords)):
+                    records.append(DataRecord.read(template, rawData, context, validate))
+            except Exception as e:
+                raise Exception('Invalid subTemplateMultiList block of Template(%d) in Domain(%d): %s' % (
+                                template.getId(), context.obsDomainId, str(e)))
+            blocks.append([template, records])
+        self.blocks = blocks
+        self.rawBlocks = None
+        self.context = None
+
+    @classmethod
+    def fromJSON(cls, data):
+        semantic = checkAttr('semantic', data)
+        obj = cls.create(semantic)
+        for block in checkAttr('blocks', data):
+            template = checkAttr('template', block)
+            template = TemplateRecord.newFromJSON(template['templateId'], template['fields'])
+            obj.blocks.append([template, map(lambda x: DataRecord.create(template, x['values']), block['records'])])
+        return(obj)
+
+    def getSemantic(self): return(self.semantic)
+
+    def addDataRecord(self, template, values, validate=True):
+        # consecutive records of the same template share a block
+        checkType('template', (TemplateRecord,), template)
+        checkType('values', (dict,), values)
+        self._decodeRecords()
+        record = DataRecord.create(template, values, validate)
+        if((len(self.blocks) == 0) or (self.blocks[-1][0] is not template)):
+            self.blocks.append([template, []])
+        self.blocks[-1][1].append(record)
+
+    def getNumBlocks(self):
+        if(self.rawBlocks is not None): return(len(self.rawBlocks))
+        return(len(self.blocks))
+
+    def getBlocks(self):
+        # [(template, records), ...]
+        self._decodeRecords()
+        return([(template, records) for template,records in self.blocks])
+
+    def getTemplateIds(self):
+        if(self.rawBlocks is not None): return([template.getId() for template,_ in self.rawBlocks])
+        return([template.getId() for template,_ in self.blocks])
+
+    def getNumRecords(self):
+        self._decodeRecords()
+        return(sum([len(records) for _,records in self.blocks]))
+
+    def getRecords(self):
+        self._decodeRecords()
+        records = []
+        for _,blockRecords in self.blocks: records.extend(blockRecords)
+        return(records)
+
+    def getRecord(self, index):
+        checkInteger('index', index)
+        records = self.getRecords()
+        maxIndex = len(records)-1
+        if(index < 0 or index > maxIndex):
+            raise Exception('Out of range index(%d) must be between 0 and length-1(%d)' % (
+                            index, maxIndex))
+        return(records[index])
+
+    def _computeLength(self):
+        length = ADT_SubTemplateMultiList._strSemantic.size
+        if(self.rawBlocks is not None):
+            for _,rawRecords in self.rawBlocks:
+                length += ADT_SubTemplateMultiList._strBlock.size + len(rawRecords)
+            return(length)
+        for _,records in self.blocks:
+            length += ADT_SubTemplateMultiList._strBlock.size
+            for record in records:
+                length += record._computeLength()
+        return(length)
+
+    def write(self, rawData):
+        rawData.write(ADT_SubTemplateMultiList._strSemantic.pack(self.semantic))
+        if(self.rawBlocks is not None):
+            for template,rawRecords in self.rawBlocks:
+                rawData.write(ADT_SubTemplateMultiList._strBlock.pack(
+                    template.getId(), ADT_SubTemplateMultiList._strBlock.size + len(rawRecords)))
+                rawData.write(rawRecords)
+            return
+        for template,records in self.blocks:
+            blockLength = ADT_SubTemplateMultiList._strBlock.size
+            for record in records: blockLength += record._computeLength()
+            rawData.write(ADT_SubTemplateMultiList._strBlock.pack(template.getId(), blockLength))
+            for record in records:
+                record.write(rawData)
+
+    def toJSON(self):
+        self._decodeRecords()
+        return({
+            'semantic': self.semantic,
+            'blocks': [{
+                'templateId': template.getId(),
+                'template': template.toJSON(),
+                'records': map(lambda s: s.toJSON(), records)
+            } for template,records in self.blocks]
+        })
+
+    def __str__(self):
+        return(json.dumps(self.toJSON()))
@@ -0,0 +1,58 @@
+# Compact sequences of fixed-length numbers (e.g., the elements of a basicList), decoded and
+# encoded in one sweep instead of one FieldValue per element. Decoded sequences are NumPy
+# arrays when NumPy is available, array.array otherwise; sequences being built are array.array.
+
+import array, sys
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# struct format character => (dtype, array.array typecodes of each size)
+_formats = {
+    'B': ('u1', 'B'), 'H': ('u2', 'H'), 'I': ('u4', 'IL'), 'Q': ('u8', 'L'),
+    'b': ('i1', 'b'), 'h': ('i2', 'h'), 'i': ('i4', 'il'), 'q': ('i8', 'l'),
+    'f': ('f4', 'f'), 'd': ('f8', 'd'),
+}
+_byteSwap = (sys.byteorder == 'little')
+
+class ArrayType(object):
+    # element type of a compact sequence; 'dtype' is big-endian, as in the wire
+    def __init__(self, typecode, itemSize, dtype):
+        self.typecode = typecode
+        self.itemSize = itemSize
+        self.dtype = dtype
+
+def getArrayType(struct_):
+    # returns the ArrayType for a struct of a single number, or None
+    format_ = struct_.format.lstrip('!>')
+    if(format_ not in _formats): return(None)
+    dtype, typecodes = _formats[format_]
+    for typecode in typecodes:
+        if(array.array(typecode).itemsize == struct_.size):
+            return(ArrayType(typecode, struct_.size, '>' + dtype))
+    return(None)
+
+def newArray(arrayType, values=()):
+    # mutable sequence, e.g., to append the values of a basicList being built
+    if(isinstance(values, (array.array,))): return(values)
+    if((numpy is not None) and isinstance(values, (numpy.ndarray,))): values = values.tolist()
+    return(array.array(arrayType.typecode, values))
+
+def decodeArray(arrayType, data):
+    if(numpy is not None): return(numpy.frombuffer(data, dtype=arrayType.dtype))
+    values = array.array(arrayType.typecode)
+    values.fromstring(data)
+    if(_byteSwap): values.byteswap()
+    return(values)
+
+def encodeArray(arrayType, values):
+    if((numpy is not None) and isinstance(values, (numpy.ndarray,))):
+        return(values.astype(arrayType.dtype).tostring())
+    values = array.array(arrayType.typecode, values)
+    if(_byteSwap): values.byteswap()
+    return(values.tostring())
+
+def toList(values):
+    # plain Python numbers, e.g., to serialize to JSON
+    return(values.tolist())
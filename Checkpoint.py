@@ -0,0 +1,119 @@
+import os, time, calendar, marshal
+from cStringIO import StringIO
+from Lib.ParameterChecking import checkString
+from TemplateRecord import TemplateRecord
+from OptionTemplateRecord import OptionTemplateRecord
+
+CHECKPOINT_VERSION = 1
+
+class Checkpoint(object):
+    # Compact snapshot of the template tables and sequence counters of the ObservationDomains of
+    # a Session, so a restarted collector can decode data without waiting for template refreshes.
+    # Templates are kept in wire format and serialized with marshal, so loading neither parses
+    # JSON nor re-validates the templates. Collector templates carry their refresh time, so the
+    # ones older than the template lifetime are dropped when loading.
+
+    @staticmethod
+    def _writeTemplate(template):
+        wfile = StringIO()
+        template.write(wfile)
+        return(wfile.getvalue())
+
+    @staticmethod
+    def _dumpSequentiation(sequentiation):
+        nextSequenceNumber, lastExportTimeUTC = sequentiation.get()
+        return((nextSequenceNumber, calendar.timegm(lastExportTimeUTC), sequentiation.synced))
+
+    @staticmethod
+    def _loadSequentiation(sequentiation, data):
+        nextSequenceNumber, lastExportTime, synced = data
+        sequentiation.restore(nextSequenceNumber, time.gmtime(lastExportTime), synced)
+
+    @staticmethod
+    def _dumpCollectorTemplates(store, now):
+        # read from the snapshot, so checkpoints neither count lookups nor refresh the LRU order
+        templates = []
+        for templateId,(template,refreshTime,pinned) in store.getSnapshot().iteritems():
+            if(not store.has(templateId, now)): continue
+            templates.append((Checkpoint._writeTemplate(template), refreshTime, pinned))
+        return(templates)
+
+    @staticmethod
+    def _dumpDomain(domain, transportKey, now):
+        return({
+            'obsDomainId': domain.obsDomainId,
+            'transportKey': transportKey,
+            'collectorSeq': Checkpoint._dumpSequentiation(domain.getCollectorSequentiation()),
+            'exporterSeq': Checkpoint._dumpSequentiation(domain.getExporterSequentiation()),
+            'collectorTemplates': Checkpoint._dumpCollectorTemplates(domain.collectorTemplates, now),
+            'collectorOptionTemplates': Checkpoint._dumpCollectorTemplates(domain.collectorOptionTemplates, now),
+            'exporterTemplates': [Checkpoint._writeTemplate(domain.getExporterTemplate(templateId))
+                                  for templateId in domain.getExporterTemplateIds()],
+            'exporterOptionTemplates': [Checkpoint._writeTemplate(domain.getExporterOptionTemplate(templateId))
+                                        for templateId in domain.getExporterOptionTemplateIds()]
+        })
+
+    @staticmethod
+    def save(session, filePath):
+        checkString('filePath', filePath)
+        now = time.time()
+        domains = []
+        for obsDomId in session.getDomainIds():
+            domains.append(Checkpoint._dumpDomain(session.getDomain(obsDomId), None, now))
+        if(session.transportSessions is not None):
+            # a snapshot of the table: looking sessions up would keep them active and never idle
+            for transportKey,domain in session.transportSessions.getItems():
+                domains.append(Checkpoint._dumpDomain(domain, transportKey, now))
+        data = marshal.dumps({'version': CHECKPOINT_VERSION, 'savedAt': now, 'domains': domains})
+
+        # written aside and renamed, so a crash never leaves a truncated checkpoint
+        tmpFilePath = filePath + '.tmp'
+        f = open(tmpFilePath, 'wb')
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+        f.close()
+        os.rename(tmpFilePath, filePath)
+
+    @staticmethod
+    def _loadCollectorTemplates(templates, templateClass, updateFunction, maxAge, now):
+        numTemplates = 0
+        for templateData,refreshTime,pinned in templates:
+            if((not pinned) and (maxAge is not None) and (now - refreshTime > maxAge)): continue
+            template = templateClass.read(StringIO(templateData))
+            updateFunction(template, pinned=pinned, refreshTime=refreshTime)
+            numTemplates += 1
+        return(numTemplates)
+
+    @staticmethod
+    def load(session, filePath, maxAge=None):
+        # returns the number of collector templates restored; templates older than maxAge are dropped
+        checkString('filePath', filePath)
+        if(not os.path.exists(filePath)): return(0)
+        f = open(filePath, 'rb')
+        data = marshal.loads(f.read())
+        f.close()
+        if(data.get('version') != CHECKPOINT_VERSION):
+            raise Exception('Unsupported checkpoint version(%s) in file(%s)' % (str(data.get('version')), filePath))
+
+        now = time.time()
+        numTemplates = 0
+        for domainData in data['domains']:
+            obsDomId = domainData['obsDomainId']
+            transportKey = domainData['transportKey']
+            if(transportKey is None):
+                domain = session.getDomain(obsDomId)
+            else:
+                domain = session.getTransportDomain(obsDomId, transportKey[0], transportKey[1])
+            Checkpoint._loadSequentiation(domain.getCollectorSequentiation(), domainData['collectorSeq'])
+            Checkpoint._loadSequentiation(domain.getExporterSequentiation(), domainData['exporterSeq'])
+            numTemplates += Checkpoint._loadCollectorTemplates(
+                domainData['collectorTemplates'], TemplateRecord, domain.updateCollectorTemplate, maxAge, now)
+            numTemplates += Checkpoint._loadCollectorTemplates(
+                domainData['collectorOptionTemplates'], OptionTemplateRecord, domain.updateCollectorOptionTemplate,
+                maxAge, now)
+            for templateData in domainData['exporterTemplates']:
+                domain.updateExporterTemplate(TemplateRecord.read(StringIO(templateData)))
+            for templateData in domainData['exporterOptionTemplates']:
+                domain.updateExporterOptionTemplate(OptionTemplateRecord.read(StringIO(templateData)))
+        return(numTemplates)
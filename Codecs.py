@@ -0,0 +1,244 @@
+# Codecs encode and decode the values of the fields, without the length prefix of
+# variable-length fields (handled by FieldValue). They are registered per IPFIX abstract data
+# type, and may be overridden per Information Element, e.g., to plug in a faster decoder of a
+# specific field. A codec is instantiated once per FieldSpecifier (see FieldSpecifier.getCodec),
+# so anything depending on the field only, e.g., its struct, is resolved when it is built:
+#   decode(rawData, length, context): reads 'length' bytes from rawData and returns the value; context
+#     is the DecodingContext of the record (see DecodingContext)
+#   encode(value, rawData): writes the value into rawData
+#   getLength(value): number of bytes of the encoded value (used for variable-length fields)
+#   arrayType: ArrayType of the values when they can be kept in compact sequences, or None
+
+import threading
+from Conversions import textToIPv4, textToIPv6, textToMac
+from Arrays import getArrayType
+
+class StructCodec(object):
+    # fixed-length numbers, booleans and NTP timestamps; single-element structs decode to a scalar
+    def __init__(self, field):
+        self.name = field.name
+        self.struct_ = field.struct_
+        if(self.struct_ is None):
+            raise Exception('Undefined struct for FieldSpecifier(%s)' % field.name)
+        self.scalar = (len(self.struct_.unpack('\0' * self.struct_.size)) == 1)
+        self.arrayType = getArrayType(self.struct_) if(self.scalar) else None
+
+    def decode(self, rawData, length, context):
+        value = self.struct_.unpack(rawData.read(length))
+        return(value[0] if(self.scalar) else value)
+
+    def encode(self, value, rawData):
+        if(isinstance(value, (tuple, list))):
+            rawData.write(self.struct_.pack(*value))
+        else:
+            rawData.write(self.struct_.pack(value))
+
+    def getLength(self, value): return(self.struct_.size)
+
+class DateTimeCodec(StructCodec):
+    # dateTimeSeconds and dateTimeMilliseconds decode to nanoseconds since the UNIX epoch
+    _scales = {'dateTimeSeconds': 1000000000, 'dateTimeMilliseconds': 1000000}
+
+    def __init__(self, field):
+        StructCodec.__init__(self, field)
+        self.scale = DateTimeCodec._scales[field.type]
+        self.arrayType = None
+
+    def decode(self, rawData, length, context):
+        return(self.struct_.unpack(rawData.read(length))[0] * self.scale)
+
+    def encode(self, value, rawData):
+        rawData.write(self.struct_.pack(int(value) // self.scale))
+
+class AddressCodec(object):
+    # Addresses decode to a single integer. They are encoded from an integer, from a tuple of
+    # its bytes (as they were decoded formerly) or from their text form (see Conversions).
+    size = None
+    arrayType = None
+
+    def __init__(self, field):
+        self.name = field.name
+        self.struct_ = field.struct_
+        if(self.struct_.size != self.size):
+            raise Exception('Invalid length(%s) for field(%s) of type(%s)' % (str(field.length), field.name, field.type))
+
+    def _toInteger(self, value):
+        if(isinstance(value, (int, long))): return(value)
+        if(isinstance(value, (tuple, list))):
+            if(len(value) != self.size):
+                raise Exception('Invalid number of bytes(%d) for field(%s)' % (len(value), self.name))
+            integer = 0
+            for byte in value: integer = (integer << 8) | byte
+            return(integer)
+        if(isinstance(value, (basestring,))): return(self.parse(value))
+        raise Exception('Invalid value type(%s) for field(%s). Should be one of %s' % (
+                        str(type(value)), self.name, str((int, long, tuple, list, basestring))))
+
+    def getLength(self, value): return(self.size)
+
+class IPv4AddressCodec(AddressCodec):
+    size = 4
+    parse = staticmethod(textToIPv4)
+
+    def __init__(self, field):
+        AddressCodec.__init__(self, field)
+        self.arrayType = getArrayType(self.struct_)
+
+    def decode(self, rawData, length, context):
+        return(self.struct_.unpack(rawData.read(length))[0])
+
+    def encode(self, value, rawData):
+        rawData.write(self.struct_.pack(self._toInteger(value)))
+
+class IPv6AddressCodec(AddressCodec):
+    size = 16
+    parse = staticmethod(textToIPv6)
+
+    def decode(self, rawData, length, context):
+        high, low = self.struct_.unpack(rawData.read(length))
+        return((high << 64) | low)
+
+    def encode(self, value, rawData):
+        value = self._toInteger(value)
+        rawData.write(self.struct_.pack(value >> 64, value & 0xFFFFFFFFFFFFFFFF))
+
+class MacAddressCodec(AddressCodec):
+    size = 6
+    parse = staticmethod(textToMac)
+
+    def decode(self, rawData, length, context):
+        high, low = self.struct_.unpack(rawData.read(length))
+        return((high << 32) | low)
+
+    def encode(self, value, rawData):
+        value = self._toInteger(value)
+        rawData.write(self.struct_.pack(value >> 32, value & 0xFFFFFFFF))
+
+class StringCodec(object):
+    # Values are byte strings, read and written as they are, without structs. Fixed-length
+    # strings are padded with spaces or truncated; leading and trailing whitespaces are removed
+    # when decoding.
+    arrayType = None
+
+    def __init__(self, field):
+        self.name = field.name
+        self.size = None if(field.variableLength) else field.struct_.size
+
+    def _checkType(self, value):
+        if(not isinstance(value, (str, basestring, unicode))):
+            raise Exception('Invalid value type(%s) for field(%s). Should be one of %s' % (
+                            str(type(value)), self.name, str((str, basestring, unicode))))
+
+    def decode(self, rawData, length, context):
+        return(rawData.read(length).strip())
+
+    def encode(self, value, rawData):
+        self._checkType(value)
+        value = str(value)
+        size = self.size
+        if(size is not None):
+            if(size > len(value)):
+                value = value + ' ' * (size - len(value))
+            elif(size < len(value)):
+                value = value[:size]
+        rawData.write(value)
+
+    def getLength(self, value): return(len(value))
+
+class OctetArrayCodec(StringCodec):
+    def decode(self, rawData, length, context):
+        return(rawData.read(length))
+
+    def encode(self, value, rawData):
+        self._checkType(value)
+        if((self.size is not None) and (len(value) != self.size)):
+            raise Exception('Invalid length(%d) for field(%s) of length(%d)' % (len(value), self.name, self.size))
+        rawData.write(value)
+
+class BasicListCodec(object):
+    arrayType = None
+
+    def __init__(self, field):
+        # imported here since ADT_BasicList depends on FieldValue
+        from ADT_BasicList import ADT_BasicList
+        self.name = field.name
+        self.adt = ADT_BasicList
+
+    def decode(self, rawData, length, context):
+        return(self.adt.read(rawData, length, context))
+
+    def encode(self, value, rawData):
+        if(not isinstance(value, (self.adt,))):
+            raise Exception('Invalid value type(%s) for field(%s). Should be one of %s' % (
+                            str(type(value)), self.name, str((self.adt,))))
+        value.write(rawData)
+
+    def getLength(self, value): return(value._computeLength())
+
+class SubTemplateListCodec(BasicListCodec):
+    def __init__(self, field):
+        from ADT_SubTemplateList import ADT_SubTemplateList
+        self.name = field.name
+        self.adt = ADT_SubTemplateList
+
+class SubTemplateMultiListCodec(BasicListCodec):
+    def __init__(self, field):
+        from ADT_SubTemplateMultiList import ADT_SubTemplateMultiList
+        self.name = field.name
+        self.adt = ADT_SubTemplateMultiList
+
+_lock = threading.Lock()
+_typeCodecs = {
+    'octetArray'            : OctetArrayCodec,
+    'unsigned8'             : StructCodec,
+    'unsigned16'            : StructCodec,
+    'unsigned32'            : StructCodec,
+    'unsigned64'            : StructCodec,
+    'signed8'               : StructCodec,
+    'signed16'              : StructCodec,
+    'signed32'              : StructCodec,
+    'signed64'              : StructCodec,
+    'float32'               : StructCodec,
+    'float64'               : StructCodec,
+    'boolean'               : StructCodec,
+    'macAddress'            : MacAddressCodec,
+    'string'                : StringCodec,
+    'dateTimeSeconds'       : DateTimeCodec,
+    'dateTimeMilliseconds'  : DateTimeCodec,
+    'dateTimeMicroseconds'  : StructCodec,
+    'dateTimeNanoseconds'   : StructCodec,
+    'ipv4Address'           : IPv4AddressCodec,
+    'ipv6Address'           : IPv6AddressCodec,
+    'basicList'             : BasicListCodec,
+    'subTemplateList'       : SubTemplateListCodec,
+    'subTemplateMultiList'  : SubTemplateMultiListCodec,
+}
+_fieldCodecs = {} # (enterpriseNumber, informationElementId) => codec class
+
+def _resetFieldCodecs():
+    # codecs already resolved by the (interned) FieldSpecifiers are resolved again on next use
+    from Interning import getInternedFieldSpecifiers
+    for field in getInternedFieldSpecifiers():
+        field.codec = None
+
+def registerCodec(ie_type, codecClass):
+    with _lock:
+        _typeCodecs[ie_type] = codecClass
+        _resetFieldCodecs()
+
+def registerFieldCodec(informationElementId, codecClass, enterpriseNumber=None):
+    # codecClass=None removes the override
+    with _lock:
+        key = (enterpriseNumber, informationElementId)
+        if(codecClass is None):
+            _fieldCodecs.pop(key, None)
+        else:
+            _fieldCodecs[key] = codecClass
+        _resetFieldCodecs()
+
+def newFieldCodec(field):
+    codecClass = _fieldCodecs.get((field.enterpriseNumber, field.informationElementId))
+    if(codecClass is None): codecClass = _typeCodecs.get(field.type)
+    if(codecClass is None):
+        raise Exception('No codec for type(%s). Used by field(%s)' % (str(field.type), field.name))
+    return(codecClass(field))
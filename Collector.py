@@ -1,7 +1,10 @@
-import threading, SocketServer, logging
+import threading, SocketServer, logging, time
 #from Lib.ObjectFormatting import flatten
-from Lib.ParameterChecking import checkType, checkAttr, checkIPv4, checkPort, checkOptions
+from Lib.ParameterChecking import checkType, checkAttr, checkIPv4, checkPort, checkOptions,\
+                                  checkInteger, checkFloat, checkString
 from Session import Session
+from Validation import ValidationPolicy
+from OptionTemplateRecord import OptionTemplateRecord
 
 class IPFIX_UDP_Handler(SocketServer.DatagramRequestHandler):
     IPFIX_SESSION = None
@@ -24,6 +27,11 @@ class Collector(object):
         self.__session = session
         self.__server = None
         self.__serverThread = None
+        self.__checkpointFile = None
+        self.__checkpointInterval = None
+        self.__expiryInterval = None
+        self.__maintenanceStopEvent = None
+        self.__maintenanceThread = None
     
     def isConfigured(self): return(self.__configured)
     def isRunning(self):    return(self.__running)
@@ -39,25 +47,157 @@ class Collector(object):
         checkOptions('transport', transport, ['udp', 'tcp'])
         if(transport != 'udp'): raise Exception('Transport(%s) not implemented' % str(transport))
 
+        if(('maxTransportSessions' in config) and (config['maxTransportSessions'] is not None)):
+            checkInteger('maxTransportSessions', config['maxTransportSessions'], 1)
+
+        if(('transportSessionIdleTimeout' in config) and (config['transportSessionIdleTimeout'] is not None)):
+            checkFloat('transportSessionIdleTimeout', config['transportSessionIdleTimeout'], 1)
+
+        if(('templateMemoryBudget' in config) and (config['templateMemoryBudget'] is not None)):
+            checkInteger('templateMemoryBudget', config['templateMemoryBudget'], 1)
+
+        if(('templateRefreshInterval' in config) and (config['templateRefreshInterval'] is not None)):
+            checkFloat('templateRefreshInterval', config['templateRefreshInterval'], 1, 86400)
+
+        if(('templateLifetimeIntervals' in config) and (config['templateLifetimeIntervals'] is not None)):
+            checkInteger('templateLifetimeIntervals', config['templateLifetimeIntervals'], 1)
+
+        if(('pendingSetsMaxBytes' in config) and (config['pendingSetsMaxBytes'] is not None)):
+            checkInteger('pendingSetsMaxBytes', config['pendingSetsMaxBytes'], 0)
+
+        if(('pendingSetsMaxAge' in config) and (config['pendingSetsMaxAge'] is not None)):
+            checkFloat('pendingSetsMaxAge', config['pendingSetsMaxAge'], 0)
+
+        if(('checkpointFile' in config) and (config['checkpointFile'] is not None)):
+            checkString('checkpointFile', config['checkpointFile'], allowEmpty=False)
+
+        if(('checkpointInterval' in config) and (config['checkpointInterval'] is not None)):
+            checkFloat('checkpointInterval', config['checkpointInterval'], 1)
+
+        if(('expiryInterval' in config) and (config['expiryInterval'] is not None)):
+            checkFloat('expiryInterval', config['expiryInterval'], 0.1)
+
+        if(('validation' in config) and (config['validation'] is not None)):
+            ValidationPolicy.checkConfiguration(config['validation'])
+
+        if(('pageReassemblyMaxPending' in config) and (config['pageReassemblyMaxPending'] is not None)):
+            checkInteger('pageReassemblyMaxPending', config['pageReassemblyMaxPending'], 0)
+
+        if(('pageReassemblyTimeout' in config) and (config['pageReassemblyTimeout'] is not None)):
+            checkFloat('pageReassemblyTimeout', config['pageReassemblyTimeout'], 0)
+
+        if(('pageReassemblyMaxBytes' in config) and (config['pageReassemblyMaxBytes'] is not None)):
+            checkInteger('pageReassemblyMaxBytes', config['pageReassemblyMaxBytes'], 1)
+
     def configure(self, config):
         Collector.checkConfiguration(config)
         self.__listenIP = config['listenIP']
         self.__listenPort = config['listenPort']
         self.__transport = config['transport']
+        
+        maxTransportSessions = config.get('maxTransportSessions')
+        if(maxTransportSessions is None): maxTransportSessions = 65536
+        transportSessionIdleTimeout = config.get('transportSessionIdleTimeout')
+        if(transportSessionIdleTimeout is None): transportSessionIdleTimeout = 1800
+        self.__session.configureTransportSessions(maxTransportSessions, transportSessionIdleTimeout)
+
+        # templates not refreshed within templateLifetimeIntervals refresh intervals expire
+        templateRefreshInterval = config.get('templateRefreshInterval')
+        if(templateRefreshInterval is None): templateRefreshInterval = 600
+        templateLifetimeIntervals = config.get('templateLifetimeIntervals')
+        if(templateLifetimeIntervals is None): templateLifetimeIntervals = 3
+        self.__session.configureTemplateStore(config.get('templateMemoryBudget'),
+                                              templateRefreshInterval * templateLifetimeIntervals)
+
+        # DataSets arriving before their templates are kept for one refresh interval (0 bytes disables it)
+        pendingSetsMaxBytes = config.get('pendingSetsMaxBytes')
+        if(pendingSetsMaxBytes is None): pendingSetsMaxBytes = 1048576
+        pendingSetsMaxAge = config.get('pendingSetsMaxAge')
+        if(pendingSetsMaxAge is None): pendingSetsMaxAge = templateRefreshInterval
+        self.__session.configurePendingSets(pendingSetsMaxBytes if(pendingSetsMaxBytes > 0) else None,
+                                            pendingSetsMaxAge)
+
+        # pages of paginated subTemplateLists are merged for up to 30 seconds, keeping up to 4 MiB
+        # of pages per domain (0 records disables it)
+        pageReassemblyMaxPending = config.get('pageReassemblyMaxPending')
+        if(pageReassemblyMaxPending is None): pageReassemblyMaxPending = 1024
+        pageReassemblyTimeout = config.get('pageReassemblyTimeout')
+        if(pageReassemblyTimeout is None): pageReassemblyTimeout = 30
+        pageReassemblyMaxBytes = config.get('pageReassemblyMaxBytes')
+        if(pageReassemblyMaxBytes is None): pageReassemblyMaxBytes = 4194304
+        self.__session.configurePageReassembly(pageReassemblyMaxPending if(pageReassemblyMaxPending > 0) else None,
+                                               pageReassemblyTimeout, pageReassemblyMaxBytes)
+
+        self.__checkpointFile = config.get('checkpointFile')
+        self.__checkpointInterval = config.get('checkpointInterval')
+        if(self.__checkpointInterval is None): self.__checkpointInterval = 60
+
+        # expired templates and idle transport sessions are released every expiryInterval seconds
+        self.__expiryInterval = config.get('expiryInterval')
+        if(self.__expiryInterval is None): self.__expiryInterval = 10
+
+        # records of untrusted exporters are fully validated unless configured otherwise
+        if(config.get('validation') is not None):
+            self.__session.setValidationPolicy(ValidationPolicy.newFromConfig(config['validation']))
         self.__configured = True
 
     def updateTemplate(self, template, domainId=None):
         if((len(self.__session.getDomainIds()) == 0) and (domainId is None)):
             raise Exception('Unable to update template in all domains since Session does not has any domain')
         
+        # the domains of the existing transport sessions get the template as well
+        domainIds = [domainId] if(domainId is not None) else self.__session.getDomainIds()
+        for obsDomId in domainIds:
+            domains = [self.__session.getDomain(obsDomId)] + self.__session.getTransportDomains(obsDomId)
+            for domain in domains:
+                if(isinstance(template, OptionTemplateRecord)):
+                    domain.updateCollectorOptionTemplate(template, pinned=True)
+                else:
+                    domain.updateCollectorTemplate(template, pinned=True)
+
+    def removeTemplate(self, templateId, domainId=None):
+        # removes a template configured with updateTemplate; the ones received from the exporters are kept
         domainIds = [domainId] if(domainId is not None) else self.__session.getDomainIds()
         for obsDomId in domainIds:
-            domain = self.__session.getDomain(obsDomId)
-            domain.updateCollectorTemplate(template)
+            domains = [self.__session.getDomain(obsDomId)] + self.__session.getTransportDomains(obsDomId)
+            for domain in domains:
+                domain.removeCollectorTemplate(templateId, pinnedOnly=True)
+                domain.removeCollectorOptionTemplate(templateId, pinnedOnly=True)
+
+    def _saveCheckpoint(self):
+        logger = logging.getLogger(__name__)
+        try:
+            self.__session.saveCheckpoint(self.__checkpointFile)
+        except Exception as e:
+            logger.exception(e)
+
+    def _runMaintenance(self):
+        # periodic expiry of the session and, if configured, checkpoints
+        logger = logging.getLogger(__name__)
+        interval = self.__expiryInterval
+        if(self.__checkpointFile is not None): interval = min(interval, self.__checkpointInterval)
+        lastCheckpoint = time.time()
+        while(not self.__maintenanceStopEvent.wait(interval)):
+            try:
+                self.__session.expire()
+            except Exception as e:
+                logger.exception(e)
+            if((self.__checkpointFile is not None) and (time.time() - lastCheckpoint >= self.__checkpointInterval)):
+                lastCheckpoint = time.time()
+                self._saveCheckpoint()
 
     def start(self):
         if(not self.__configured): return
         if(self.__running): return
+        logger = logging.getLogger(__name__)
+        if(self.__checkpointFile is not None):
+            # restored before the socket opens, so the first messages already find their templates
+            try:
+                numTemplates = self.__session.loadCheckpoint(self.__checkpointFile)
+                logger.info('Restored %d templates from checkpoint %s' % (numTemplates, self.__checkpointFile))
+            except Exception as e:
+                logger.exception(e)
+
         if(self.__transport == 'udp'):
             IPFIX_UDP_Handler.IPFIX_SESSION = self.__session
             SocketServer.UDPServer.max_packet_size = 128 * 1024
@@ -68,8 +208,12 @@ class Collector(object):
         self.__serverThread = threading.Thread(target=self.__server.serve_forever)
         self.__serverThread.setDaemon(True)
         self.__serverThread.start()
+
+        self.__maintenanceStopEvent = threading.Event()
+        self.__maintenanceThread = threading.Thread(target=self._runMaintenance)
+        self.__maintenanceThread.setDaemon(True)
+        self.__maintenanceThread.start()
         
-        logger = logging.getLogger(__name__)
         logger.info('Server listening on %s:%s:%d' % ((self.__transport,) + self.__server.server_address))
         self.__running = True
     
@@ -78,4 +222,10 @@ class Collector(object):
         self.__server.shutdown()
         self.__server.server_close()
         self.__serverThread.join()
+        if(self.__maintenanceThread is not None):
+            self.__maintenanceStopEvent.set()
+            self.__maintenanceThread.join()
+            self.__maintenanceThread = None
+        if(self.__checkpointFile is not None):
+            self._saveCheckpoint()
         self.__running = False
@@ -2,12 +2,15 @@
 # Reference: http://www.iana.org/assignments/enterprise-numbers/enterprise-numbers
 # Reference: http://openvswitch.org/support/dist-docs/ovs-vswitchd.conf.db.5.html
 
-import struct
+import struct, threading, collections
 
 IPFIX_VERSION = 0x000a
 
 VARIABLE_LENGTH = 65535
 
+# Ethernet MTU(1500) - IPv4 header(20) - UDP header(8)
+UDP_MAX_MESSAGE_SIZE = 1472
+
 class TypeBasicList(object):
     def __init__(self):
         self.format = 'BasicList'
@@ -18,6 +21,11 @@ class TypeSubTemplateList(object):
         self.format = 'SubTemplateList'
         self.size = VARIABLE_LENGTH
 
+class TypeSubTemplateMultiList(object):
+    def __init__(self):
+        self.format = 'SubTemplateMultiList'
+        self.size = VARIABLE_LENGTH
+
 type_to_struct = {
     'octetArray'          : {'symbolFormat':'B'}, # should be composed multiplying the format by the field length
     'unsigned8'           : struct.Struct('!B'),
@@ -31,17 +39,17 @@ type_to_struct = {
     'float32'             : struct.Struct('!f'),
     'float64'             : struct.Struct('!d'),
     'boolean'             : struct.Struct('!?'),
-    'macAddress'          : struct.Struct('!BBBBBB'),
+    'macAddress'          : struct.Struct('!HI'), # decoded to a single integer, see Codecs
     'string'              : {'symbolFormat':'c'}, # should be composed multiplying the format by the field length
-    'dateTimeSeconds'     : None, # To Be Defined
-    'dateTimeMilliseconds': None, # To Be Defined
-    'dateTimeMicroseconds': None, # To Be Defined
-    'dateTimeNanoseconds' : None, # To Be Defined
-    'ipv4Address'         : struct.Struct('!BBBB'),
-    'ipv6Address'         : struct.Struct('!BBBBBBBBBBBBBBBB'),
+    'dateTimeSeconds'     : struct.Struct('!I'),
+    'dateTimeMilliseconds': struct.Struct('!Q'),
+    'dateTimeMicroseconds': struct.Struct('!Q'), # NTP timestamp format
+    'dateTimeNanoseconds' : struct.Struct('!Q'), # NTP timestamp format
+    'ipv4Address'         : struct.Struct('!I'),
+    'ipv6Address'         : struct.Struct('!QQ'),
     'basicList'           : TypeBasicList(),
     'subTemplateList'     : TypeSubTemplateList(),
-    'subTemplateMultiList': None, # To Be Defined
+    'subTemplateMultiList': TypeSubTemplateMultiList(),
 }
 
 reduced_types = {
@@ -618,20 +626,34 @@ def getPENFieldById(ie_id, pen_):
         raise Exception('Private Enterprise Number(%d) does not contain Information Element(%d)' % (pen_, ie_id))
     return((ie_id, entFields[ie_id]))
 
+# Structs of the types sized by the field length (string, octetArray) are built once per
+# length; the least recently used ones are dropped beyond LENGTH_STRUCTS_CACHE_SIZE.
+LENGTH_STRUCTS_CACHE_SIZE = 256
+_lengthStructs = collections.OrderedDict()  # (ie_type, length) => struct.Struct
+_lengthStructsLock = threading.Lock()
+
+def _getLengthStruct(ie_type, symbolFormat, length):
+    key = (ie_type, length)
+    with _lengthStructsLock:
+        _str = _lengthStructs.pop(key, None)
+        if(_str is None):
+            _str = struct.Struct(symbolFormat * length)
+            if(len(_lengthStructs) >= LENGTH_STRUCTS_CACHE_SIZE): _lengthStructs.popitem(last=False)
+        _lengthStructs[key] = _str
+    return(_str)
+
 def getStructForType(ie_type, fieldName, length=None):
     if(not type_to_struct.has_key(ie_type)):
         raise Exception('Type(%s) does not exist. Used by field(%s)' % (ie_type, fieldName))
     _str = type_to_struct[ie_type]
     if(_str is None):
         raise Exception('Type(%s) is not defined. Used by field(%s)' % (ie_type, fieldName))
-    if(isinstance(_str, (struct.Struct, TypeBasicList, TypeSubTemplateList))):
+    if(isinstance(_str, (struct.Struct, TypeBasicList, TypeSubTemplateList, TypeSubTemplateMultiList))):
         return(_str)
     if(isinstance(_str, (dict,))):
         if(length is None):
             raise Exception('Non-static size entity(%s) requires a length' % (str(fieldName)))
-        symbolFormat = _str['symbolFormat']
-        _str = struct.Struct(symbolFormat * length)
-        return(_str)
+        return(_getLengthStruct(ie_type, _str['symbolFormat'], length))
         
     raise Exception('Wrong or incomplete definition for entity(%s): %s' % (str(fieldName), str(_str)))
 
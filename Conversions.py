@@ -0,0 +1,79 @@
+# Conversions between the compact representations of decoded values and their display forms.
+# Addresses decode to integers (ipv4Address, ipv6Address, macAddress), dateTimeSeconds and
+# dateTimeMilliseconds to nanoseconds since the UNIX epoch, and dateTimeMicroseconds and
+# dateTimeNanoseconds to the 64-bit NTP timestamp of the wire (RFC7011, section 6.1.9/10).
+# Display forms are cached, since the same addresses appear in many records.
+
+import socket, struct, time
+
+NTP_EPOCH_OFFSET = 2208988800   # seconds from 1900-01-01 (NTP era 0) to 1970-01-01
+DISPLAY_CACHE_SIZE = 65536      # entries per cache; a full cache is cleared
+
+_strIPv4 = struct.Struct('!I')
+_strIPv6 = struct.Struct('!QQ')
+_strMac = struct.Struct('!HI')
+
+def textToIPv4(text):
+    return(_strIPv4.unpack(socket.inet_aton(text))[0])
+
+def ipv4ToText(value):
+    return(socket.inet_ntoa(_strIPv4.pack(value)))
+
+def textToIPv6(text):
+    high, low = _strIPv6.unpack(socket.inet_pton(socket.AF_INET6, text))
+    return((high << 64) | low)
+
+def ipv6ToText(value):
+    return(socket.inet_ntop(socket.AF_INET6, _strIPv6.pack(value >> 64, value & 0xFFFFFFFFFFFFFFFF)))
+
+def textToMac(text):
+    octets = text.replace('-', ':').split(':')
+    if(len(octets) != 6): raise Exception('Invalid MAC address(%s)' % str(text))
+    value = 0
+    for octet in octets: value = (value << 8) | int(octet, 16)
+    return(value)
+
+def macToText(value):
+    return(':'.join(['%02x' % ((value >> shift) & 0xFF) for shift in (40, 32, 24, 16, 8, 0)]))
+
+def ntpToEpochNs(value):
+    seconds = (value >> 32) - NTP_EPOCH_OFFSET
+    return(seconds * 1000000000 + (((value & 0xFFFFFFFF) * 1000000000 + (1 << 31)) >> 32))
+
+def epochNsToNtp(value):
+    seconds, nanoseconds = divmod(value, 1000000000)
+    return(((seconds + NTP_EPOCH_OFFSET) << 32) | (((nanoseconds << 32) + 500000000) // 1000000000))
+
+def epochNsToText(value):
+    seconds, nanoseconds = divmod(value, 1000000000)
+    return('%s.%09dZ' % (time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(seconds)), nanoseconds))
+
+def ntpToText(value):
+    return(epochNsToText(ntpToEpochNs(value)))
+
+def _cached(function):
+    cache = {}
+    def convert(value):
+        text = cache.get(value)
+        if(text is None):
+            if(len(cache) >= DISPLAY_CACHE_SIZE): cache.clear()
+            text = function(value)
+            cache[value] = text
+        return(text)
+    return(convert)
+
+_displayForms = {
+    'ipv4Address'          : _cached(ipv4ToText),
+    'ipv6Address'          : _cached(ipv6ToText),
+    'macAddress'           : _cached(macToText),
+    'dateTimeSeconds'      : epochNsToText,
+    'dateTimeMilliseconds' : epochNsToText,
+    'dateTimeMicroseconds' : ntpToText,
+    'dateTimeNanoseconds'  : ntpToText,
+}
+
+def toDisplay(ie_type, value):
+    # display form of a decoded value of the given type; other types are returned as they are
+    convert = _displayForms.get(ie_type)
+    if((convert is None) or (value is None)): return(value)
+    return(convert(value))
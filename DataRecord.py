@@ -14,6 +14,7 @@ import json, copy
 from Lib.ParameterChecking import checkType
 from TemplateRecord import TemplateRecord
 from FieldValue import FieldValue
+from Conversions import toDisplay
 
 class DataRecord(object):
     def __init__(self):
@@ -26,7 +27,7 @@ class DataRecord(object):
         del self.values
     
     @classmethod
-    def create(cls, template, values):
+    def create(cls, template, values, validate=True):
         checkType('template', (TemplateRecord,), template)
         checkType('values', (dict,), values)
         
@@ -56,16 +57,24 @@ class DataRecord(object):
             obj.values[padIndex] = FieldValue.create(template.fields[i], '\0'*padLength, recordLength)
             if((recordLength[0] % 4) != 0): raise Exception('Error computing padding')
 
+        if(validate):
+            for fName,_,validator in template.layout.getValidators():
+                validator(values[fName])
         return(obj)
     
     @classmethod
-    def read(cls, template, rawData, domain):
+    def read(cls, template, rawData, context, validate=True):
+        # context: DecodingContext of the DataSet, resolving the templates of nested lists
         obj = cls()
         obj.templateId = template.getId()
         for field in template.fields:
-            value = FieldValue.read(field, rawData, domain)
+            value = FieldValue.read(field, rawData, context)
             if(field.name == 'paddingOctets'): continue
             obj.values.append(value)
+        if(validate):
+            values = obj.values
+            for _,index,validator in template.layout.getValidators():
+                validator(values[index].value)
         return(obj)
 
     def _computeLength(self):
@@ -82,11 +91,15 @@ class DataRecord(object):
                 return(copy.deepcopy(value.value))
         raise Exception('Field(%s) not found' % fieldName)
 
-    def getFieldsAsDict(self):
+    def getFieldsAsDict(self, display=False):
+        # display=True converts addresses and timestamps to their text forms
         fields = {}
         for value in self.values:
             name = copy.deepcopy(value.field.name)
-            fields[name] = copy.deepcopy(value.value)
+            if(display):
+                fields[name] = toDisplay(value.field.type, value.value)
+            else:
+                fields[name] = copy.deepcopy(value.value)
         return(fields)
 
     def write(self, rawData):
@@ -99,7 +112,7 @@ class DataRecord(object):
             'values': {}
         }
         for value in self.values:
-            if(value.field.type in ['basicList', 'subTemplateList']):
+            if(value.field.type in ['basicList', 'subTemplateList', 'subTemplateMultiList']):
                 d['values'][value.field.name] = value.toJSON()
             else:
                 #d['values'][value.field.name] = value.toJSON(standalone=False)
@@ -0,0 +1,27 @@
+class DecodingContext(object):
+    # What decoding the records of a DataSet needs from their ObservationDomain, fixed when the
+    # set is read: the collector templates of the domain at that time, to resolve the templates
+    # of nested lists, and whether the record is validated. Lists decoded lazily keep the context
+    # instead of the domain, so they decode as they would have when they were read, even if the
+    # templates expired or were withdrawn in the meantime.
+    # The ValidationPolicy decides once per top-level record: sets use a validating and a trusted
+    # context, and pick one of them per record, so its nested records and lists follow it.
+
+    def __init__(self, obsDomainId, templates, validate):
+        self.obsDomainId = obsDomainId
+        self.templates = templates # templateId => (template, refreshTime, pinned), see TemplateStore
+        self.validate = validate
+
+    @classmethod
+    def newPair(cls, domain):
+        # (validating, trusted) contexts sharing the snapshot of the templates of domain
+        templates = domain.getCollectorTemplatesSnapshot()
+        return(cls(domain.getId(), templates, True), cls(domain.getId(), templates, False))
+
+    def shouldValidate(self): return(self.validate)
+
+    def getCollectorTemplate(self, templateId):
+        entry = self.templates.get(templateId)
+        if(entry is None):
+            raise Exception('Domain(%d) does not contain Collector Template with Id(%d)' % (self.obsDomainId, templateId))
+        return(entry[0])
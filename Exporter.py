@@ -1,9 +1,17 @@
-import threading, socket, logging
+import socket, logging, collections
 from cStringIO import StringIO
 from Lib.ParameterChecking import checkType, checkAttr, checkIPv4, checkPort,\
-                                  checkOptions, checkFloat
+                                  checkOptions, checkFloat, checkInteger
+from Constants import UDP_MAX_MESSAGE_SIZE
 from Session import Session
 from Message import Message
+from Set import Set
+from TemplateRefreshScheduler import TemplateRefreshScheduler
+from Pacer import Pacer
+from Validation import ValidationPolicy
+from OptionTemplateRecord import OptionTemplateRecord
+from TemplateWithdrawal import TemplateWithdrawal
+from Pagination import paginate
 
 class Exporter(object):
     def __init__(self, session):
@@ -17,7 +25,11 @@ class Exporter(object):
         self.__serverPort = None
         self.__transport = None
         self.__templateRefreshTimeout = None
-        self.__timer = None
+        self.__maxMessageSize = None
+        self.__scheduler = None
+        self.__pacer = None         # built from the 'pacing' configuration
+        self.__sharedPacer = None   # set from outside, e.g., by an ExportersPool
+        self.__templatesCache = {}
     
     @staticmethod
     def checkConfiguration(config):
@@ -31,6 +43,15 @@ class Exporter(object):
         if(transport != 'udp'): raise Exception('Transport(%s) not implemented' % str(transport))
 
         checkFloat('templateRefreshTimeout', checkAttr('templateRefreshTimeout', config), 1, 86400)
+
+        if(('maxMessageSize' in config) and (config['maxMessageSize'] is not None)):
+            checkInteger('maxMessageSize', config['maxMessageSize'], 64, 65535)
+
+        if(('pacing' in config) and (config['pacing'] is not None)):
+            Pacer.checkConfiguration(config['pacing'])
+
+        if(('validation' in config) and (config['validation'] is not None)):
+            ValidationPolicy.checkConfiguration(config['validation'])
         
     def configure(self, config):
         Exporter.checkConfiguration(config)
@@ -39,6 +60,18 @@ class Exporter(object):
         self.__serverPort = config['serverPort']
         self.__transport = config['transport']
         self.__templateRefreshTimeout = config['templateRefreshTimeout']
+        self.__maxMessageSize = config.get('maxMessageSize')
+        if(self.__maxMessageSize is None): self.__maxMessageSize = UDP_MAX_MESSAGE_SIZE
+        self.__templatesCache = {}
+        if(self.__pacer is not None): self.__pacer.stop()
+        self.__pacer = None
+        if(config.get('pacing') is not None):
+            pacer = Pacer()
+            pacer.configure(config['pacing'])
+            self.__pacer = pacer
+            if(self.__running): pacer.start()
+        if(config.get('validation') is not None):
+            self.__session.setValidationPolicy(ValidationPolicy.newFromConfig(config['validation']))
         self.__configured = True
     
     def reconfigure(self, serverIP, serverPort):
@@ -64,40 +97,146 @@ class Exporter(object):
         domainIds = [domainId] if(domainId is not None) else self.__session.getDomainIds()
         for obsDomId in domainIds:
             domain = self.__session.getDomain(obsDomId)
-            domain.updateExporterTemplate(template)
+            if(isinstance(template, OptionTemplateRecord)):
+                domain.updateExporterOptionTemplate(template)
+            else:
+                domain.updateExporterTemplate(template)
+            if(self.__running): self.refreshTemplates(obsDomId, template.templateId)
+
+    def withdrawTemplates(self, templateIds, domainId=None):
+        # Removes (Option)Templates from the domains. Template Withdrawals are only sent over
+        # reliable transports (RFC7011, section 8.1); over UDP, collectors let them expire.
+        domainIds = [domainId] if(domainId is not None) else self.__session.getDomainIds()
+        for obsDomId in domainIds:
+            domain = self.__session.getDomain(obsDomId)
+            withdrawn = {2: [], 3: []}
+            for templateId in templateIds:
+                if(domain.hasExporterTemplate(templateId)):
+                    domain.removeExporterTemplate(templateId)
+                    withdrawn[2].append(templateId)
+                elif(domain.hasExporterOptionTemplate(templateId)):
+                    domain.removeExporterOptionTemplate(templateId)
+                    withdrawn[3].append(templateId)
+            if(not self.__running): continue
+            if(self.__transport == 'udp'):
+                # RFC7011, section 8.4: the templates are no longer refreshed and collectors let them expire
+                if(len(withdrawn[2]) + len(withdrawn[3]) > 0):
+                    logger = logging.getLogger(__name__)
+                    logger.info('Templates(%s) of domain(%d) removed; no Template Withdrawal sent over UDP' % (
+                                str(withdrawn[2] + withdrawn[3]), obsDomId))
+                continue
+            for setId in (2, 3):
+                recordsData = []
+                for templateId in withdrawn[setId]:
+                    wfile = StringIO()
+                    TemplateWithdrawal.create(templateId).write(wfile)
+                    recordsData.append(wfile.getvalue())
+                for setData in self._packTemplateSets(recordsData, setId):
+                    self.sendRawMessage(obsDomId, setData)
+
+    def setPacer(self, pacer):
+        # Pacers set from outside (e.g., shared by an ExportersPool) are started/stopped by their
+        # owner. Messages go through the pacer of the exporter first, then through this one.
+        if(pacer is not None): checkType('pacer', (Pacer,), pacer)
+        if((self.__sharedPacer is not None) and (self.__sharedPacer is not pacer)):
+            self.__sharedPacer.discard(self._transmit)
+        self.__sharedPacer = pacer
+
+    def getPacer(self): return(self.__pacer)
+    def getSharedPacer(self): return(self.__sharedPacer)
 
     def isConfigured(self): return(self.__configured)
     def isRunning(self): return(self.__running)
     def getSession(self): return(self.__session)
     
-    def refreshTemplates(self, domainId=None, templateId=None):
+    def getMaxMessageSize(self): return(self.__maxMessageSize)
+    
+    def refreshTemplates(self, domainId=None, templateId=None, templateIds=None):
         obsDomIds = self.__session.getDomainIds()
         if(domainId is not None):
             if(domainId not in obsDomIds): return
             obsDomIds = [domainId]
+        if(templateId is not None):
+            templateIds = [templateId]
         
         for obsDomId in obsDomIds:
-            domain = self.__session.getDomain(obsDomId)
-            templateIds = domain.getExporterTemplateIds()
-            if(templateId is not None):
-                if(templateId not in templateIds): continue
-                templateIds = [templateId]
-            if(len(templateIds) == 0): continue
-            message = Message.create(self.__session, obsDomId)
-            templateSet = message.addTemplateSet()
-            for templateId in templateIds:
-                template = domain.getExporterTemplate(templateId)
-                templateSet.addRecord(template)
-            self.sendMessage(message)
+            # templates are encoded from a snapshot, so concurrent updates can not tear the refresh
+            snapshot = self.__session.getDomain(obsDomId).getExporterTemplatesSnapshot()
+            if(templateIds is not None):
+                _, templates, _, optionTemplates = snapshot
+                setsData = self._packTemplateSets(
+                    [self._getTemplateRecordData(obsDomId, snapshot, templateId_)
+                     for templateId_ in templateIds if templateId_ in templates])
+                setsData.extend(self._packTemplateSets(
+                    [self._getTemplateRecordData(obsDomId, snapshot, templateId_)
+                     for templateId_ in templateIds if templateId_ in optionTemplates], setId=3))
+            else:
+                setsData = self._getTemplateSetsData(obsDomId, snapshot)
+            for setData in setsData:
+                self.sendRawMessage(obsDomId, setData)
 
-    def _refreshTemplates(self):
-        self.refreshTemplates()
-        self._startRefreshTemplateTimer()
+    def _getTemplatesCache(self, obsDomId):
+        # entries are replaced by single assignments, readers never see a revision with the data of another
+        cache = self.__templatesCache.get(obsDomId)
+        if(cache is None):
+            cache = self.__templatesCache.setdefault(obsDomId, {'sets': (None, []), 'records': {}})
+        return(cache)
+
+    def _getTemplateRecordData(self, obsDomId, snapshot, templateId):
+        # encoded (Option)TemplateRecords are cached until the domain reports a new revision for them
+        _, templates, templateRevisions, optionTemplates = snapshot
+        cache = self._getTemplatesCache(obsDomId)
+        revision = templateRevisions.get(templateId)
+        cached = cache['records'].get(templateId)
+        if((cached is not None) and (cached[0] == revision)): return(cached[1])
+        wfile = StringIO()
+        template = templates.get(templateId)
+        if(template is None): template = optionTemplates[templateId]
+        template.write(wfile)
+        recordData = wfile.getvalue()
+        cache['records'][templateId] = (revision, recordData)
+        return(recordData)
 
-    def _startRefreshTemplateTimer(self):
-        self.__timer = threading.Timer(self.__templateRefreshTimeout, self._refreshTemplates)
-        self.__timer.setDaemon(True)
-        self.__timer.start()
+    def _getTemplateSetsData(self, obsDomId, snapshot):
+        revision, templates, _, optionTemplates = snapshot
+        cache = self._getTemplatesCache(obsDomId)
+        cachedRevision, cachedSetsData = cache['sets']
+        if(cachedRevision == revision): return(cachedSetsData)
+        templateIds = sorted(templates.keys())
+        optionTemplateIds = sorted(optionTemplates.keys())
+        cache['records'] = dict([(templateId, cache['records'][templateId])
+                                 for templateId in templateIds + optionTemplateIds if templateId in cache['records']])
+        setsData = self._packTemplateSets(
+            [self._getTemplateRecordData(obsDomId, snapshot, templateId) for templateId in templateIds])
+        setsData.extend(self._packTemplateSets(
+            [self._getTemplateRecordData(obsDomId, snapshot, templateId) for templateId in optionTemplateIds], setId=3))
+        cache['sets'] = (revision, setsData)
+        return(setsData)
+
+    def _packTemplateSets(self, recordsData, setId=2):
+        # Groups the encoded (Option)TemplateRecords in (Option)TemplateSets fitting in maxMessageSize
+        maxSetLength = self.__maxMessageSize - Message._str.size
+        setsData = []
+        chunk = []
+        chunkLength = Set._str.size
+        for recordData in recordsData:
+            if((len(chunk) > 0) and (chunkLength + len(recordData) > maxSetLength)):
+                setsData.append(self._writeTemplateSet(chunk, setId))
+                chunk = []
+                chunkLength = Set._str.size
+            if(Set._str.size + len(recordData) > maxSetLength):
+                logger = logging.getLogger(__name__)
+                logger.warning('TemplateRecord of %d bytes exceeds maxMessageSize(%d)' % (len(recordData), self.__maxMessageSize))
+            chunk.append(recordData)
+            chunkLength += len(recordData)
+        if(len(chunk) > 0):
+            setsData.append(self._writeTemplateSet(chunk, setId))
+        return(setsData)
+
+    def _writeTemplateSet(self, recordsData, setId=2):
+        wfile = StringIO()
+        Set.writeRaw(setId, ''.join(recordsData), wfile)
+        return(wfile.getvalue())
 
     def start(self):
         if(not self.__configured): return
@@ -112,7 +251,10 @@ class Exporter(object):
         logger = logging.getLogger(__name__)
         logger.info('Client sending to %s:%s:%d' % (self.__transport, self.__serverIP, self.__serverPort))
         
-        self._refreshTemplates()
+        if(self.__pacer is not None): self.__pacer.start()
+        self.refreshTemplates()
+        self.__scheduler = TemplateRefreshScheduler(self.__session, self.refreshTemplates, self.__templateRefreshTimeout)
+        self.__scheduler.start()
         self.__running = True
     
     def stop(self):
@@ -123,21 +265,89 @@ class Exporter(object):
             self.__client.shutdown(socket.SHUT_RDWR)
         else:
             pass
+        self.__scheduler.stop()
+        if(self.__pacer is not None): self.__pacer.stop()
+        if(self.__sharedPacer is not None):
+            # messages queued in a shared pacer must not be sent once the socket is closed
+            self.__sharedPacer.discard(self._transmit)
         self.__client.close()
-        self.__timer.cancel()
+        self.__client = None
         self.__running = False
     
     def sendMessage(self, message):
+        wfile = StringIO()
+        self.__session.writeMessage(message, wfile)
+        self._sendData(wfile.getvalue())
+
+    def _getMaxRecordLength(self):
+        return(self.__maxMessageSize - Message._str.size - 3 - Set._str.size) # room for set padding
+
+    def exportPaginatedRecord(self, obsDomId, templateId, values):
+        # Sends the values of a record of a paginated template (see Pagination), splitting its
+        # subTemplateList in as many pages as needed to fit in maxMessageSize
+        domain = self.__session.getDomain(obsDomId)
+        template = domain.getExporterTemplate(templateId)
+        self.exportDataRecords(obsDomId, templateId,
+                               paginate(template, values, self._getMaxRecordLength(), domain.shouldValidate()))
+
+    def _paginateRecord(self, obsDomId, templateId, record):
+        template = self.__session.getDomain(obsDomId).getExporterTemplate(templateId)
+        if(template.layout.getPagination() is None): return([record])
+        values = dict([(value.field.name, value.value) for value in record.values if value.field.name != 'paddingOctets'])
+        return(paginate(template, values, self._getMaxRecordLength(), validate=False))
+
+    def exportDataRecords(self, obsDomId, templateId, records):
+        # Sends the DataRecords of a template in as many messages as needed to fit in maxMessageSize;
+        # records too large for a message are paginated when their template allows it
+        if(not self.__running): raise Exception('Exporter is not running')
+        maxSetLength = self.__maxMessageSize - Message._str.size - 3 # room for set padding
+        message = None
+        dataSet = None
+        setLength = 0
+        pendingRecords = collections.deque(records)
+        while(len(pendingRecords) > 0):
+            record = pendingRecords.popleft()
+            recordLength = record._computeLength()
+            if(recordLength > self._getMaxRecordLength()):
+                pages = self._paginateRecord(obsDomId, templateId, record)
+                if(len(pages) > 1):
+                    pendingRecords.extendleft(reversed(pages))
+                    continue
+            if((message is not None) and (setLength + recordLength > maxSetLength)):
+                self.sendMessage(message)
+                message = None
+            if(message is None):
+                message = Message.create(self.__session, obsDomId)
+                dataSet = message.addDataSet(templateId)
+                setLength = Set._str.size
+            dataSet.addRecord(record)
+            setLength += recordLength
+        if(message is not None):
+            self.sendMessage(message)
+
+    def sendRawMessage(self, obsDomId, setsData, numDataRecords=0):
+        wfile = StringIO()
+        Message.writeRaw(self.__session, obsDomId, setsData, wfile, numDataRecords=numDataRecords)
+        self._sendData(wfile.getvalue())
+
+    def _sendData(self, data):
+        # templates are sent by start() before the exporter is flagged as running
+        if(self.__client is None): raise Exception('Exporter is not running')
+        if(self.__pacer is not None):
+            self.__pacer.send(self._sendShared, data)
+        else:
+            self._sendShared(data)
+
+    def _sendShared(self, data):
+        if(self.__sharedPacer is not None):
+            self.__sharedPacer.send(self._transmit, data)
+        else:
+            self._transmit(data)
+
+    def _transmit(self, data):
         if(self.__transport == 'udp'):
-            wfile = StringIO()
-            self.__session.writeMessage(message, wfile)
-            self.__client.sendto(wfile.getvalue(), (self.__serverIP, self.__serverPort))
+            self.__client.sendto(data, (self.__serverIP, self.__serverPort))
         elif(self.__transport == 'tcp'):
-            wfile = self.__client.makefile('wb', 0)
-            self.__session.writeMessage(message, wfile)
-            if not wfile.closed:
-                try: wfile.flush()
-                except socket.error: pass
-            wfile.close()
+            self.__client.sendall(data)
         else:
             raise Exception('Unsupported transport: %s' % self.__transport)
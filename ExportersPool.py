@@ -3,11 +3,13 @@ from Lib.ParameterChecking import checkType, checkIPv4, checkPort, checkOptions,
     checkInteger, checkFloat
 from Session import Session
 from Exporter import Exporter
+from Pacer import Pacer
 
 class ExportersPool(object):
     def __init__(self):
         self.__configTemplate = None
         self.__exporters = {}
+        self.__pacer = None
         self.__configured = False
         self.__running = False
     
@@ -34,31 +36,51 @@ class ExportersPool(object):
         if(('templateRefreshTimeout' in config) and (config['templateRefreshTimeout'] is not None)):
             checkFloat('templateRefreshTimeout', config['templateRefreshTimeout'], 1, 86400)
 
+        if(('maxMessageSize' in config) and (config['maxMessageSize'] is not None)):
+            checkInteger('maxMessageSize', config['maxMessageSize'], 64, 65535)
+
+        # pacing applies to each exporter; poolPacing to the aggregated output of all of them
+        if(('pacing' in config) and (config['pacing'] is not None)):
+            Pacer.checkConfiguration(config['pacing'])
+
+        if(('poolPacing' in config) and (config['poolPacing'] is not None)):
+            Pacer.checkConfiguration(config['poolPacing'])
+
     def configure(self, config):
         if(self.__configured): return
         ExportersPool.checkConfiguration(config)
-        self.__configTemplate = config
+        self.__configTemplate = dict(config)
+        poolPacing = self.__configTemplate.pop('poolPacing', None)
+        if(poolPacing is not None):
+            self.__pacer = Pacer()
+            self.__pacer.configure(poolPacing)
         self.__configured = True
 
     def start(self):
         if(not self.__configured): return
         if(self.__running): return
+        if(self.__pacer is not None): self.__pacer.start()
         self.__running = True
 
     def stop(self):
         if(not self.__running): return
         for exporterId in self.__exporters.keys():
             self.remove(exporterId)
+        if(self.__pacer is not None): self.__pacer.stop()
         self.__running = False
+
+    def getPacer(self): return(self.__pacer)
     
     def has(self, exporterId):
         checkInteger('exporterId', exporterId, 0)
         return(exporterId in self.__exporters)
 
     def add(self, exporterId, serverIP, serverPort):
+        # exporters start sending their templates right away, so the pool pacer must be running
         checkInteger('exporterId', exporterId, 0)
         checkIPv4('serverIP', serverIP)
         checkPort('serverPort', serverPort)
+        if(not self.__running): raise Exception('ExportersPool is not running')
         if(exporterId in self.__exporters): raise Exception('Exporter(%d) already exists' % (exporterId))
         exporterConfig = copy.deepcopy(self.__configTemplate)
         exporterConfig.update({'serverIP': serverIP, 'serverPort':serverPort})
@@ -66,6 +88,7 @@ class ExportersPool(object):
         session = Session()
         exporter = Exporter(session)
         exporter.configure(exporterConfig)
+        if(self.__pacer is not None): exporter.setPacer(self.__pacer)
         exporter.start()
         self.__exporters[exporterId] = exporter
 
@@ -84,8 +107,7 @@ class ExportersPool(object):
         if(exporter is None): raise Exception('Exporter(%d) does not exist' % (exporterId))
         session = exporter.getSession()
         if(not session.hasDomain(obsDomainId)): raise Exception('Exporter(%d) does not has domain(%d)' % (exporterId, obsDomainId))
-        domain = session.getDomain(obsDomainId)
-        domain.updateExporterTemplate(template)
+        exporter.updateTemplate(template, obsDomainId)
 
     def get(self, exporterId):
         checkInteger('exporterId', exporterId, 0)
@@ -96,4 +118,6 @@ class ExportersPool(object):
     def remove(self, exporterId):
         checkInteger('exporterId', exporterId, 0)
         if(exporterId not in self.__exporters): raise Exception('Exporter(%d) does not exist' % (exporterId))
-        del self.__exporters[exporterId]
+        exporter = self.__exporters.pop(exporterId)
+        exporter.stop()
+        exporter.setPacer(None)
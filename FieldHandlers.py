@@ -35,36 +35,48 @@ __FIELD_PARSERS = {
     'stlPaginationTotal':           lambda v: int(v),
 }
 
+# Numeric fields whose translator is the identity: (checker, minValue, maxValue). Their bounds are
+# only defined here: their FIELD_CHECKERS are built from them, and their columns are parsed with a
+# single map() and range-checked with min()/max() instead of value by value.
+__NUMERIC_FIELDS = {
+    'timeStamp':                    (checkInteger, 0, None),
+    'observationDomainId':          (checkInteger, 0, 4294967295),
+    'observationPointId':           (checkInteger, 0, None),
+    'ethernetHeaderLength':         (checkInteger, 0, 0xFF),
+    'flowStartDeltaMicroseconds':   (checkInteger, 0, None),
+    'flowEndDeltaMicroseconds':     (checkInteger, 0, None),
+    'flowEndReason':                (checkInteger, 0, 5),
+    'packetDeltaCount':             (checkInteger, 0, None),
+    'layer2OctetDeltaCount':        (checkInteger, 0, None),
+    'bitCount':                     (checkInteger, 0, None),
+    'ber':                          (checkFloat, 0, None),
+    'rxPowerMilliwatts':            (checkFloat, 0, None),
+    'txPowerMilliwatts':            (checkFloat, 0, None),
+    'rxPowerDecibelMilliwatts':     (checkFloat, None, None),
+    'txPowerDecibelMilliwatts':     (checkFloat, None, None),
+    'frequencyGigaHertz':           (checkFloat, 0, None),
+    'stlPaginationIndex':           (checkInteger, 0, None),
+    'stlPaginationTotal':           (checkInteger, 0, None),
+}
+
 __FIELD_CHECKERS = {
-    'timeStamp':                    lambda v: checkInteger('timeStamp', v, 0),
     'name':                         lambda v: checkString('name', v),
     'containerName':                lambda v: checkString('containerName', v),
-    'observationDomainId':          lambda v: checkInteger('observationDomainId', v, 0, 4294967295),
-    'observationPointId':           lambda v: checkInteger('observationPointId', v, 0),
     'flowDirection':                lambda v: checkOptions('flowDirection', v, ['ingress', 'egress']),
     'sourceMacAddress':             lambda v: checkMACAddr('sourceMacAddress', v),
     'destinationMacAddress':        lambda v: checkMACAddr('destinationMacAddress', v),
     'ethernetType':                 lambda v: checkOptions('ethernetType', v, ['ARP', 'IPv4', 'IPv6', 'MPLS']),
-    'ethernetHeaderLength':         lambda v: checkInteger('ethernetHeaderLength', v, 0, 0xFF),
-    'flowStartDeltaMicroseconds':   lambda v: checkInteger('flowStartDeltaMicroseconds', v, 0),
-    'flowEndDeltaMicroseconds':     lambda v: checkInteger('flowEndDeltaMicroseconds', v, 0),
-    'flowEndReason':                lambda v: checkInteger('flowEndReason', v, 0, 5),
-    'packetDeltaCount':             lambda v: checkInteger('packetDeltaCount', v, 0),
-    'layer2OctetDeltaCount':        lambda v: checkInteger('layer2OctetDeltaCount', v, 0),
-    'bitCount':                     lambda v: checkInteger('bitCount', v, 0),
     'tunnelSourceIPv4Address':      lambda v: checkIPv4('tunnelSourceIPv4Address', v),
     'tunnelDestinationIPv4Address': lambda v: checkIPv4('tunnelDestinationIPv4Address', v),
     'direction':                    lambda v: checkOptions('direction', v, ['ingress', 'egress', 'bidirectional']),
-    'ber':                          lambda v: checkFloat('ber', v, 0),
-    'rxPowerMilliwatts':            lambda v: checkFloat('rxPowerMilliwatts', v, 0),
-    'txPowerMilliwatts':            lambda v: checkFloat('txPowerMilliwatts', v, 0),
-    'rxPowerDecibelMilliwatts':     lambda v: checkFloat('rxPowerDecibelMilliwatts', v),
-    'txPowerDecibelMilliwatts':     lambda v: checkFloat('txPowerDecibelMilliwatts', v),
-    'frequencyGigaHertz':           lambda v: checkFloat('frequencyGigaHertz', v, 0),
-    'stlPaginationIndex':           lambda v: checkInteger('stlPaginationIndex', v, 0),
-    'stlPaginationTotal':           lambda v: checkInteger('stlPaginationTotal', v, 0),
 }
 
+def _compileNumericChecker(name, checker, minValue, maxValue):
+    return(lambda v: checker(name, v, minValue, maxValue))
+
+__FIELD_CHECKERS.update(dict([(name, _compileNumericChecker(name, *bounds))
+                              for name,bounds in __NUMERIC_FIELDS.iteritems()]))
+
 __FIELD_TRANSLATORS = {
     'timeStamp':                    lambda v: v,
     'name':                         lambda v: v,
@@ -95,48 +107,76 @@ __FIELD_TRANSLATORS = {
     'stlPaginationTotal':           lambda v: v,
 }
 
-def processField(name, value, templatesCatalog=None):
-    if(name.startswith('subTemplateList')):
-        if(templatesCatalog is None):
-            raise Exception('A TemplatesCatalog instance is required to process subTemplateList fields')
-
-        nameParts = name.split('_')
-        if(len(nameParts) != 3):
-            raise Exception('subTemplateList fieldName in dataFile must have format: subTemplateList_<subTemplateId>_<semantics>')
-        name_ = str(nameParts[0])
-        subTemplateId = int(nameParts[1])
-        chkTemplateId(subTemplateId)
-
-        subTemplate = templatesCatalog.getTemplate(subTemplateId)
-        subTemplateSemantics = parseSemantics(str(nameParts[2]))
+def _compileSubTemplateList(name, templatesCatalog):
+    if(templatesCatalog is None):
+        raise Exception('A TemplatesCatalog instance is required to process subTemplateList fields')
+
+    nameParts = name.split('_')
+    if(len(nameParts) != 3):
+        raise Exception('subTemplateList fieldName in dataFile must have format: subTemplateList_<subTemplateId>_<semantics>')
+    name_ = str(nameParts[0])
+    subTemplateId = int(nameParts[1])
+    chkTemplateId(subTemplateId)
+
+    subTemplate = templatesCatalog.getTemplate(subTemplateId)
+    subTemplateSemantics = parseSemantics(str(nameParts[2]))
+    numFields = subTemplate.getNumFields()
+    fieldProcessors = [compileFieldProcessor(subTemplate.getField(numField).getName(), templatesCatalog)
+                       for numField in xrange(numFields)]
+
+    def processor(value):
         subTemplateList = ADT_SubTemplateList.create(subTemplateSemantics, subTemplate)
-        numFields = subTemplate.getNumFields()
-        
         checkString('processor_SubTemplateList.value', value)
         for vEntry in value.split(';'):
             vEntryItems = vEntry.split('|')
             if(len(vEntryItems) != numFields):
                 raise Exception('SubTemplate %d requires %d fields' % (subTemplateId, numFields))
-        
-            dataRecord = {}
-            for numField in xrange(numFields):
-                nameField = subTemplate.getField(numField).getName()
-                nameField_,vEntryItem = processField(nameField, vEntryItems[numField], templatesCatalog)
-                dataRecord[nameField_] = vEntryItem
-
-            subTemplateList.addDataRecord(dataRecord)
+            subTemplateList.addDataRecord(dict([fieldProcessor(vEntryItem)
+                                                for fieldProcessor,vEntryItem in zip(fieldProcessors, vEntryItems)]))
         return(name_,subTemplateList)
-    else:
-        parser = __FIELD_PARSERS.get(name)
-        if(parser is None): raise Exception('FieldParser for %s not defined' % name)
+    return(processor)
+
+def compileFieldProcessor(name, templatesCatalog=None):
+    # Returns processor(value) => (name, value), with the parser, checker and translator of the
+    # field (or the subTemplate of a subTemplateList) resolved once. SubTemplateList processors
+    # keep the subTemplate they were compiled with; compile them again if the catalog changes.
+    if(name.startswith('subTemplateList')):
+        return(_compileSubTemplateList(name, templatesCatalog))
+
+    parser = __FIELD_PARSERS.get(name)
+    if(parser is None): raise Exception('FieldParser for %s not defined' % name)
 
-        checker = __FIELD_CHECKERS.get(name)
-        if(checker is None): raise Exception('FieldChecker for %s not defined' % name)
+    checker = __FIELD_CHECKERS.get(name)
+    if(checker is None): raise Exception('FieldChecker for %s not defined' % name)
 
-        translator = __FIELD_TRANSLATORS.get(name)
-        if(translator is None): raise Exception('FieldChecker for %s not defined' % name)
+    translator = __FIELD_TRANSLATORS.get(name)
+    if(translator is None): raise Exception('FieldChecker for %s not defined' % name)
 
+    def processor(value):
         value = parser(value)
         checker(value)
-        value = translator(value)
-        return(name, value)
+        return(name, translator(value))
+    return(processor)
+
+def compileColumnProcessor(name, templatesCatalog=None):
+    # Returns (name, processor(values) => values) to process a whole column of a data file
+    if(name in __NUMERIC_FIELDS):
+        parser = __FIELD_PARSERS[name]
+        checker, minValue, maxValue = __NUMERIC_FIELDS[name]
+        def numericProcessor(values):
+            values = map(parser, values)
+            if(len(values) == 0): return(values)
+            # each bound is checked on the extreme value of the column
+            checker(name, min(values), minValue, maxValue)
+            checker(name, max(values), minValue, maxValue)
+            return(values)
+        return(name, numericProcessor)
+
+    fieldProcessor = compileFieldProcessor(name, templatesCatalog)
+    name_ = name.split('_')[0] if(name.startswith('subTemplateList')) else name
+    def processor(values):
+        return([fieldProcessor(value)[1] for value in values])
+    return(name_, processor)
+
+def processField(name, value, templatesCatalog=None):
+    return(compileFieldProcessor(name, templatesCatalog)(value))
@@ -9,13 +9,18 @@
 # +-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+
 
 import struct, logging, json
-from Constants import VARIABLE_LENGTH, TypeBasicList, TypeSubTemplateList, \
+from Constants import VARIABLE_LENGTH, TypeBasicList, TypeSubTemplateList, TypeSubTemplateMultiList, \
                       getIANAFieldByName, getIANAFieldById, validatePEN, \
                       getPENFieldById, getPENFieldByName, getStructForType, \
                       getReducedType
 from Lib.ParameterChecking import checkAttr, checkInteger
+from Interning import internFieldSpecifier, lookupFieldSpecifier
+from Validation import compileFieldValidator
+from Codecs import newFieldCodec
 
 class FieldSpecifier(object):
+    # FieldSpecifiers are interned (see Interning): the constructors below return the instance
+    # shared by all the identical definitions, so they must be treated as immutable.
     _strCommon = struct.Struct('!HH')
     _strEntNum = struct.Struct('!I')
     
@@ -31,6 +36,9 @@ class FieldSpecifier(object):
         self.length = None
         self.variableLength = None
         self.enterpriseNumber = None
+        self.validator = None
+        self.validatorCompiled = False
+        self.codec = None
     
     def getId(self): return(self.informationElementId)
     def getName(self): return(self.name)
@@ -38,6 +46,21 @@ class FieldSpecifier(object):
     def getEnterpriseNumber(self): return(self.enterpriseNumber)
     def isVariableLength(self): return(self.variableLength)
     def getLength(self): return(self.length)
+
+    def getValidator(self):
+        # checks of minValue/maxValue/choose compiled once per (interned) field; None if unconstrained
+        if(not self.validatorCompiled):
+            self.validator = compileFieldValidator(self)
+            self.validatorCompiled = True
+        return(self.validator)
+
+    def getCodec(self):
+        # resolved once per (interned) field, see Codecs
+        codec = self.codec
+        if(codec is None):
+            codec = newFieldCodec(self)
+            self.codec = codec
+        return(codec)
     
     @classmethod
     def _reducePattern(cls, field):
@@ -69,12 +92,12 @@ class FieldSpecifier(object):
             if(isinstance(obj.struct_, (struct.Struct,))):
                 if(obj.length is None):
                     obj.length = obj.struct_.size
-            elif(isinstance(obj.struct_, (TypeBasicList, TypeSubTemplateList))):
+            elif(isinstance(obj.struct_, (TypeBasicList, TypeSubTemplateList, TypeSubTemplateMultiList))):
                 pass
             else:
                 raise Exception('Unknown FieldType(%s)' % str(obj.struct_)) 
         
-        if(isinstance(obj.struct_, (TypeBasicList, TypeSubTemplateList))):
+        if(isinstance(obj.struct_, (TypeBasicList, TypeSubTemplateList, TypeSubTemplateMultiList))):
             obj.length = VARIABLE_LENGTH
             obj.variableLength = True
         else:
@@ -116,7 +139,7 @@ class FieldSpecifier(object):
         obj.length = length
         cls._validateCommon(obj)
         cls._validateIANA(obj)
-        return(obj)
+        return(internFieldSpecifier(obj))
     
     @classmethod
     def newEnterprise(cls, informationElementId, enterpriseNumber, length=None):
@@ -127,7 +150,7 @@ class FieldSpecifier(object):
         obj.length = length
         cls._validateCommon(obj)
         cls._validateEnterprise(obj)
-        return(obj)
+        return(internFieldSpecifier(obj))
     
     @staticmethod
     def checkJSON(field):
@@ -168,23 +191,74 @@ class FieldSpecifier(object):
             cls._validateEnterprise(obj)
         else:
             cls._validateIANA(obj)
-        return(obj)
+        return(internFieldSpecifier(obj))
 
     @classmethod
     def read(cls, rawData):
-        obj = cls()
         data = rawData.read(FieldSpecifier._strCommon.size)
-        (obj.informationElementId, obj.length) = FieldSpecifier._strCommon.unpack_from(data)
+        (informationElementId, length) = FieldSpecifier._strCommon.unpack_from(data)
+        enterpriseNumber = None
+        enterprise = (informationElementId & 0x08000 != 0)
+        if(enterprise):
+            informationElementId -= 0x08000
+            data = rawData.read(FieldSpecifier._strEntNum.size)
+            (enterpriseNumber,) = FieldSpecifier._strEntNum.unpack_from(data)
+        return(cls.newFromKey(informationElementId, enterpriseNumber, length))
+
+    def getResolvedDefinition(self):
+        # what was resolved from the Information Elements registries, including the struct (as
+        # reduced to the length) so newFromResolved rebuilds the field without looking them up;
+        # structs of variable-length fields are built again from their type
+        structFormat = None
+        if((not self.variableLength) and isinstance(self.struct_, (struct.Struct,))): structFormat = self.struct_.format
+        return([self.informationElementId, self.enterpriseNumber, self.length, self.name, self.type,
+                structFormat, self.minValue, self.maxValue, self.choose])
+
+    @classmethod
+    def newFromResolved(cls, definition):
+        # definition as returned by getResolvedDefinition, e.g., stored in a cache; it is trusted
+        (informationElementId, enterpriseNumber, length, name, type_, structFormat,
+         minValue, maxValue, choose) = definition
+        key = (informationElementId, enterpriseNumber, length)
+        obj = lookupFieldSpecifier(key)
+        if(obj is not None): return(obj)
+
+        obj = cls()
+        obj.informationElementId = informationElementId
+        obj.enterprise = (enterpriseNumber is not None)
+        obj.enterpriseNumber = enterpriseNumber
+        obj.length = length
+        obj.variableLength = (length == VARIABLE_LENGTH)
+        obj.name = str(name)
+        obj.type = str(type_)
+        if(structFormat is not None):
+            obj.struct_ = struct.Struct(str(structFormat))
+        else:
+            obj.struct_ = getStructForType(obj.type, obj.name, length)
+        obj.minValue = minValue
+        obj.maxValue = maxValue
+        obj.choose = choose
+        return(internFieldSpecifier(obj, key))
+
+    @classmethod
+    def newFromKey(cls, informationElementId, enterpriseNumber, length):
+        # definition as seen in the wire: numeric id, PEN (None for IANA) and length.
+        # known definitions are not validated again
+        key = (informationElementId, enterpriseNumber, length)
+        obj = lookupFieldSpecifier(key)
+        if(obj is not None): return(obj)
+
+        obj = cls()
+        obj.informationElementId = informationElementId
+        obj.length = length
+        obj.enterprise = (enterpriseNumber is not None)
+        obj.enterpriseNumber = enterpriseNumber
         cls._validateCommon(obj)
-        obj.enterprise = (obj.informationElementId & 0x08000 != 0)
         if(obj.enterprise):
-            obj.informationElementId -= 0x08000
-            data = rawData.read(FieldSpecifier._strEntNum.size)
-            (obj.enterpriseNumber,) = FieldSpecifier._strEntNum.unpack_from(data)
             cls._validateEnterprise(obj)
         else:
             cls._validateIANA(obj)
-        return(obj)
+        return(internFieldSpecifier(obj, key))
 
     def _computeLength(self):
         length = FieldSpecifier._strCommon.size
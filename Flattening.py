@@ -0,0 +1,136 @@
+# Flattening of DataRecords with structured values (basicList, subTemplateList and
+# subTemplateMultiList) into column batches, as a normalized schema: the scalar fields of the
+# records go to one batch, and the elements of each list to a child batch whose PARENT_INDEX
+# column holds the row of their parent in the parent batch. Nested lists are flattened the same
+# way, so batches load into columnar stores and join on PARENT_INDEX.
+# Batches are keyed by their parent batch, their path (list field names from the root) and the
+# TemplateLayout of their rows; the columns of each layout are resolved once. Sibling batches
+# of a path (e.g., blocks of subTemplateMultiLists with different layouts) get child batches of
+# their own, so PARENT_INDEX always refers to the rows of a single batch, its parent (see
+# ColumnBatch.getParent). Columns are filled one at a time, and basicLists of numbers are
+# copied from their compact sequences.
+
+import weakref, collections
+
+PARENT_INDEX = '_parentIndex'
+ROOT_PATH = ('root',)
+LIST_TYPES = ('basicList', 'subTemplateList', 'subTemplateMultiList')
+
+class FlatteningLayout(object):
+    # positions of the scalar and list fields in the records read from the wire
+    def __init__(self, layout):
+        self.scalars = []   # [(valueIndex, name)]
+        self.lists = []     # [(valueIndex, name, type)]
+        index = 0
+        for field in layout.fields:
+            if(field.name == 'paddingOctets'): continue
+            if(field.type in LIST_TYPES):
+                self.lists.append((index, field.name, field.type))
+            else:
+                self.scalars.append((index, field.name))
+            index += 1
+        self.numValues = index
+        self.scalarNames = tuple([name for _,name in self.scalars])
+
+_flatteningLayouts = weakref.WeakKeyDictionary()
+
+def getFlatteningLayout(layout):
+    flatteningLayout = _flatteningLayouts.get(layout)
+    if(flatteningLayout is None):
+        flatteningLayout = FlatteningLayout(layout)
+        _flatteningLayouts[layout] = flatteningLayout
+    return(flatteningLayout)
+
+class ColumnBatch(object):
+    def __init__(self, batchId, path, columnNames, parent):
+        self.batchId = batchId
+        self.path = path
+        self.name = '.'.join(path)
+        self.parent = parent
+        self.columnNames = ((PARENT_INDEX,) if(parent is not None) else ()) + tuple(columnNames)
+        self.columns = collections.OrderedDict([(name, []) for name in self.columnNames])
+        self.numRows = 0
+
+    def getId(self): return(self.batchId)
+    def getName(self): return(self.name)
+    def getPath(self): return(self.path)
+    def getParent(self): return(self.parent)
+    def getColumnNames(self): return(self.columnNames)
+    def getColumn(self, name): return(self.columns[name])
+    def getColumns(self): return(self.columns)
+    def getNumRows(self): return(self.numRows)
+
+    def toRows(self):
+        return([dict(zip(self.columnNames, row)) for row in zip(*self.columns.values())])
+
+class Flattener(object):
+    def __init__(self):
+        self.__batches = collections.OrderedDict() # (parent id, path, layout key or element field name) => ColumnBatch
+
+    def getBatches(self): return(self.__batches.values())
+
+    def getBatchesByName(self):
+        # batches of the same path with several layouts (e.g., of subTemplateMultiLists) are listed together
+        batches = {}
+        for batch in self.__batches.itervalues():
+            batches.setdefault(batch.name, []).append(batch)
+        return(batches)
+
+    def _getBatch(self, parent, path, key, columnNames):
+        batchKey = (None if(parent is None) else parent.batchId, path, key)
+        batch = self.__batches.get(batchKey)
+        if(batch is None):
+            batch = ColumnBatch(len(self.__batches), path, columnNames, parent)
+            self.__batches[batchKey] = batch
+        return(batch)
+
+    def add(self, template, records):
+        # flattens records of a template; returns the parent batch
+        return(self._addRecords(None, ROOT_PATH, template, records, None))
+
+    def _addRecords(self, parent, path, template, records, parentIndexes):
+        flatteningLayout = getFlatteningLayout(template.layout)
+        batch = self._getBatch(parent, path, template.layout.key, flatteningLayout.scalarNames)
+        if(len(records) == 0): return(batch)
+        valuesList = [record.values for record in records]
+        if(any([len(values) != flatteningLayout.numValues for values in valuesList])):
+            # records created locally keep their paddingOctets
+            valuesList = [[value for value in values if value.field.name != 'paddingOctets'] for values in valuesList]
+
+        baseRow = batch.numRows
+        columns = batch.columns
+        if(parentIndexes is not None): columns[PARENT_INDEX].extend(parentIndexes)
+        for index,name in flatteningLayout.scalars:
+            columns[name].extend([values[index].value for values in valuesList])
+        batch.numRows += len(valuesList)
+
+        for index,name,type_ in flatteningLayout.lists:
+            childPath = path + (name,)
+            for row in xrange(len(valuesList)):
+                value = valuesList[row][index].value
+                if(value is None): continue
+                parentRow = baseRow + row
+                if(type_ == 'basicList'):
+                    self._addBasicList(batch, childPath, value, parentRow)
+                elif(type_ == 'subTemplateList'):
+                    nestedRecords = value.getRecords()
+                    self._addRecords(batch, childPath, value.getTemplate(), nestedRecords, [parentRow] * len(nestedRecords))
+                else:
+                    for nestedTemplate,nestedRecords in value.getBlocks():
+                        self._addRecords(batch, childPath, nestedTemplate, nestedRecords, [parentRow] * len(nestedRecords))
+        return(batch)
+
+    def _addBasicList(self, parent, path, basicList, parentRow):
+        field = basicList.getField()
+        batch = self._getBatch(parent, path, field.name, (field.name,))
+        elements = basicList.getArray()
+        if(elements is None): elements = [value.value for value in basicList.values]
+        batch.columns[PARENT_INDEX].extend([parentRow] * len(elements))
+        batch.columns[field.name].extend(elements)
+        batch.numRows += len(elements)
+
+def flattenRecords(template, records):
+    # returns the Flattener holding the batches of the records of a template
+    flattener = Flattener()
+    flattener.add(template, records)
+    return(flattener)
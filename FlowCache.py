@@ -0,0 +1,234 @@
+import threading, time, logging, collections
+from Lib.ParameterChecking import checkType, checkAttr, checkInteger, checkFloat
+from DataRecord import DataRecord
+
+# Reference: https://tools.ietf.org/html/rfc5102#section-5.11.3 (flowEndReason)
+FLOW_END_REASON_IDLE_TIMEOUT = 0x01
+FLOW_END_REASON_ACTIVE_TIMEOUT = 0x02
+FLOW_END_REASON_FORCED_END = 0x04
+FLOW_END_REASON_LACK_OF_RESOURCES = 0x05
+
+DEFAULT_COUNTER_FIELDS = ['packetDeltaCount', 'octetDeltaCount', 'layer2OctetDeltaCount']
+
+# how the values of a field are merged into the entry of a flow
+MERGE_SUM = 'sum'
+MERGE_MIN = 'min'
+MERGE_MAX = 'max'
+MERGE_LAST = 'last'
+
+class FlowCache(object):
+    # Aggregates the records of an exporter template by a set of key fields before they are
+    # exported. Counter fields are summed, minFields keep the lowest value seen (by default,
+    # the flowStart* timestamps), maxFields the highest one (by default, the flowEnd* ones) and
+    # the remaining fields keep the last value seen.
+    # Entries are kept in an OrderedDict sorted by last update, so idle entries are found
+    # at its head; a second OrderedDict sorted by creation time does the same for active
+    # timeouts, and evicted entries are removed from both. Expiring entries never requires
+    # scanning the whole cache. Memory is bounded by the number of entries (maxEntries).
+    # FlowCaches must be stopped before their Exporter, so the flushed entries can be exported;
+    # entries flushed once the Exporter is stopped are discarded.
+
+    def __init__(self, exporter):
+        from Exporter import Exporter
+        checkType('exporter', (Exporter,), exporter)
+        self.__exporter = exporter
+        self.__configured = False
+        self.__running = False
+        self.__templateId = None
+        self.__keyFields = None
+        self.__counterFields = None
+        self.__minFields = None
+        self.__maxFields = None
+        self.__mergeRules = {}  # field name => MERGE_*, resolved on first use
+        self.__activeTimeout = None
+        self.__idleTimeout = None
+        self.__maxEntries = None
+        self.__expiryInterval = None
+        self.__lock = threading.Lock()
+        self.__entries = collections.OrderedDict()  # key => [firstSeen, lastSeen, obsDomId, values]
+        self.__creations = collections.OrderedDict() # key => firstSeen, sorted by creation
+        self.__stopEvent = None
+        self.__thread = None
+        self.__stats = {'updates': 0, 'created': 0, 'evictedIdle': 0, 'evictedActive': 0,
+                        'evictedLackOfResources': 0, 'evictedForced': 0, 'discarded': 0}
+
+    @staticmethod
+    def checkConfiguration(config):
+        checkType('config', (dict,), config)
+        checkInteger('templateId', checkAttr('templateId', config), 256, 65535)
+        keyFields = checkAttr('keyFields', config)
+        checkType('keyFields', (list,), keyFields)
+        if(len(keyFields) == 0): raise Exception('At least one key field is required')
+        if(('counterFields' in config) and (config['counterFields'] is not None)):
+            checkType('counterFields', (list,), config['counterFields'])
+        if(('minFields' in config) and (config['minFields'] is not None)):
+            checkType('minFields', (list,), config['minFields'])
+        if(('maxFields' in config) and (config['maxFields'] is not None)):
+            checkType('maxFields', (list,), config['maxFields'])
+        checkFloat('activeTimeout', checkAttr('activeTimeout', config), 0)
+        checkFloat('idleTimeout', checkAttr('idleTimeout', config), 0)
+        checkInteger('maxEntries', checkAttr('maxEntries', config), 1)
+        if(('expiryInterval' in config) and (config['expiryInterval'] is not None)):
+            checkFloat('expiryInterval', config['expiryInterval'], 0.01)
+
+    def configure(self, config):
+        FlowCache.checkConfiguration(config)
+        self.__templateId = config['templateId']
+        self.__keyFields = list(config['keyFields'])
+        self.__counterFields = config.get('counterFields')
+        if(self.__counterFields is None): self.__counterFields = DEFAULT_COUNTER_FIELDS
+        self.__counterFields = set([name for name in self.__counterFields if name not in self.__keyFields])
+        self.__minFields = config.get('minFields')
+        if(self.__minFields is not None): self.__minFields = set(self.__minFields)
+        self.__maxFields = config.get('maxFields')
+        if(self.__maxFields is not None): self.__maxFields = set(self.__maxFields)
+        self.__mergeRules = {}
+        self.__activeTimeout = config['activeTimeout']
+        self.__idleTimeout = config['idleTimeout']
+        self.__maxEntries = config['maxEntries']
+        self.__expiryInterval = config.get('expiryInterval')
+        if(self.__expiryInterval is None): self.__expiryInterval = 1.0
+        self.__configured = True
+
+    def isConfigured(self): return(self.__configured)
+    def isRunning(self): return(self.__running)
+    def getNumEntries(self): return(len(self.__entries))
+
+    def getStats(self):
+        stats = dict(self.__stats)
+        stats['entries'] = len(self.__entries)
+        return(stats)
+
+    def start(self):
+        if(not self.__configured): return
+        if(self.__running): return
+        self.__stopEvent = threading.Event()
+        self.__thread = threading.Thread(target=self._run)
+        self.__thread.setDaemon(True)
+        self.__thread.start()
+        self.__running = True
+
+    def stop(self, flush=True):
+        if(not self.__running): return
+        self.__stopEvent.set()
+        self.__thread.join()
+        self.__running = False
+        if(not flush): return
+        if(not self.__exporter.isRunning()):
+            with self.__lock:
+                numDiscarded = len(self.__entries)
+                self.__stats['discarded'] += numDiscarded
+                self.__entries.clear()
+                self.__creations.clear()
+            if(numDiscarded > 0):
+                logger = logging.getLogger(__name__)
+                logger.warning('Exporter stopped before its FlowCache; %d entries discarded' % numDiscarded)
+            return
+        self.flush()
+
+    def _getMergeRule(self, name):
+        rule = self.__mergeRules.get(name)
+        if(rule is not None): return(rule)
+        if(name in self.__counterFields):
+            rule = MERGE_SUM
+        elif(self.__minFields is not None):
+            rule = MERGE_MIN if(name in self.__minFields) else None
+        elif(name.startswith('flowStart')):
+            rule = MERGE_MIN
+        if(rule is None):
+            if(self.__maxFields is not None):
+                rule = MERGE_MAX if(name in self.__maxFields) else MERGE_LAST
+            elif(name.startswith('flowEnd') and (name != 'flowEndReason')):
+                rule = MERGE_MAX
+            else:
+                rule = MERGE_LAST
+        self.__mergeRules[name] = rule
+        return(rule)
+
+    def _run(self):
+        logger = logging.getLogger(__name__)
+        while(not self.__stopEvent.wait(self.__expiryInterval)):
+            try:
+                self.expire()
+            except Exception as e:
+                logger.exception(e)
+
+    def update(self, obsDomId, values, now=None):
+        if(now is None): now = time.time()
+        key = (obsDomId,) + tuple([values[name] for name in self.__keyFields])
+        evicted = []
+        with self.__lock:
+            self.__stats['updates'] += 1
+            entry = self.__entries.pop(key, None)
+            if(entry is None):
+                if(len(self.__entries) >= self.__maxEntries):
+                    oldestKey, oldest = self.__entries.popitem(last=False)
+                    del self.__creations[oldestKey]
+                    evicted.append((oldest, FLOW_END_REASON_LACK_OF_RESOURCES))
+                    self.__stats['evictedLackOfResources'] += 1
+                entry = [now, now, obsDomId, dict(values)]
+                self.__creations[key] = now
+                self.__stats['created'] += 1
+            else:
+                entry[1] = now
+                entryValues = entry[3]
+                for name,value in values.iteritems():
+                    rule = self._getMergeRule(name)
+                    if(rule == MERGE_SUM):
+                        entryValues[name] = entryValues.get(name, 0) + value
+                    elif((rule == MERGE_MIN) and (name in entryValues)):
+                        entryValues[name] = min(entryValues[name], value)
+                    elif((rule == MERGE_MAX) and (name in entryValues)):
+                        entryValues[name] = max(entryValues[name], value)
+                    else:
+                        entryValues[name] = value
+            self.__entries[key] = entry
+        self._export(evicted)
+
+    def expire(self, now=None):
+        if(now is None): now = time.time()
+        evicted = []
+        with self.__lock:
+            while(len(self.__entries) > 0):
+                key = next(iter(self.__entries))
+                entry = self.__entries[key]
+                if(now - entry[1] < self.__idleTimeout): break
+                del self.__entries[key]
+                del self.__creations[key]
+                evicted.append((entry, FLOW_END_REASON_IDLE_TIMEOUT))
+                self.__stats['evictedIdle'] += 1
+
+            while(len(self.__creations) > 0):
+                key, firstSeen = next(self.__creations.iteritems())
+                if(now - firstSeen < self.__activeTimeout): break
+                del self.__creations[key]
+                entry = self.__entries.pop(key)
+                evicted.append((entry, FLOW_END_REASON_ACTIVE_TIMEOUT))
+                self.__stats['evictedActive'] += 1
+        self._export(evicted)
+
+    def flush(self):
+        with self.__lock:
+            evicted = [(entry, FLOW_END_REASON_FORCED_END) for entry in self.__entries.itervalues()]
+            self.__stats['evictedForced'] += len(evicted)
+            self.__entries.clear()
+            self.__creations.clear()
+        self._export(evicted)
+
+    def _export(self, evicted):
+        if(len(evicted) == 0): return
+        session = self.__exporter.getSession()
+        recordsByDomain = {}
+        templates = {}
+        for entry,reason in evicted:
+            _, _, obsDomId, values = entry
+            if(obsDomId not in templates):
+                template = session.getDomain(obsDomId).getExporterTemplate(self.__templateId)
+                hasEndReason = any([field.name == 'flowEndReason' for field in template.fields])
+                templates[obsDomId] = (template, hasEndReason, session.getDomain(obsDomId))
+            template, hasEndReason, domain = templates[obsDomId]
+            if(hasEndReason): values['flowEndReason'] = reason
+            record = DataRecord.create(template, values, domain.shouldValidate())
+            recordsByDomain.setdefault(obsDomId, []).append(record)
+        for obsDomId,records in recordsByDomain.iteritems():
+            self.__exporter.exportDataRecords(obsDomId, self.__templateId, records)
@@ -0,0 +1,76 @@
+import csv, logging
+from Lib.ParameterChecking import checkType, checkInteger
+from FieldHandlers import compileColumnProcessor
+from TemplateHandlers import getPostComputeFunction
+from DataRecord import DataRecord
+
+class IngestionPipeline(object):
+    # Converts the samples of a data file (a header with the field names, one sample per row)
+    # into DataRecords of a template. Field processors and post-compute functions are resolved
+    # once, when the pipeline is created; rows are processed in batches, column by column, so
+    # numeric columns are parsed and checked in one sweep (see FieldHandlers).
+    # Pipelines with subTemplateList columns must be created again when the catalog changes.
+
+    def __init__(self, templateId, columnNames, templatesCatalog=None):
+        checkInteger('templateId', templateId, 256, 65535)
+        checkType('columnNames', (list, tuple), columnNames)
+        if(len(columnNames) == 0): raise Exception('Data file has no columns')
+        self.__templateId = templateId
+        self.__numColumns = len(columnNames)
+        self.__columnProcessors = [compileColumnProcessor(columnName.strip(), templatesCatalog)
+                                   for columnName in columnNames]
+        self.__names = [name for name,_ in self.__columnProcessors]
+        self.__postCompute = getPostComputeFunction(templateId)
+
+    def getTemplateId(self): return(self.__templateId)
+    def getNames(self): return(self.__names)
+
+    def processRows(self, rows):
+        # returns the values (dict) of the samples in rows
+        if(len(rows) == 0): return([])
+        for numRow,row in enumerate(rows):
+            if(len(row) != self.__numColumns):
+                raise Exception('Row %d has %d columns, %d expected' % (numRow, len(row), self.__numColumns))
+        columns = [processor(list(column)) for (_,processor),column in zip(self.__columnProcessors, zip(*rows))]
+        names = self.__names
+        samples = [dict(zip(names, values)) for values in zip(*columns)]
+        postCompute = self.__postCompute
+        if(postCompute is not None): samples = map(postCompute, samples)
+        return(samples)
+
+    def createDataRecords(self, template, rows, validate=True):
+        return([DataRecord.create(template, values, validate) for values in self.processRows(rows)])
+
+    @staticmethod
+    def readBatches(dataFile, batchSize=1024, delimiter=','):
+        # yields the header, then lists of at most batchSize rows; blank lines are skipped
+        checkInteger('batchSize', batchSize, 1)
+        reader = csv.reader(dataFile, delimiter=delimiter)
+        header = next(reader, None)
+        if(header is None): raise Exception('Data file is empty')
+        yield(header)
+        batch = []
+        for row in reader:
+            if(len(row) == 0): continue
+            batch.append(row)
+            if(len(batch) >= batchSize):
+                yield(batch)
+                batch = []
+        if(len(batch) > 0): yield(batch)
+
+def exportDataFile(exporter, obsDomId, templateId, path, templatesCatalog=None, batchSize=1024, delimiter=','):
+    # Sends the samples of a data file through an Exporter; returns the number of records sent
+    logger = logging.getLogger(__name__)
+    session = exporter.getSession()
+    domain = session.getDomain(obsDomId)
+    template = domain.getExporterTemplate(templateId)
+    numRecords = 0
+    with open(path, 'rb') as dataFile:
+        batches = IngestionPipeline.readBatches(dataFile, batchSize, delimiter)
+        pipeline = IngestionPipeline(templateId, next(batches), templatesCatalog)
+        for rows in batches:
+            records = pipeline.createDataRecords(template, rows, domain.shouldValidate())
+            exporter.exportDataRecords(obsDomId, templateId, records)
+            numRecords += len(records)
+    logger.debug('Exported %d records of Template(%d) from %s' % (numRecords, templateId, path))
+    return(numRecords)
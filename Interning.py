@@ -0,0 +1,55 @@
+import threading, weakref
+from TemplateLayout import TemplateLayout
+
+# Byte-identical definitions received from many domains/exporters share a single object:
+# - FieldSpecifiers are keyed by (informationElementId, enterpriseNumber, length),
+# - TemplateLayouts by the keys of their fields, whatever the Template Id,
+# - TemplateRecords (and OptionTemplateRecords) by (templateId, layout key).
+# Tables hold weak references, so definitions no longer used by any domain are released.
+# Interned objects are shared: they must not be modified.
+
+_lock = threading.Lock()
+_fieldSpecifiers = weakref.WeakValueDictionary()
+_templateLayouts = weakref.WeakValueDictionary()
+_templateRecords = weakref.WeakValueDictionary()
+
+def getFieldKey(field):
+    return((field.informationElementId, field.enterpriseNumber, field.length))
+
+def _intern(table, key, obj):
+    interned = table.get(key)
+    if(interned is not None): return(interned)
+    with _lock:
+        interned = table.get(key)
+        if(interned is None):
+            table[key] = obj
+            interned = obj
+    return(interned)
+
+def lookupFieldSpecifier(key):
+    return(_fieldSpecifiers.get(key))
+
+def internFieldSpecifier(field, key=None):
+    # key defaults to the one of the field; readers intern also under the key seen in the wire
+    if(key is None): key = getFieldKey(field)
+    return(_intern(_fieldSpecifiers, key, field))
+
+def getInternedFieldSpecifiers():
+    return(_fieldSpecifiers.values())
+
+def internTemplateLayout(fields):
+    key = tuple([getFieldKey(field) for field in fields])
+    layout = _templateLayouts.get(key)
+    if(layout is not None): return(layout)
+    fields = [internFieldSpecifier(field) for field in fields]
+    return(_intern(_templateLayouts, key, TemplateLayout(key, fields)))
+
+def internTemplateRecord(template):
+    return(_intern(_templateRecords, (template.__class__.__name__,) + template._getInternKey(), template))
+
+def getInterningStats():
+    return({
+        'fieldSpecifiers': len(_fieldSpecifiers),
+        'templateLayouts': len(_templateLayouts),
+        'templateRecords': len(_templateRecords)
+    })
@@ -26,6 +26,7 @@
 # +-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+
 
 import json, struct, time, calendar
+from cStringIO import StringIO
 from Lib.ParameterChecking import checkType
 from Constants import IPFIX_VERSION
 from Set import Set
@@ -37,6 +38,7 @@ class Message():
         self.version = None
         self.length = None
         self.session = None
+        self.domain = None
         self.exportTimeUTC = None
         self.sequenceNumber = None
         self.observationDomainId = None
@@ -45,6 +47,7 @@ class Message():
         self.optionTemplateSets = []
         self.dataSets = []
         self.dataSetIds = {}
+        self.replayed = False
     
     def __del__(self):
         for d in self.templateSets: del d
@@ -58,6 +61,7 @@ class Message():
         del self.version
         del self.length
         del self.session
+        del self.domain
         del self.exportTimeUTC
         del self.sequenceNumber
         del self.observationDomainId
@@ -66,6 +70,7 @@ class Message():
         del self.optionTemplateSets
         del self.dataSets
         del self.dataSetIds
+        del self.replayed
 
     @classmethod
     def create(cls, session, observationDomainId, explicitTimeStamp=None, version=IPFIX_VERSION):
@@ -82,47 +87,85 @@ class Message():
         return(msg)
     
     @classmethod
-    def _readHeader(cls, rawData, message):
+    def _readHeader(cls, rawData, message, clientAddress=None, clientPort=None):
         data = rawData.read(Message._str.size)
         (version, length, exportTimeUTC, sequenceNumber, observationDomainId) = Message._str.unpack_from(data)
         
         if(version != IPFIX_VERSION): raise Exception('Invalid message version')
         if(length == 0): raise Exception('Invalid message length')
         exportTimeUTC = time.gmtime(exportTimeUTC)
-        domain = message.session.getDomain(observationDomainId)
-        domain.getCollectorSequentiation().check(sequenceNumber, exportTimeUTC)
+        domain = message.session.getTransportDomain(observationDomainId, clientAddress, clientPort)
         message.version = version
         message.length = length
         message.exportTimeUTC = exportTimeUTC
         message.sequenceNumber = sequenceNumber
         message.observationDomainId = observationDomainId
+        message.domain = domain
 
     @classmethod
-    def read(cls, session, rawData):
+    def read(cls, session, rawData, clientAddress=None, clientPort=None):
         from Session import Session
         checkType('session', (Session,), session)
         msg = cls()
         msg.session = session
-        Message._readHeader(rawData, msg)
-        domain = msg.session.getDomain(msg.observationDomainId)
+        Message._readHeader(rawData, msg, clientAddress, clientPort)
+        domain = msg.domain
+        complete = True
         while(rawData.tell() < msg.length):
             set_ = Set.read(domain, rawData)
+            # templates apply to the sets that follow them in the same message
             if(set_.setId == 2):
                 msg.templateSets.append(set_)
                 msg.allSets.append(set_)
+                for record in set_.records: domain.updateCollectorTemplate(record)
+                for withdrawal in set_.withdrawals: domain.withdrawCollectorTemplate(withdrawal.templateId)
             elif(set_.setId == 3):
                 msg.optionTemplateSets.append(set_)
                 msg.allSets.append(set_)
+                for record in set_.records: domain.updateCollectorOptionTemplate(record)
+                for withdrawal in set_.withdrawals: domain.withdrawCollectorOptionTemplate(withdrawal.templateId)
+            elif(set_.setType == 'pending'):
+                domain.getPendingSets().add(set_.setId, set_.rawData, msg.exportTimeUTC, msg.sequenceNumber)
+                complete = False
             else:
+                if(set_.setType == 'ignored'): complete = False
                 msg.dataSets.append(set_)
                 msg.allSets.append(set_)
+        domain.updateCollectorOptionsData(msg)
 
         sequentiation = domain.getCollectorSequentiation()
-        _, _ = sequentiation.get()
-        numDataRecords = msg.getNumDataRecords()
-        sequentiation.update(numDataRecords, msg.exportTimeUTC)
+        sequentiation.check(msg.sequenceNumber, msg.getNumDataRecords(), msg.exportTimeUTC, complete)
+        # pages are accounted as the records they are in the wire
+        domain.reassembleCollectorPages(msg)
         return(msg)
     
+    @classmethod
+    def readPendingSets(cls, session, domain, templateIds):
+        # Decodes the sets buffered in the domain for the given templates; consecutive sets
+        # received in the same message are grouped in one replayed message.
+        pendingSets = domain.getPendingSets()
+        if(pendingSets is None): return([])
+        messages = []
+        msg = None
+        for setId,exportTimeUTC,sequenceNumber,setData in pendingSets.pop(templateIds):
+            if((msg is None) or (msg.sequenceNumber != sequenceNumber) or (msg.exportTimeUTC != exportTimeUTC)):
+                msg = cls()
+                msg.session = session
+                msg.domain = domain
+                msg.version = IPFIX_VERSION
+                msg.exportTimeUTC = exportTimeUTC
+                msg.sequenceNumber = sequenceNumber
+                msg.observationDomainId = domain.obsDomainId
+                msg.replayed = True
+                messages.append(msg)
+            set_ = Set.read(domain, StringIO(setData))
+            msg.dataSets.append(set_)
+            msg.allSets.append(set_)
+        for msg in messages:
+            domain.updateCollectorOptionsData(msg)
+            domain.reassembleCollectorPages(msg)
+        return(messages)
+
     def getObservationDomainId(self): return(self.observationDomainId)
     def getExportTimeUTC(self): return(self.exportTimeUTC)
 
@@ -150,6 +193,18 @@ class Message():
         for set_ in self.allSets:
             set_.write(rawData)
     
+    @classmethod
+    def writeRaw(cls, session, observationDomainId, setsData, rawData, numDataRecords=0, version=IPFIX_VERSION):
+        # Writes a message whose sets are already encoded (e.g., cached template sets)
+        domain = session.getDomain(observationDomainId)
+        sequentiation = domain.getExporterSequentiation()
+        sequenceNumber, _ = sequentiation.get()
+        exportTimeUTC = time.gmtime()
+        sequentiation.update(numDataRecords, exportTimeUTC)
+        rawData.write(Message._str.pack(version, Message._str.size + len(setsData), calendar.timegm(exportTimeUTC),
+                                        sequenceNumber, observationDomainId))
+        rawData.write(setsData)
+
     def getNumDataRecords(self):
         numDataRecords = 0
         for dataSet in self.dataSets:
@@ -189,7 +244,7 @@ class Message():
         if(len(self.templateSets) > 0):
             d['templateSets'] = map(lambda s: s.toJSON(), self.templateSets)
         if(len(self.optionTemplateSets) > 0):
-            d['optionTemplateSets'] = map(lambda s: s.toJSON(), self.optionTemplateSets),
+            d['optionTemplateSets'] = map(lambda s: s.toJSON(), self.optionTemplateSets)
         if(len(self.dataSets) > 0):
             d['dataSets'] = map(lambda s: s.toJSON(), self.dataSets)
         return(d)
@@ -1,96 +1,271 @@
-import time #, logging
+import time, threading #, logging
 from Lib.ParameterChecking import checkInteger, checkType
 from OptionTemplateRecord import OptionTemplateRecord
 from TemplateRecord import TemplateRecord
+from TemplateStore import TemplateStore, TemplateBudget
+from PendingSets import PendingSets
+from OptionsIndex import OptionsIndex
+from Pagination import PageReassembly
 
 
+# Reference: https://tools.ietf.org/html/rfc7011#section-3.1 (Sequence Number)
+SEQUENCE_NUMBER_MODULO = 1 << 32
+SEQUENCE_WINDOW_GAPS = 32           # gaps that can still be filled by reordered messages
+SEQUENCE_WINDOW_RECORDS = 1 << 20   # messages further behind are taken as an exporter restart
+
 class Sequentiation(object):
+    # Exporters use get/update to number their messages. Collectors call check once per
+    # received message to account for lost, duplicated and reordered records: a message ahead
+    # of the expected sequence number opens a gap, counted as lost, that late messages may fill
+    # while it remains in the window of recent gaps.
+
     def __init__(self):
         self.reset()
 
-    def check(self, sequenceNumber, exportTimeUTC):
-        #logger = logging.getLogger(__name__)
-        #if(sequenceNumber != self.nextSequenceNumber):
-        #    logger.warning('Unexpected Sequence Number. Got=%d Expected=%d' % (sequenceNumber, self.nextSequenceNumber))
-        #if(exportTimeUTC < self.lastExportTimeUTC):
-        #    logger.warning('Invalid Export Time. Got="%s" Expected>="%s"' % (
-        #                    time.strftime('%Y/%m/%d %H:%M:%S', exportTimeUTC), time.strftime('%Y/%m/%d %H:%M:%S', self.lastExportTimeUTC)))
-        pass
+    def check(self, sequenceNumber, numRecords, exportTimeUTC, complete=True):
+        # complete=False when some sets could not be decoded, so numRecords is unknown
+        stats = self.stats
+        stats['messages'] += 1
+        stats['received'] += numRecords
+        if(not self.synced):
+            self._advance(sequenceNumber, numRecords, exportTimeUTC, complete)
+            self.lateSequenceNumber = None
+            return
+        
+        diff = (sequenceNumber - self.nextSequenceNumber) % SEQUENCE_NUMBER_MODULO
+        if(diff == 0):
+            self._advance(sequenceNumber, numRecords, exportTimeUTC, complete)
+        elif(diff < SEQUENCE_NUMBER_MODULO / 2):
+            self.gaps.append((self.nextSequenceNumber, diff))
+            if(len(self.gaps) > SEQUENCE_WINDOW_GAPS): self.gaps.pop(0)
+            stats['lost'] += diff
+            self._advance(sequenceNumber, numRecords, exportTimeUTC, complete)
+        elif((SEQUENCE_NUMBER_MODULO - diff <= SEQUENCE_WINDOW_RECORDS) and (sequenceNumber != self.lateSequenceNumber)):
+            filled = self._fillGap(sequenceNumber, numRecords)
+            stats['lost'] -= filled
+            stats['reordered'] += filled
+            stats['duplicated'] += numRecords - filled
+            # a late message continued by the next one means the exporter restarted its numbering
+            self.lateSequenceNumber = None if(filled > 0) else (sequenceNumber + numRecords) % SEQUENCE_NUMBER_MODULO
+            return
+        else:
+            stats['resyncs'] += 1
+            self.gaps = []
+            self._advance(sequenceNumber, numRecords, exportTimeUTC, complete)
+        self.lateSequenceNumber = None
+
+    def _advance(self, sequenceNumber, numRecords, exportTimeUTC, complete):
+        self.nextSequenceNumber = (sequenceNumber + numRecords) % SEQUENCE_NUMBER_MODULO
+        self.lastExportTimeUTC = exportTimeUTC
+        self.synced = complete
+        if(not complete): self.gaps = []
+
+    def _fillGap(self, sequenceNumber, numRecords):
+        for i,(gapStart,gapLength) in enumerate(self.gaps):
+            offset = (sequenceNumber - gapStart) % SEQUENCE_NUMBER_MODULO
+            if(offset >= gapLength): continue
+            filled = min(numRecords, gapLength - offset)
+            remainder = []
+            if(offset > 0): remainder.append((gapStart, offset))
+            if(offset + filled < gapLength):
+                remainder.append(((sequenceNumber + filled) % SEQUENCE_NUMBER_MODULO, gapLength - offset - filled))
+            self.gaps[i:i+1] = remainder
+            return(filled)
+        return(0)
 
     def get(self): return(self.nextSequenceNumber, self.lastExportTimeUTC)
 
     def update(self, numRecords, exportTimeUTC):
-        self.nextSequenceNumber += numRecords
+        self.nextSequenceNumber = (self.nextSequenceNumber + numRecords) % SEQUENCE_NUMBER_MODULO
         self.lastExportTimeUTC = exportTimeUTC
+
+    def restore(self, nextSequenceNumber, lastExportTimeUTC, synced=True):
+        self.nextSequenceNumber = nextSequenceNumber
+        self.lastExportTimeUTC = lastExportTimeUTC
+        self.synced = synced
+
+    def getStats(self):
+        stats = dict(self.stats)
+        stats['pendingGaps'] = len(self.gaps)
+        return(stats)
     
     def reset(self):
         self.nextSequenceNumber = 1
         self.lastExportTimeUTC = time.gmtime(0)
+        self.synced = False
+        self.lateSequenceNumber = None
+        self.gaps = [] # (firstSequenceNumber, numRecords), oldest first
+        self.stats = {'messages': 0, 'received': 0, 'lost': 0, 'duplicated': 0, 'reordered': 0, 'resyncs': 0}
 
 class ObservationDomain(object):
-    def __init__(self, obsDomainId):
+    # Template tables are published as snapshots: writers build a new table under the domain
+    # templatesLock and replace the reference, so decode and encode threads read them without locks.
+
+    # Collector templates are accounted in templateBudget, usually shared by all the domains of
+    # a Session; without it, both template stores of the domain share one of templateMaxBytes.
+    def __init__(self, obsDomainId, templateMaxBytes=None, templateLifetime=None, templateBudget=None):
         checkInteger('obsDomainId', obsDomainId, 0)
         self.obsDomainId = obsDomainId
+        self.templatesLock = threading.Lock()
         self.collectorSeq = Sequentiation()
-        self.collectorTemplates = {}
-        self.collectorOptionTemplates = {}
+        if(templateBudget is None): templateBudget = TemplateBudget(templateMaxBytes)
+        self.collectorTemplates = TemplateStore(templateBudget, templateLifetime)
+        self.collectorOptionTemplates = TemplateStore(templateBudget, templateLifetime)
         self.exporterSeq = Sequentiation()
         self.exporterTemplates = {}
         self.exporterOptionTemplates = {}
+        self.exporterTemplatesRevision = 0
+        self.exporterTemplateRevisions = {}
+        self.pendingSets = None
+        self.pageReassembly = None
+        self.optionsIndex = OptionsIndex()
+        self.validationPolicy = None
     
     def getId(self): return(self.obsDomainId)
+    def getOptionsIndex(self): return(self.optionsIndex)
+    def getPendingSets(self): return(self.pendingSets)
+    def getPageReassembly(self): return(self.pageReassembly)
+
+    def configurePageReassembly(self, maxPending, timeout, maxBytes=None):
+        # pages of paginated subTemplateLists are merged into their logical records
+        checkInteger('maxPending', maxPending, 1)
+        if(maxBytes is not None): checkInteger('maxBytes', maxBytes, 1)
+        self.pageReassembly = PageReassembly(maxPending, timeout, maxBytes)
+
+    def configurePendingSets(self, maxBytes, maxAge):
+        # DataSets received before their Template are buffered instead of dropped
+        checkInteger('maxBytes', maxBytes, 1)
+        self.pendingSets = PendingSets(maxBytes, maxAge)
+
+    def getValidationPolicy(self): return(self.validationPolicy)
+    def setValidationPolicy(self, validationPolicy): self.validationPolicy = validationPolicy
+
+    def shouldValidate(self):
+        # without a ValidationPolicy every record is validated
+        validationPolicy = self.validationPolicy
+        return((validationPolicy is None) or validationPolicy.shouldValidate())
+
     def getCollectorSequentiation(self): return(self.collectorSeq)
     def getExporterSequentiation(self): return(self.exporterSeq)
     
-    def updateCollectorTemplate(self, template):
+    # pinned templates are configured locally; they never expire nor are evicted from the TemplateStore
+    def updateCollectorTemplate(self, template, pinned=False, refreshTime=None):
         checkType('template', (TemplateRecord,), template)
-        if(self.collectorOptionTemplates.has_key(template.templateId)):
-            raise Exception('Collector TemplateId(%d) is already defined as a Collector OptionTemplate' % (template.templateId))
-        self.collectorTemplates[template.templateId] = template
+        if(isinstance(template, OptionTemplateRecord)):
+            raise Exception('Collector TemplateId(%d) is an OptionTemplate, use updateCollectorOptionTemplate' % (template.templateId))
+        with self.templatesLock:
+            if(self.collectorOptionTemplates.has(template.templateId)):
+                raise Exception('Collector TemplateId(%d) is already defined as a Collector OptionTemplate' % (template.templateId))
+            self.collectorTemplates.set(template.templateId, template, pinned=pinned, now=refreshTime)
 
-    def updateCollectorOptionTemplate(self, optionTemplate):
+    def updateCollectorOptionTemplate(self, optionTemplate, pinned=False, refreshTime=None):
         checkType('optionTemplate', (OptionTemplateRecord,), optionTemplate)
-        if(self.collectorTemplates.has_key(optionTemplate.templateId)):
-            raise Exception('Collector TemplateId(%d) is already defined as a Collector Template' % (optionTemplate.templateId))
-        self.collectorOptionTemplates[optionTemplate.templateId] = optionTemplate
+        with self.templatesLock:
+            if(self.collectorTemplates.has(optionTemplate.templateId)):
+                raise Exception('Collector TemplateId(%d) is already defined as a Collector Template' % (optionTemplate.templateId))
+            self.collectorOptionTemplates.set(optionTemplate.templateId, optionTemplate, pinned=pinned, now=refreshTime)
 
-    def removeCollectorTemplate(self, templateId, exceptIfNotExists=False):
+    # pinnedOnly=True keeps the templates received from the exporter with the same Template Id
+    def removeCollectorTemplate(self, templateId, exceptIfNotExists=False, pinnedOnly=False):
         checkInteger('templateId', templateId, 1)
-        if(not self.collectorTemplates.has_key(templateId)):
-            if(exceptIfNotExists):
-                raise Exception('Collector TemplateId(%d) is not defined' % (templateId))
-        else:
-            del self.collectorTemplates[templateId]
+        with self.templatesLock:
+            removed = False
+            if((not pinnedOnly) or self.collectorTemplates.isPinned(templateId)):
+                removed = self.collectorTemplates.remove(templateId)
+        if((not removed) and exceptIfNotExists):
+            raise Exception('Collector TemplateId(%d) is not defined' % (templateId))
 
-    def removeCollectorOptionTemplate(self, optionTemplateId, exceptIfNotExists=False):
+    def removeCollectorOptionTemplate(self, optionTemplateId, exceptIfNotExists=False, pinnedOnly=False):
         checkInteger('optionTemplateId', optionTemplateId, 1)
-        if(not self.collectorOptionTemplates.has_key(optionTemplateId)):
-            if(exceptIfNotExists):
-                raise Exception('Collector Option TemplateId(%d) is not defined' % (optionTemplateId))
-        else:
-            del self.collectorOptionTemplates[optionTemplateId]
+        with self.templatesLock:
+            removed = False
+            if((not pinnedOnly) or self.collectorOptionTemplates.isPinned(optionTemplateId)):
+                removed = self.collectorOptionTemplates.remove(optionTemplateId)
+        if((not removed) and exceptIfNotExists):
+            raise Exception('Collector Option TemplateId(%d) is not defined' % (optionTemplateId))
+
+    # Template Withdrawals received from the exporter; a Template Id equal to the Set Id
+    # withdraws all of them. Pinned templates are not withdrawn, as they are configured locally.
+    def withdrawCollectorTemplate(self, templateId):
+        self._withdraw(self.collectorTemplates, templateId, 2)
+
+    def withdrawCollectorOptionTemplate(self, optionTemplateId):
+        self._withdraw(self.collectorOptionTemplates, optionTemplateId, 3)
+
+    def _withdraw(self, store, templateId, setId):
+        templateIds = store.getIds() if(templateId == setId) else [templateId]
+        with self.templatesLock:
+            for templateId_ in templateIds:
+                if(store.isPinned(templateId_)): continue
+                store.remove(templateId_)
+
+    def expireCollectorTemplates(self, now=None):
+        # templates of silent exporters are released even if no template is received anymore
+        with self.templatesLock:
+            self.collectorTemplates.expire(now)
+            self.collectorOptionTemplates.expire(now)
+
+    def releaseCollectorTemplates(self):
+        # gives back the memory of all the collector templates, e.g., when the domain is discarded
+        with self.templatesLock:
+            self.collectorTemplates.clear()
+            self.collectorOptionTemplates.clear()
 
     def hasCollectorTemplate(self, templateId):
-        return(self.collectorTemplates.has_key(templateId))
+        return(self.collectorTemplates.has(templateId))
 
     def hasCollectorOptionTemplate(self, optionTemplateId):
-        return(self.collectorOptionTemplates.has_key(optionTemplateId))
+        return(self.collectorOptionTemplates.has(optionTemplateId))
     
     def getCollectorTemplate(self, templateId):
-        if(not self.collectorTemplates.has_key(templateId)):
+        template = self.collectorTemplates.get(templateId)
+        if(template is None):
             raise Exception('Domain(%d) does not contain Collector Template with Id(%d)' % (self.obsDomainId, templateId))
-        return(self.collectorTemplates[templateId])
+        return(template)
 
     def getCollectorOptionTemplate(self, optionTemplateId):
-        if(not self.collectorOptionTemplates.has_key(optionTemplateId)):
+        optionTemplate = self.collectorOptionTemplates.get(optionTemplateId)
+        if(optionTemplate is None):
             raise Exception('Domain(%d) does not contain Collector OptionTemplate with Id(%d)' % (self.obsDomainId, optionTemplateId))
-        return(self.collectorOptionTemplates[optionTemplateId])
+        return(optionTemplate)
+
+    def getCollectorTemplatesSnapshot(self):
+        # templateId => (template, refreshTime, pinned); immutable, see TemplateStore
+        return(self.collectorTemplates.getSnapshot())
 
     def getCollectorTemplateIds(self):
-        return(self.collectorTemplates.keys())
+        return(self.collectorTemplates.getIds())
 
     def getCollectorOptionTemplateIds(self):
-        return(self.collectorOptionTemplates.keys())
+        return(self.collectorOptionTemplates.getIds())
+
+    def getCollectorTemplatesStats(self):
+        return({
+            'templates': self.collectorTemplates.getStats(),
+            'optionTemplates': self.collectorOptionTemplates.getStats()
+        })
+
+    def updateCollectorOptionsData(self, message):
+        # indexes the Options Data Records of the message by their scope
+        for set_ in message.dataSets:
+            if(set_.setType != 'optionsData'): continue
+            self.optionsIndex.update(self.getCollectorOptionTemplate(set_.setId), set_.records)
+
+    def reassembleCollectorPages(self, message):
+        # replaces the pages of paginated subTemplateLists by their complete logical records
+        pageReassembly = self.pageReassembly
+        if(pageReassembly is None): return
+        for set_ in message.dataSets:
+            if(set_.setType != 'data'): continue
+            template = self.getCollectorTemplate(set_.setId)
+            if(template.layout.getPagination() is None): continue
+            set_.records = pageReassembly.add(template, set_.records)
+
+    def lookupOptions(self, scopeNames, scopeValues):
+        return(self.optionsIndex.lookup(scopeNames, scopeValues))
+
+    def enrich(self, values, scopeNames, keyNames=None, prefix=''):
+        return(self.optionsIndex.enrich(values, scopeNames, keyNames, prefix))
 
     def updateCollectorTemplates(self, message):
         newTemplates = []
@@ -110,52 +285,96 @@ class ObservationDomain(object):
 
     def updateExporterTemplate(self, template):
         checkType('template', (TemplateRecord,), template)
-        if(self.exporterOptionTemplates.has_key(template.templateId)):
-            raise Exception('Exporter TemplateId(%d) is already defined as a Exporter OptionTemplate' % (template.templateId))
-        self.exporterTemplates[template.templateId] = template
+        if(isinstance(template, OptionTemplateRecord)):
+            raise Exception('Exporter TemplateId(%d) is an OptionTemplate, use updateExporterOptionTemplate' % (template.templateId))
+        with self.templatesLock:
+            if(template.templateId in self.exporterOptionTemplates):
+                raise Exception('Exporter TemplateId(%d) is already defined as a Exporter OptionTemplate' % (template.templateId))
+            exporterTemplates = dict(self.exporterTemplates)
+            exporterTemplates[template.templateId] = template
+            self.exporterTemplates = exporterTemplates
+            self._touchExporterTemplate(template.templateId)
 
     def updateExporterOptionTemplate(self, optionTemplate):
         checkType('optionTemplate', (OptionTemplateRecord,), optionTemplate)
-        if(self.exporterTemplates.has_key(optionTemplate.templateId)):
-            raise Exception('Exporter TemplateId(%d) is already defined as a Exporter Template' % (optionTemplate.templateId))
-        self.exporterOptionTemplates[optionTemplate.templateId] = optionTemplate
+        with self.templatesLock:
+            if(optionTemplate.templateId in self.exporterTemplates):
+                raise Exception('Exporter TemplateId(%d) is already defined as a Exporter Template' % (optionTemplate.templateId))
+            exporterOptionTemplates = dict(self.exporterOptionTemplates)
+            exporterOptionTemplates[optionTemplate.templateId] = optionTemplate
+            self.exporterOptionTemplates = exporterOptionTemplates
+            self._touchExporterTemplate(optionTemplate.templateId)
     
     def removeExporterTemplate(self, templateId, exceptIfNotExists=False):
         checkInteger('templateId', templateId, 1)
-        if(not self.exporterTemplates.has_key(templateId)):
-            if(exceptIfNotExists):
-                raise Exception('Exporter TemplateId(%d) is not defined' % (templateId))
-        else:
-            del self.exporterTemplates[templateId]
+        with self.templatesLock:
+            if(templateId in self.exporterTemplates):
+                exporterTemplates = dict(self.exporterTemplates)
+                del exporterTemplates[templateId]
+                self.exporterTemplates = exporterTemplates
+                self._touchExporterTemplate(templateId, removed=True)
+                return
+        if(exceptIfNotExists):
+            raise Exception('Exporter TemplateId(%d) is not defined' % (templateId))
 
     def removeExporterOptionTemplate(self, optionTemplateId, exceptIfNotExists=False):
         checkInteger('optionTemplateId', optionTemplateId, 1)
-        if(not self.exporterOptionTemplates.has_key(optionTemplateId)):
-            if(exceptIfNotExists):
-                raise Exception('Exporter Option TemplateId(%d) is not defined' % (optionTemplateId))
-        else:
-            del self.exporterOptionTemplates[optionTemplateId]
+        with self.templatesLock:
+            if(optionTemplateId in self.exporterOptionTemplates):
+                exporterOptionTemplates = dict(self.exporterOptionTemplates)
+                del exporterOptionTemplates[optionTemplateId]
+                self.exporterOptionTemplates = exporterOptionTemplates
+                self._touchExporterTemplate(optionTemplateId, removed=True)
+                return
+        if(exceptIfNotExists):
+            raise Exception('Exporter Option TemplateId(%d) is not defined' % (optionTemplateId))
 
     
     def hasExporterTemplate(self, templateId):
-        return(self.exporterTemplates.has_key(templateId))
+        return(templateId in self.exporterTemplates)
 
     def hasExporterOptionTemplate(self, optionTemplateId):
-        return(self.exporterOptionTemplates.has_key(optionTemplateId))
+        return(optionTemplateId in self.exporterOptionTemplates)
     
     def getExporterTemplate(self, templateId):
-        if(not self.exporterTemplates.has_key(templateId)):
+        template = self.exporterTemplates.get(templateId)
+        if(template is None):
             raise Exception('Domain(%d) does not contain Exporter Template with Id(%d)' % (self.obsDomainId, templateId))
-        return(self.exporterTemplates[templateId])
+        return(template)
 
     def getExporterOptionTemplate(self, optionTemplateId):
-        if(not self.exporterOptionTemplates.has_key(optionTemplateId)):
+        optionTemplate = self.exporterOptionTemplates.get(optionTemplateId)
+        if(optionTemplate is None):
             raise Exception('Domain(%d) does not contain Exporter OptionTemplate with Id(%d)' % (self.obsDomainId, optionTemplateId))
-        return(self.exporterOptionTemplates[optionTemplateId])
+        return(optionTemplate)
 
     def getExporterTemplateIds(self):
         return(self.exporterTemplates.keys())
 
+    def getExporterTemplatesSnapshot(self):
+        # consistent (revision, {templateId: template}, {templateId: revision}, {templateId: optionTemplate}),
+        # e.g., to encode the templates from another thread
+        with self.templatesLock:
+            return(self.exporterTemplatesRevision, self.exporterTemplates, self.exporterTemplateRevisions,
+                   self.exporterOptionTemplates)
+
+    # Revisions let the Exporter know when its cached encoding of the templates is stale.
+    # Called with templatesLock held; the revisions table is replaced like the templates one.
+    def _touchExporterTemplate(self, templateId, removed=False):
+        exporterTemplateRevisions = dict(self.exporterTemplateRevisions)
+        if(removed):
+            exporterTemplateRevisions.pop(templateId, None)
+        else:
+            exporterTemplateRevisions[templateId] = self.exporterTemplatesRevision + 1
+        self.exporterTemplateRevisions = exporterTemplateRevisions
+        self.exporterTemplatesRevision += 1
+
+    def getExporterTemplatesRevision(self):
+        return(self.exporterTemplatesRevision)
+
+    def getExporterTemplateRevision(self, templateId):
+        return(self.exporterTemplateRevisions.get(templateId))
+
     def getExporterOptionTemplateIds(self):
         return(self.exporterOptionTemplates.keys())
 
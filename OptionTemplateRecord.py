@@ -22,26 +22,48 @@
 # +-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+
 
 import struct, json
+from Lib.ParameterChecking import checkInteger, checkType
 from FieldSpecifier import FieldSpecifier
+from TemplateRecord import TemplateRecord
+from Interning import internTemplateRecord
 
-class OptionTemplateRecord(object):
+class OptionTemplateRecord(TemplateRecord):
+    # The first scopeFieldCount fields are the scope of the options (e.g., ingressInterface), the
+    # rest the attributes reported for that scope (e.g., interfaceName).
     _str = struct.Struct('!HHH')
     
     def __init__(self):
-        self.templateId = None
-        self.fieldCount = None
+        TemplateRecord.__init__(self)
         self.scopeFieldCount = None
-        self.fields = []
-        self.scopeFields = []
-    
+        self.scopeFields = ()
+
     @classmethod
-    def read(cls, rawData):
+    def create(cls, templateId, scopeFields, fields):
+        checkInteger('templateId', templateId, 1)
+        checkType('scopeFields', (list, tuple), scopeFields)
+        checkType('fields', (list, tuple), fields)
+        if(len(scopeFields) == 0): raise Exception('Options Template Id (%d) has no scope fields' % (templateId))
+        for field in list(scopeFields) + list(fields):
+            checkType('field', (FieldSpecifier,), field)
+        
         obj = cls()
-        cls._readHeader(rawData, obj)
-        for _ in xrange(0, obj.fieldCount):
-            field = FieldSpecifier.read(rawData)
-            obj.fields.append(field)
-        return(obj)
+        obj.templateId = templateId
+        obj.scopeFieldCount = len(scopeFields)
+        obj._setLayout(list(scopeFields) + list(fields))
+        return(internTemplateRecord(obj))
+
+    def _setLayout(self, fields):
+        TemplateRecord._setLayout(self, fields)
+        self.scopeFields = self.fields[:self.scopeFieldCount]
+
+    def _getInternKey(self):
+        return((self.templateId, self.scopeFieldCount, self.layout.key))
+
+    @classmethod
+    def newFromJSON(cls, templateId, scopeFields, fields):
+        checkInteger('templateId', templateId, 1)
+        fields_ = TemplateRecord.checkJSON(list(scopeFields) + list(fields))
+        return(OptionTemplateRecord.create(templateId, fields_[:len(scopeFields)], fields_[len(scopeFields):]))
     
     @classmethod
     def _readHeader(cls, rawData, obj):
@@ -63,22 +85,17 @@ class OptionTemplateRecord(object):
             length += field._computeLength()
         return(length)
 
+    def getNumScopeFields(self): return(self.scopeFieldCount)
+    def getScopeNames(self): return(self.layout.names[:self.scopeFieldCount])
+
     def _writeHeader(self, rawData):
-        rawData.write(OptionTemplateRecord._str.pack(self.templateId, self.fieldCount))
-    
-    def write(self, rawData):
-        self._writeHeader(rawData)
-        for field in self.fields:
-            field.write(rawData)
+        rawData.write(OptionTemplateRecord._str.pack(self.templateId, self.fieldCount, self.scopeFieldCount))
 
     def toJSON(self):
         return({
             'templateId': self.templateId,
             #'fieldCount': self.fieldCount,
             #'scopeFieldCount': self.scopeFieldCount,
-            'fields': map(lambda s: s.toJSON(), self.fields),
+            'fields': map(lambda s: s.toJSON(), self.fields[self.scopeFieldCount:]),
             'scopeFields': map(lambda s: s.toJSON(), self.scopeFields)
         })
-    
-    def __str__(self):
-        return(json.dumps(self.toJSON()))
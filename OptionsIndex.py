@@ -0,0 +1,53 @@
+import threading
+
+class OptionsIndex(object):
+    # Options Data Records of an ObservationDomain indexed by the values of their scope fields,
+    # e.g., ('ingressInterface',) => {(7,): {'interfaceName': 'eth0', ...}}.
+    # There is one table per set of scope field names, whatever the Options Template that
+    # reported them, so lookups and enrichments are a single dict access. Newer records replace
+    # older ones with the same scope. Writers are serialized; readers take no locks.
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__tables = {}  # scopeNames => {scopeValues: {attributeName: value}}
+
+    def getScopes(self): return(self.__tables.keys())
+
+    def getStats(self):
+        return(dict([(','.join(scopeNames), len(table)) for scopeNames,table in self.__tables.items()]))
+
+    def update(self, template, records):
+        scopeNames = template.getScopeNames()
+        entries = []
+        for record in records:
+            attributes = dict([(value.field.name, value.value) for value in record.values])
+            scopeValues = tuple([attributes.pop(name) for name in scopeNames])
+            entries.append((scopeValues, attributes))
+        with self.__lock:
+            table = self.__tables.get(scopeNames)
+            if(table is None):
+                table = {}
+                self.__tables[scopeNames] = table
+            for scopeValues,attributes in entries:
+                table[scopeValues] = attributes
+
+    def lookup(self, scopeNames, scopeValues):
+        # returns the attributes reported for the scope, or None
+        table = self.__tables.get(tuple(scopeNames))
+        if(table is None): return(None)
+        return(table.get(tuple(scopeValues)))
+
+    def enrich(self, values, scopeNames, keyNames=None, prefix=''):
+        # Adds to the dict of values of a record the attributes reported for its scope. The scope
+        # is taken from keyNames (defaults to scopeNames), e.g., keyNames=('egressInterface',)
+        # and prefix='egress' to add egressInterfaceName from the ('ingressInterface',) table.
+        # Values already in the record are kept. Returns whether the scope was found.
+        table = self.__tables.get(tuple(scopeNames))
+        if(table is None): return(False)
+        if(keyNames is None): keyNames = scopeNames
+        attributes = table.get(tuple([values.get(name) for name in keyNames]))
+        if(attributes is None): return(False)
+        for name,value in attributes.iteritems():
+            if(len(prefix) > 0): name = prefix + name[0].upper() + name[1:]
+            if(name not in values): values[name] = value
+        return(True)
@@ -0,0 +1,165 @@
+import threading, time, logging, collections
+from Lib.ParameterChecking import checkType, checkAttr, checkFloat, checkInteger
+
+class Pacer(object):
+    # Token bucket shaping the output of one Exporter (or of all the Exporters of a pool) to a
+    # sustained rate of packets and/or bytes per second. Messages that find the bucket empty
+    # are queued, up to maxQueueBytes, and sent by a background thread as tokens become
+    # available; messages not fitting in the queue are dropped.
+
+    def __init__(self):
+        self.__configured = False
+        self.__running = False
+        self.__packetsPerSecond = None
+        self.__bytesPerSecond = None
+        self.__maxQueueBytes = None
+        self.__maxPacketTokens = None
+        self.__maxByteTokens = None
+        self.__packetTokens = None
+        self.__byteTokens = None
+        self.__lastRefill = None
+        self.__queue = collections.deque() # (sendFunction, data)
+        self.__queueBytes = 0
+        self.__condition = threading.Condition()
+        self.__thread = None
+        self.__stats = {'sent': 0, 'queued': 0, 'delayed': 0, 'dropped': 0, 'discarded': 0}
+
+    @staticmethod
+    def checkConfiguration(config):
+        checkType('config', (dict,), config)
+        packetsPerSecond = config.get('packetsPerSecond')
+        bytesPerSecond = config.get('bytesPerSecond')
+        if((packetsPerSecond is None) and (bytesPerSecond is None)):
+            raise Exception('Pacing requires packetsPerSecond and/or bytesPerSecond')
+        if(packetsPerSecond is not None): checkFloat('packetsPerSecond', packetsPerSecond, 1)
+        if(bytesPerSecond is not None): checkFloat('bytesPerSecond', bytesPerSecond, 1)
+        checkInteger('maxQueueBytes', checkAttr('maxQueueBytes', config), 0)
+        if(('burstTime' in config) and (config['burstTime'] is not None)):
+            checkFloat('burstTime', config['burstTime'], 0.001, 60)
+
+    def configure(self, config):
+        Pacer.checkConfiguration(config)
+        burstTime = config.get('burstTime')
+        if(burstTime is None): burstTime = 0.1
+        self.__packetsPerSecond = config.get('packetsPerSecond')
+        self.__bytesPerSecond = config.get('bytesPerSecond')
+        self.__maxQueueBytes = config['maxQueueBytes']
+        if(self.__packetsPerSecond is not None):
+            self.__maxPacketTokens = max(1.0, self.__packetsPerSecond * burstTime)
+            self.__packetTokens = self.__maxPacketTokens
+        if(self.__bytesPerSecond is not None):
+            self.__maxByteTokens = max(1.0, self.__bytesPerSecond * burstTime)
+            self.__byteTokens = self.__maxByteTokens
+        self.__lastRefill = time.time()
+        self.__configured = True
+
+    def isConfigured(self): return(self.__configured)
+    def isRunning(self): return(self.__running)
+
+    def getStats(self):
+        with self.__condition:
+            stats = dict(self.__stats)
+            stats['queueLength'] = len(self.__queue)
+            stats['queueBytes'] = self.__queueBytes
+        return(stats)
+
+    def start(self):
+        if(not self.__configured): return
+        if(self.__running): return
+        self.__running = True
+        self.__thread = threading.Thread(target=self._run)
+        self.__thread.setDaemon(True)
+        self.__thread.start()
+
+    def stop(self):
+        # pending messages are still sent, at the configured rate, before stopping
+        with self.__condition:
+            if(not self.__running): return
+            self.__running = False
+            self.__condition.notify()
+        self.__thread.join()
+        self.__thread = None
+
+    def _refill(self, now):
+        elapsed = now - self.__lastRefill
+        self.__lastRefill = now
+        if(elapsed <= 0): return
+        if(self.__packetsPerSecond is not None):
+            self.__packetTokens = min(self.__maxPacketTokens, self.__packetTokens + elapsed * self.__packetsPerSecond)
+        if(self.__bytesPerSecond is not None):
+            self.__byteTokens = min(self.__maxByteTokens, self.__byteTokens + elapsed * self.__bytesPerSecond)
+
+    def _waitTime(self, length):
+        # time until the tokens for a message of the given length are available (0 if already are)
+        waitTime = 0.0
+        if(self.__packetsPerSecond is not None):
+            waitTime = max(waitTime, (1.0 - self.__packetTokens) / self.__packetsPerSecond)
+        if(self.__bytesPerSecond is not None):
+            required = min(length, self.__maxByteTokens) # messages bigger than the bucket go when it is full
+            waitTime = max(waitTime, (required - self.__byteTokens) / self.__bytesPerSecond)
+        return(waitTime)
+
+    def _consume(self, length):
+        if(self.__packetsPerSecond is not None): self.__packetTokens -= 1.0
+        if(self.__bytesPerSecond is not None): self.__byteTokens -= length
+
+    def send(self, sendFunction, data):
+        with self.__condition:
+            self._refill(time.time())
+            if((len(self.__queue) == 0) and (self._waitTime(len(data)) <= 0)):
+                self._consume(len(data))
+                self.__stats['sent'] += 1
+            else:
+                if(self.__queueBytes + len(data) > self.__maxQueueBytes):
+                    self.__stats['dropped'] += 1
+                    return(False)
+                self.__queue.append((sendFunction, data))
+                self.__queueBytes += len(data)
+                self.__stats['queued'] += 1
+                self.__condition.notify()
+                return(True)
+        sendFunction(data)
+        return(True)
+
+    def discard(self, sendFunction):
+        # drops the queued messages of sendFunction, e.g., of an exporter leaving a shared pacer
+        with self.__condition:
+            queue = collections.deque([entry for entry in self.__queue if entry[0] != sendFunction])
+            numDiscarded = len(self.__queue) - len(queue)
+            if(numDiscarded == 0): return(0)
+            self.__queue = queue
+            self.__queueBytes = sum([len(data) for _,data in queue])
+            self.__stats['discarded'] += numDiscarded
+            self.__condition.notify()
+        return(numDiscarded)
+
+    def _nextMessage(self):
+        with self.__condition:
+            while(True):
+                if(len(self.__queue) == 0):
+                    if(not self.__running): return(None)
+                    self.__condition.wait()
+                    continue
+                self._refill(time.time())
+                sendFunction, data = self.__queue[0]
+                waitTime = self._waitTime(len(data))
+                if(waitTime > 0):
+                    self.__condition.wait(waitTime)
+                    continue
+                self.__queue.popleft()
+                self.__queueBytes -= len(data)
+                self._consume(len(data))
+                self.__stats['sent'] += 1
+                self.__stats['delayed'] += 1
+                return(sendFunction, data)
+
+    def _run(self):
+        logger = logging.getLogger(__name__)
+        while(True):
+            message = self._nextMessage()
+            if(message is None): return
+            sendFunction, data = message
+            try:
+                sendFunction(data)
+            except Exception as e:
+                logger.exception(e)
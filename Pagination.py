@@ -0,0 +1,194 @@
+# Pagination of subTemplateLists (UPC PEN fields stlPaginationIndex/stlPaginationTotal).
+# A template is paginated when it has both pagination fields and a single subTemplateList.
+# Exporters split the records whose list does not fit in a message (or in the 65535 bytes of
+# a variable-length field) into pages: records with the same values in the other fields, each
+# carrying part of the list. Collectors reassemble the pages of a logical record, keyed by the
+# template and the values of its other fields, and deliver it once all its pages arrived.
+
+import time, threading, collections
+from DataRecord import DataRecord
+from FieldValue import FieldValue
+
+PAGINATION_INDEX = 'stlPaginationIndex'
+PAGINATION_TOTAL = 'stlPaginationTotal'
+LIST_TYPES = ('basicList', 'subTemplateList', 'subTemplateMultiList')
+
+class PaginationLayout(object):
+    # positions of the fields in the records read from the wire (paddingOctets skipped)
+    def __init__(self, listName, listIndex, pageIndex, pageTotal, keyIndexes):
+        self.listName = listName
+        self.listIndex = listIndex
+        self.pageIndex = pageIndex
+        self.pageTotal = pageTotal
+        self.keyIndexes = keyIndexes
+
+def compilePagination(fields):
+    # returns the PaginationLayout of the fields of a template, or None if not paginated
+    positions = {}
+    listNames = []
+    keyIndexes = []
+    index = 0
+    for field in fields:
+        if(field.name == 'paddingOctets'): continue
+        positions[field.name] = index
+        if(field.type == 'subTemplateList'): listNames.append(field.name)
+        elif((field.type not in LIST_TYPES) and (field.name not in (PAGINATION_INDEX, PAGINATION_TOTAL))):
+            keyIndexes.append(index)
+        index += 1
+    if((PAGINATION_INDEX not in positions) or (PAGINATION_TOTAL not in positions)): return(None)
+    if(len(listNames) != 1): return(None)
+    return(PaginationLayout(listNames[0], positions[listNames[0]], positions[PAGINATION_INDEX],
+                            positions[PAGINATION_TOTAL], tuple(keyIndexes)))
+
+def paginate(template, values, maxRecordLength, validate=True):
+    # Returns the DataRecords (pages) carrying the values of a logical record, each of them
+    # at most maxRecordLength bytes long; a single page when everything fits.
+    # validate=False skips the validation of values already validated, e.g., those of a DataRecord.
+    from ADT_SubTemplateList import ADT_SubTemplateList
+    pagination = template.layout.getPagination()
+    if(pagination is None):
+        raise Exception('Template(%d) does not support pagination' % template.getId())
+    subTemplateList = values[pagination.listName]
+    records = subTemplateList.getRecords()
+
+    def newPage(pageRecords, index, total):
+        pageList = ADT_SubTemplateList.create(subTemplateList.getSemantic(), subTemplateList.getTemplate())
+        pageList.records = pageRecords
+        pageValues = dict(values)
+        pageValues[pagination.listName] = pageList
+        pageValues[PAGINATION_INDEX] = index
+        pageValues[PAGINATION_TOTAL] = total
+        return(pageValues)
+
+    # room left for the content of the list; 2 extra bytes in case its length needs 3 bytes
+    emptyLength = DataRecord.create(template, newPage([], 0, 1), validate=False)._computeLength()
+    maxContentLength = min(maxRecordLength - emptyLength - 2, 65535 - 3)
+    pages = []
+    pageRecords = []
+    contentLength = 0
+    for record in records:
+        recordLength = record._computeLength()
+        if(recordLength > maxContentLength):
+            raise Exception('Record of Template(%d) does not fit in a page of %d bytes' % (
+                            subTemplateList.getTemplateId(), maxRecordLength))
+        if((len(pageRecords) > 0) and (contentLength + recordLength > maxContentLength)):
+            pages.append(pageRecords)
+            pageRecords = []
+            contentLength = 0
+        pageRecords.append(record)
+        contentLength += recordLength
+    pages.append(pageRecords)
+    return([DataRecord.create(template, newPage(pages[i], i, len(pages)), validate) for i in xrange(len(pages))])
+
+class PageReassembly(object):
+    # Bounded buffer of the pages of the logical records not received completely yet. Records
+    # whose first page is older than timeout seconds are dropped, when pages arrive and by
+    # expire(), which collectors call periodically. The oldest records are dropped as well when
+    # more than maxPending records are incomplete or their pages take more than maxBytes.
+
+    def __init__(self, maxPending, timeout, maxBytes=None):
+        self.__maxPending = maxPending
+        self.__timeout = timeout
+        self.__maxBytes = maxBytes
+        self.__pending = collections.OrderedDict() # (templateId, key) => [firstTime, total, {index: page}, bytes]
+        self.__bytes = 0
+        self.__lock = threading.Lock()
+        self.__stats = {'pages': 0, 'reassembled': 0, 'droppedExpired': 0, 'droppedOverflow': 0, 'droppedInvalid': 0}
+
+    def __len__(self): return(len(self.__pending))
+
+    def getStats(self):
+        stats = dict(self.__stats)
+        stats['pending'] = len(self.__pending)
+        stats['bytes'] = self.__bytes
+        return(stats)
+
+    def add(self, template, records, now=None):
+        # returns the records to deliver: complete logical records, in the order their last page arrived
+        pagination = template.layout.getPagination()
+        if(pagination is None): return(records)
+        if(now is None): now = time.time()
+        delivered = []
+        with self.__lock:
+            self._expire(now)
+            for record in records:
+                values = record.values
+                total = values[pagination.pageTotal].value
+                if(total <= 1):
+                    delivered.append(record)
+                    continue
+                self.__stats['pages'] += 1
+                key = (record.templateId, tuple([values[index].value for index in pagination.keyIndexes]))
+                record = self._addPage(pagination, key, values[pagination.pageIndex].value, total, record, now)
+                if(record is not None): delivered.append(record)
+        return(delivered)
+
+    def _drop(self, key):
+        entry = self.__pending.pop(key)
+        self.__bytes -= entry[3]
+        return(entry)
+
+    def _dropOldest(self):
+        self._drop(next(iter(self.__pending)))
+        self.__stats['droppedOverflow'] += 1
+
+    def _addPage(self, pagination, key, index, total, page, now):
+        entry = self.__pending.get(key)
+        if((entry is not None) and (entry[1] != total)):
+            self._drop(key)
+            self.__stats['droppedInvalid'] += 1
+            entry = None
+        if(index >= total):
+            self.__stats['droppedInvalid'] += 1
+            return(None)
+        pageBytes = page._computeLength()
+        if((self.__maxBytes is not None) and (pageBytes > self.__maxBytes)):
+            if(entry is not None): self._drop(key)
+            self.__stats['droppedOverflow'] += 1
+            return(None)
+        if(entry is not None):
+            previous = entry[2].pop(index, None) # retransmitted page
+            if(previous is not None):
+                entry[3] -= previous._computeLength()
+                self.__bytes -= previous._computeLength()
+        if(self.__maxBytes is not None):
+            # the record of the page may be dropped too, when it is the oldest one
+            while(self.__bytes + pageBytes > self.__maxBytes): self._dropOldest()
+            entry = self.__pending.get(key)
+        if(entry is None):
+            while(len(self.__pending) >= self.__maxPending): self._dropOldest()
+            entry = [now, total, {}, 0]
+            self.__pending[key] = entry
+        entry[2][index] = page
+        entry[3] += pageBytes
+        self.__bytes += pageBytes
+        if(len(entry[2]) < total): return(None)
+        self._drop(key)
+        self.__stats['reassembled'] += 1
+        return(self._merge(pagination, [entry[2][i] for i in xrange(total)]))
+
+    def _merge(self, pagination, pages):
+        from ADT_SubTemplateList import ADT_SubTemplateList
+        first = pages[0]
+        lists = [page.values[pagination.listIndex].value for page in pages]
+        mergedList = ADT_SubTemplateList.concatenate(lists)
+        listValue = FieldValue()
+        listValue.field = first.values[pagination.listIndex].field
+        listValue.value = mergedList
+        listValue.length = mergedList._computeLength()
+        record = DataRecord()
+        record.templateId = first.templateId
+        record.values = list(first.values)
+        record.values[pagination.listIndex] = listValue
+        return(record)
+
+    def expire(self, now=None):
+        if(now is None): now = time.time()
+        with self.__lock: self._expire(now)
+
+    def _expire(self, now):
+        while(len(self.__pending) > 0):
+            key, entry = next(self.__pending.iteritems())
+            if(now - entry[0] <= self.__timeout): break
+            self._drop(key)
+            self.__stats['droppedExpired'] += 1
@@ -0,0 +1,179 @@
+import multiprocessing
+from cStringIO import StringIO
+from Lib.ParameterChecking import checkType, checkInteger
+from TemplateRecord import TemplateRecord
+from OptionTemplateRecord import OptionTemplateRecord
+from DataRecord import DataRecord
+from Message import Message
+from Set import Set
+
+# Worker side: templates are shipped once, when the worker starts, and cached here
+_workerTemplates = {}
+_workerMaxSetLength = None
+
+def _initWorker(templates, maxSetLength):
+    global _workerTemplates, _workerMaxSetLength
+    _workerTemplates = {}
+    for templateKey,template in templates.iteritems():
+        if('scopeFields' in template):
+            _workerTemplates[templateKey] = OptionTemplateRecord.newFromJSON(
+                template['templateId'], template['scopeFields'], template['fields'])
+        else:
+            _workerTemplates[templateKey] = TemplateRecord.newFromJSON(template['templateId'], template['fields'])
+    _workerMaxSetLength = maxSetLength
+
+def _writeDataSet(setId, recordsData):
+    wfile = StringIO()
+    Set.writeRaw(setId, ''.join(recordsData), wfile)
+    return(wfile.getvalue())
+
+def _encodeChunk(task):
+    # Encodes the values of a chunk in DataSets fitting in maxSetLength; returns [(setData, numRecords), ...]
+    # Whether each record is validated was decided by the ValidationPolicy of its domain, in the parent.
+    templateKey, valuesList = task
+    template = _workerTemplates[templateKey]
+    setId = template.getId()
+    dataSets = []
+    recordsData = []
+    setLength = Set._str.size
+    for values,validate in valuesList:
+        wfile = StringIO()
+        DataRecord.create(template, values, validate).write(wfile)
+        recordData = wfile.getvalue()
+        if((len(recordsData) > 0) and (setLength + len(recordData) > _workerMaxSetLength)):
+            dataSets.append((_writeDataSet(setId, recordsData), len(recordsData)))
+            recordsData = []
+            setLength = Set._str.size
+        recordsData.append(recordData)
+        setLength += len(recordData)
+    if(len(recordsData) > 0):
+        dataSets.append((_writeDataSet(setId, recordsData), len(recordsData)))
+    return(dataSets)
+
+class ParallelEncoder(object):
+    # Opt-in encoding of large batches of records on a pool of processes. Batches are split in
+    # per-template chunks that workers encode into DataSets; the parent packs the DataSets into
+    # messages and sends them through the Exporter, which assigns the sequence numbers.
+    # Values must be picklable; structured values (basicList, subTemplateList) are not supported.
+    # The pool is restarted when the exporter templates change, to ship the new ones.
+
+    def __init__(self, exporter):
+        from Exporter import Exporter
+        checkType('exporter', (Exporter,), exporter)
+        self.__exporter = exporter
+        self.__configured = False
+        self.__running = False
+        self.__processes = None
+        self.__chunkSize = None
+        self.__pool = None
+        self.__templatesRevision = None
+        self.__templateKeys = None     # (obsDomId, templateId) of the (Option)Templates shipped to the workers
+
+    @staticmethod
+    def checkConfiguration(config):
+        checkType('config', (dict,), config)
+        if(('processes' in config) and (config['processes'] is not None)):
+            checkInteger('processes', config['processes'], 1)
+        if(('chunkSize' in config) and (config['chunkSize'] is not None)):
+            checkInteger('chunkSize', config['chunkSize'], 1)
+
+    def configure(self, config):
+        ParallelEncoder.checkConfiguration(config)
+        self.__processes = config.get('processes') # None stands for the number of cores
+        self.__chunkSize = config.get('chunkSize')
+        if(self.__chunkSize is None): self.__chunkSize = 1000
+        self.__configured = True
+
+    def isConfigured(self): return(self.__configured)
+    def isRunning(self): return(self.__running)
+
+    def start(self):
+        if(not self.__configured): return
+        if(self.__running): return
+        self._startPool()
+        self.__running = True
+
+    def stop(self):
+        if(not self.__running): return
+        self._stopPool()
+        self.__running = False
+
+    def _getTemplatesRevision(self):
+        session = self.__exporter.getSession()
+        return(tuple(sorted([(obsDomId, session.getDomain(obsDomId).getExporterTemplatesRevision())
+                             for obsDomId in session.getDomainIds()])))
+
+    def _startPool(self):
+        session = self.__exporter.getSession()
+        templates = {}
+        revisions = []
+        for obsDomId in session.getDomainIds():
+            revision, domainTemplates, _, domainOptionTemplates = session.getDomain(obsDomId).getExporterTemplatesSnapshot()
+            for templateId,template in domainTemplates.items() + domainOptionTemplates.items():
+                templates[(obsDomId, templateId)] = template.toJSON()
+            revisions.append((obsDomId, revision))
+        maxSetLength = self.__exporter.getMaxMessageSize() - Message._str.size - 3 # room for set padding
+        self.__templatesRevision = tuple(sorted(revisions))
+        self.__templateKeys = frozenset(templates.keys())
+        self.__pool = multiprocessing.Pool(self.__processes, _initWorker, (templates, maxSetLength))
+
+    def _stopPool(self):
+        self.__pool.close()
+        self.__pool.join()
+        self.__pool = None
+
+    def encode(self, batch):
+        # batch: [(obsDomId, templateId, values), ...]
+        # returns: [(obsDomId, setsData, numDataRecords), ...], one entry per message
+        if(not self.__running): raise Exception('ParallelEncoder is not running')
+        if(self._getTemplatesRevision() != self.__templatesRevision):
+            self._stopPool()
+            self._startPool()
+
+        session = self.__exporter.getSession()
+        domains = {}
+        chunks = {}
+        chunkKeys = []
+        for obsDomId,templateId,values in batch:
+            templateKey = (obsDomId, templateId)
+            if(templateKey not in chunks):
+                if(templateKey not in self.__templateKeys):
+                    raise Exception('Exporter domain(%d) does not contain Template(%d)' % (obsDomId, templateId))
+                chunks[templateKey] = []
+                chunkKeys.append(templateKey)
+            domain = domains.get(obsDomId)
+            if(domain is None):
+                domain = session.getDomain(obsDomId)
+                domains[obsDomId] = domain
+            chunks[templateKey].append((values, domain.shouldValidate()))
+
+        tasks = []
+        for templateKey in chunkKeys:
+            valuesList = chunks[templateKey]
+            for i in xrange(0, len(valuesList), self.__chunkSize):
+                tasks.append((templateKey, valuesList[i:i+self.__chunkSize]))
+        results = self.__pool.map(_encodeChunk, tasks)
+
+        maxSetsLength = self.__exporter.getMaxMessageSize() - Message._str.size
+        messages = []
+        current = {} # obsDomId => [setsData, numDataRecords, length]
+        for (templateKey,_),dataSets in zip(tasks, results):
+            obsDomId = templateKey[0]
+            for setData,numRecords in dataSets:
+                message = current.get(obsDomId)
+                if((message is not None) and (message[2] + len(setData) > maxSetsLength)):
+                    messages.append((obsDomId, ''.join(message[0]), message[1]))
+                    message = None
+                if(message is None):
+                    message = [[], 0, 0]
+                    current[obsDomId] = message
+                message[0].append(setData)
+                message[1] += numRecords
+                message[2] += len(setData)
+        for obsDomId,message in current.iteritems():
+            messages.append((obsDomId, ''.join(message[0]), message[1]))
+        return(messages)
+
+    def export(self, batch):
+        for obsDomId,setsData,numDataRecords in self.encode(batch):
+            self.__exporter.sendRawMessage(obsDomId, setsData, numDataRecords=numDataRecords)
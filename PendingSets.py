@@ -0,0 +1,92 @@
+import time, threading, collections
+
+class PendingSets(object):
+    # Bounded buffer of the raw DataSets an ObservationDomain received before their Template
+    # (e.g., after a collector restart or when UDP reorders messages). Sets are kept in arrival
+    # order in a deque; the oldest ones are dropped when maxBytes is exceeded or when they are
+    # older than maxAge seconds. Once the Template arrives, its sets are popped to be decoded.
+
+    def __init__(self, maxBytes, maxAge):
+        self.__maxBytes = maxBytes
+        self.__maxAge = maxAge
+        self.__sets = collections.deque()  # [receivedTime, setId, exportTimeUTC, sequenceNumber, setData]
+        self.__setIds = {}                  # setId => number of buffered sets
+        self.__bytes = 0
+        self.__lock = threading.Lock()
+        self.__stats = {'buffered': 0, 'replayed': 0, 'droppedOverflow': 0, 'droppedExpired': 0}
+
+    def __len__(self): return(len(self.__sets))
+
+    def getStats(self):
+        stats = dict(self.__stats)
+        stats['sets'] = len(self.__sets)
+        stats['bytes'] = self.__bytes
+        return(stats)
+
+    def has(self, setId): return(setId in self.__setIds)
+
+    def _popOldest(self):
+        entry = self.__sets.popleft()
+        self._forget(entry)
+        return(entry)
+
+    def _forget(self, entry):
+        setId = entry[1]
+        self.__bytes -= len(entry[4])
+        count = self.__setIds[setId] - 1
+        if(count == 0):
+            del self.__setIds[setId]
+        else:
+            self.__setIds[setId] = count
+
+    def add(self, setId, setData, exportTimeUTC, sequenceNumber, now=None):
+        if(now is None): now = time.time()
+        with self.__lock:
+            return(self._add(setId, setData, exportTimeUTC, sequenceNumber, now))
+
+    def _add(self, setId, setData, exportTimeUTC, sequenceNumber, now):
+        self._expire(now)
+        if(len(setData) > self.__maxBytes):
+            self.__stats['droppedOverflow'] += 1
+            return(False)
+        while(self.__bytes + len(setData) > self.__maxBytes):
+            self._popOldest()
+            self.__stats['droppedOverflow'] += 1
+        self.__sets.append([now, setId, exportTimeUTC, sequenceNumber, setData])
+        self.__setIds[setId] = self.__setIds.get(setId, 0) + 1
+        self.__bytes += len(setData)
+        self.__stats['buffered'] += 1
+        return(True)
+
+    def expire(self, now=None):
+        if(now is None): now = time.time()
+        with self.__lock: self._expire(now)
+
+    def _expire(self, now):
+        while((len(self.__sets) > 0) and (now - self.__sets[0][0] > self.__maxAge)):
+            self._popOldest()
+            self.__stats['droppedExpired'] += 1
+
+    def pop(self, setIds, now=None):
+        # returns the buffered sets of the given setIds, in arrival order, as
+        # [(setId, exportTimeUTC, sequenceNumber, setData), ...]
+        if(now is None): now = time.time()
+        with self.__lock:
+            self._expire(now)
+            return(self._pop(setIds))
+
+    def _pop(self, setIds):
+        setIds = [setId for setId in setIds if setId in self.__setIds]
+        if(len(setIds) == 0): return([])
+        setIds = set(setIds)
+        popped = []
+        kept = collections.deque()
+        for entry in self.__sets:
+            if(entry[1] in setIds):
+                self._forget(entry)
+                popped.append(tuple(entry[1:]))
+            else:
+                kept.append(entry)
+        self.__sets = kept
+        self.__stats['replayed'] += len(popped)
+        return(popped)
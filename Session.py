@@ -1,6 +1,8 @@
-import logging
+import logging, threading, time
 from Lib.Handlers.Callbacks import Callbacks as CallbacksHandler
 from ObservationDomain import ObservationDomain
+from TransportSessions import TransportSessions
+from TemplateStore import TemplateBudget
 from Lib.ParameterChecking import checkType
 
 class Session(CallbacksHandler):
@@ -12,14 +14,163 @@ class Session(CallbacksHandler):
     def __init__(self):
         CallbacksHandler.__init__(self, Session.CALLBACK_KINDS)
         self.obsDomains = {}
+        self.domainsLock = threading.Lock()
+        self.transportSessions = None
+        self.templateBudget = TemplateBudget()
+        self.templateLifetime = None
+        self.pendingSetsMaxBytes = None
+        self.pendingSetsMaxAge = None
+        self.pageReassemblyMaxPending = None
+        self.pageReassemblyTimeout = None
+        self.pageReassemblyMaxBytes = None
+        self.validationPolicy = None
+
+    def configureTemplateStore(self, maxBytes, lifetime):
+        # maxBytes bounds the collector templates of all the domains together; applies to the
+        # domains created from now on
+        self.templateBudget = TemplateBudget(maxBytes)
+        self.templateLifetime = lifetime
+
+    def getTemplateBudget(self): return(self.templateBudget)
+
+    def expire(self, now=None):
+        # periodic sweep, e.g., from the Collector: releases expired templates, idle transport
+        # sessions and buffered sets and pages older than their timeouts
+        if(now is None): now = time.time()
+        if(self.transportSessions is not None):
+            self.transportSessions.evictIdle(now)
+        for domain in self.getAllDomains():
+            domain.expireCollectorTemplates(now)
+            pendingSets = domain.getPendingSets()
+            if(pendingSets is not None): pendingSets.expire(now)
+            pageReassembly = domain.getPageReassembly()
+            if(pageReassembly is not None): pageReassembly.expire(now)
+
+    def configurePendingSets(self, maxBytes, maxAge):
+        # applies to the domains created from now on; maxBytes=None disables the buffering
+        self.pendingSetsMaxBytes = maxBytes
+        self.pendingSetsMaxAge = maxAge
+
+    def configurePageReassembly(self, maxPending, timeout, maxBytes=None):
+        # applies to the domains created from now on; maxPending=None delivers the pages as they are
+        self.pageReassemblyMaxPending = maxPending
+        self.pageReassemblyTimeout = timeout
+        self.pageReassemblyMaxBytes = maxBytes
+
+    def setValidationPolicy(self, validationPolicy):
+        # applies to the existing domains and to the ones created from now on; None validates everything
+        self.validationPolicy = validationPolicy
+        for domain in self.getAllDomains():
+            domain.setValidationPolicy(validationPolicy)
+
+    def getValidationPolicy(self): return(self.validationPolicy)
+
+    def _createDomain(self, obsDomainId):
+        domain = ObservationDomain(obsDomainId, templateLifetime=self.templateLifetime,
+                                   templateBudget=self.templateBudget)
+        domain.setValidationPolicy(self.validationPolicy)
+        if(self.pendingSetsMaxBytes is not None):
+            domain.configurePendingSets(self.pendingSetsMaxBytes, self.pendingSetsMaxAge)
+        if(self.pageReassemblyMaxPending is not None):
+            domain.configurePageReassembly(self.pageReassemblyMaxPending, self.pageReassemblyTimeout,
+                                           self.pageReassemblyMaxBytes)
+        return(domain)
     
+    def configureTransportSessions(self, maxSessions, idleTimeout):
+        # Once configured, messages read with a client address get their own domains per
+        # (clientAddress, clientPort, obsDomainId) instead of sharing the ones of this Session
+        self.transportSessions = TransportSessions(self._newTransportDomain, maxSessions, idleTimeout,
+                                                   domainRelease=lambda domain: domain.releaseCollectorTemplates())
+
+    def _newTransportDomain(self, obsDomainId):
+        # templates configured statically in the Session apply to every transport session
+        domain = self._createDomain(obsDomainId)
+        configuredDomain = self.obsDomains.get(obsDomainId)
+        if(configuredDomain is not None):
+            for templateId in configuredDomain.getCollectorTemplateIds():
+                if(not configuredDomain.hasCollectorTemplate(templateId)): continue
+                domain.updateCollectorTemplate(configuredDomain.getCollectorTemplate(templateId), pinned=True)
+            for optionTemplateId in configuredDomain.getCollectorOptionTemplateIds():
+                if(not configuredDomain.hasCollectorOptionTemplate(optionTemplateId)): continue
+                domain.updateCollectorOptionTemplate(configuredDomain.getCollectorOptionTemplate(optionTemplateId), pinned=True)
+        return(domain)
+
+    def getTransportDomain(self, obsDomainId, clientAddress=None, clientPort=None):
+        if((self.transportSessions is None) or (clientAddress is None)):
+            return(self.getDomain(obsDomainId))
+        return(self.transportSessions.get((clientAddress, clientPort, obsDomainId)))
+
+    def getTransportSessionKeys(self):
+        if(self.transportSessions is None): return([])
+        return(self.transportSessions.getKeys())
+
+    def getTransportDomains(self, obsDomainId):
+        # domains of the transport sessions of an Observation Domain, read from a snapshot of the
+        # table: unlike getTransportDomain, it neither keeps them active nor creates them
+        if(self.transportSessions is None): return([])
+        return([domain for key,domain in self.transportSessions.getItems() if key[2] == obsDomainId])
+
+    def getAllDomains(self):
+        domains = self.obsDomains.values()
+        if(self.transportSessions is not None):
+            domains.extend(self.transportSessions.getDomains())
+        return(domains)
+
+    def getSequenceStats(self):
+        # record accounting of the received messages per domain: keyed by obsDomainId, or by
+        # (clientAddress, clientPort, obsDomainId) for the domains of transport sessions
+        sequenceStats = {}
+        for obsDomId,domain in self.obsDomains.items():
+            sequenceStats[obsDomId] = domain.getCollectorSequentiation().getStats()
+        if(self.transportSessions is not None):
+            for transportKey,domain in self.transportSessions.getItems():
+                sequenceStats[transportKey] = domain.getCollectorSequentiation().getStats()
+        return(sequenceStats)
+
+    @staticmethod
+    def _sumStats(totals, stats):
+        for name,value in stats.iteritems():
+            totals[name] = totals.get(name, 0) + value
+
+    def getStats(self):
+        stats = {'domains': len(self.obsDomains), 'templateBudget': self.templateBudget.getStats()}
+        if(self.transportSessions is not None):
+            stats['transportSessions'] = self.transportSessions.getStats()
+        
+        # counters of all the domains, including the ones of transport sessions, are summed up
+        for domain in self.getAllDomains():
+            for kind,kindStats in domain.getCollectorTemplatesStats().iteritems():
+                Session._sumStats(stats.setdefault(kind, {}), kindStats)
+            Session._sumStats(stats.setdefault('sequence', {}), domain.getCollectorSequentiation().getStats())
+            pendingSets = domain.getPendingSets()
+            if(pendingSets is not None):
+                Session._sumStats(stats.setdefault('pendingSets', {}), pendingSets.getStats())
+            pageReassembly = domain.getPageReassembly()
+            if(pageReassembly is not None):
+                Session._sumStats(stats.setdefault('pageReassembly', {}), pageReassembly.getStats())
+        return(stats)
+    
+    def saveCheckpoint(self, filePath):
+        from Checkpoint import Checkpoint
+        Checkpoint.save(self, filePath)
+
+    def loadCheckpoint(self, filePath):
+        # collector templates that would have already expired are not restored
+        from Checkpoint import Checkpoint
+        return(Checkpoint.load(self, filePath, maxAge=self.templateLifetime))
+
     def hasDomain(self, obsDomainId):
         return(self.obsDomains.has_key(obsDomainId))
     
     def getDomain(self, obsDomainId):
-        if(not self.obsDomains.has_key(obsDomainId)):
-            self.obsDomains[obsDomainId] = ObservationDomain(obsDomainId)
-        return(self.obsDomains[obsDomainId])
+        domain = self.obsDomains.get(obsDomainId)
+        if(domain is not None): return(domain)
+        with self.domainsLock:
+            domain = self.obsDomains.get(obsDomainId)
+            if(domain is None):
+                domain = self._createDomain(obsDomainId)
+                self.obsDomains[obsDomainId] = domain
+        return(domain)
 
     def getDomainIds(self):
         return(self.obsDomains.keys())
@@ -29,10 +180,16 @@ class Session(CallbacksHandler):
         logger = logging.getLogger(__name__)
         message = None
         try:
-            message = Message.read(self, rawData)
-            domain = self.getDomain(message.observationDomainId)
-            domain.updateCollectorTemplates(message)
-            domain.updateCollectorOptionTemplates(message)
+            message = Message.read(self, rawData, clientAddress, clientPort)
+            domain = message.domain
+            # templates were installed while reading; sets buffered while they were
+            # unknown are dispatched first, in the order they were received
+            templateIds = []
+            for set_ in message.templateSets + message.optionTemplateSets:
+                templateIds.extend([record.templateId for record in set_.records])
+            for replayedMessage in Message.readPendingSets(self, domain, templateIds):
+                self._runCallbacks(Session.CALLBACK_RECEIVED_MESSAGE, domain, replayedMessage,
+                                   clientAddress, clientPort)
             self._runCallbacks(Session.CALLBACK_RECEIVED_MESSAGE, domain, message,
                                clientAddress, clientPort)
         except Exception as e:
@@ -25,7 +25,9 @@ import struct, logging, json
 from Lib.ParameterChecking import checkType, checkInteger
 from TemplateRecord import TemplateRecord
 from OptionTemplateRecord import OptionTemplateRecord
+from TemplateWithdrawal import TemplateWithdrawal
 from DataRecord import DataRecord
+from DecodingContext import DecodingContext
 from ObservationDomain import ObservationDomain
 
 class Set(object):
@@ -37,6 +39,8 @@ class Set(object):
         self.length = None
         self.padLength = None
         self.records = []
+        self.withdrawals = []
+        self.rawData = None
     
     def __del__(self):
         for r in self.records: del r
@@ -45,6 +49,8 @@ class Set(object):
         del self.length
         del self.padLength
         del self.records
+        del self.withdrawals
+        del self.rawData
 
     @classmethod
     def createTemplateSet(cls):
@@ -68,11 +74,15 @@ class Set(object):
         if(setId == 2): raise Exception('SetId(%d) can only be used in TemplateSets' % setId)
         if(setId == 3): raise Exception('SetId(%d) can only be used in OptionTemplateSets' % setId)
         if((setId >= 4) and (setId <= 255)): raise Exception('Reserved SetId(%d)' % setId)
-        if(not domain.hasExporterTemplate(setId)):
+        if(domain.hasExporterOptionTemplate(setId)):
+            setType = 'optionsData'
+        elif(domain.hasExporterTemplate(setId)):
+            setType = 'data'
+        else:
             raise Exception('Domain(%d) does not contain Exporter Template(%d)' % (domain.obsDomainId, setId))
         obj = cls()
         obj.setId = setId
-        obj.setType = 'data'
+        obj.setType = setType
         return(obj)
     
     @classmethod
@@ -104,22 +114,41 @@ class Set(object):
         obj = cls()
         baseOffset = rawData.tell()
         cls._readHeader(rawData, obj)
-        if(obj.setType == 'template'):
-            while(obj.length - (rawData.tell() - baseOffset) > 4):
-                record = TemplateRecord.read(rawData)
-                obj.records.append(record)
-        elif(obj.setType == 'optionTemplate'):
+        if(obj.setType in ('template', 'optionTemplate')):
+            recordClass = TemplateRecord if(obj.setType == 'template') else OptionTemplateRecord
+            # withdrawals are 4 bytes long; zeroed padding is never a valid withdrawal
+            while(obj.length - (rawData.tell() - baseOffset) >= TemplateWithdrawal._str.size):
+                (templateId, fieldCount) = TemplateWithdrawal.peek(rawData)
+                if(fieldCount != 0):
+                    obj.records.append(recordClass.read(rawData))
+                elif(templateId == 0):
+                    break
+                else:
+                    obj.withdrawals.append(TemplateWithdrawal.read(rawData, obj.setId))
+        elif(domain.hasCollectorOptionTemplate(obj.setId)):
+            obj.setType = 'optionsData'
+            template = domain.getCollectorOptionTemplate(obj.setId)
+            validating, trusted = DecodingContext.newPair(domain)
             while(obj.length - (rawData.tell() - baseOffset) > 4):
-                OptionTemplateRecord.read(rawData)
+                context = validating if(domain.shouldValidate()) else trusted
+                record = DataRecord.read(template, rawData, context, context.validate)
                 obj.records.append(record)
         else:
             if(not domain.hasCollectorTemplate(obj.setId)):
-                logger.warning('Ignoring DataRecord since ObservationDomain(%d) does not contain Collector Template(%d)' % (domain.obsDomainId, obj.setId))
+                if(domain.getPendingSets() is None):
+                    obj.setType = 'ignored'
+                    logger.warning('Ignoring DataRecord since ObservationDomain(%d) does not contain Collector Template(%d)' % (domain.obsDomainId, obj.setId))
+                else:
+                    # kept raw, so the Message can buffer it until the Template arrives
+                    obj.setType = 'pending'
+                    obj.rawData = Set._str.pack(obj.setId, obj.length) + rawData.read(obj.length - Set._str.size)
                 cls._readPadding(rawData, obj, baseOffset)
             else:
                 template = domain.getCollectorTemplate(obj.setId)
+                validating, trusted = DecodingContext.newPair(domain)
                 while(obj.length - (rawData.tell() - baseOffset) > 4):
-                    record = DataRecord.read(template, rawData, domain)
+                    context = validating if(domain.shouldValidate()) else trusted
+                    record = DataRecord.read(template, rawData, context, context.validate)
                     obj.records.append(record)
         cls._readPadding(rawData, obj, baseOffset)
         return(obj)
@@ -150,13 +179,24 @@ class Set(object):
         for record in self.records:
             record.write(rawData)
         self._writePadding(rawData)
+
+    @classmethod
+    def writeRaw(cls, setId, recordsData, rawData):
+        # Writes a set whose records are already encoded
+        length = Set._str.size + len(recordsData)
+        remLength = length % 4
+        padLength = 0 if(remLength == 0) else (4 - remLength)
+        rawData.write(Set._str.pack(setId, length + padLength))
+        rawData.write(recordsData)
+        if(padLength > 0):
+            rawData.write(struct.pack('x'*padLength))
     
     def addRecord(self, record):
         if(self.setType == 'template'):
             checkType('record', (TemplateRecord,), record)
         elif(self.setType == 'optionTemplate'):
             checkType('record', (OptionTemplateRecord,), record)
-        elif(self.setType == 'data'):
+        elif(self.setType in ('data', 'optionsData')):
             checkType('record', (DataRecord,), record)
         else:
             raise Exception('Invalid Set Type(%s)' % str(self.setType))
@@ -173,14 +213,19 @@ class Set(object):
                             index, maxIndex))
         return(self.records[index])
 
+    def getWithdrawals(self): return(self.withdrawals)
+
     def toJSON(self):
-        return({
+        d = {
             'setId': self.setId,
             #'setType': self.setType,
             #'length': self.length,
             #'padLength': self.padLength,
             'records': map(lambda s: s.toJSON(), self.records)
-        })
+        }
+        if(len(self.withdrawals) > 0):
+            d['withdrawals'] = map(lambda s: s.toJSON(), self.withdrawals)
+        return(d)
     
     def __str__(self):
         return(json.dumps(self.toJSON()))
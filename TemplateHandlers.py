@@ -1,17 +1,20 @@
 import math
-from FieldHandlers import processField
+from FieldHandlers import compileFieldProcessor
 
 BITS_PER_BYTE = 8
 ETHER_MTU = 1500
 L2TEMPLATE = 256
 
+__processPacketDeltaCount = compileFieldProcessor('packetDeltaCount')
+__processLayer2OctetDeltaCount = compileFieldProcessor('layer2OctetDeltaCount')
+
 def __L2Traffic(sample):
     bitCount = sample['bitCount']
     byteCount = int(math.ceil(bitCount / BITS_PER_BYTE))
     packetCount = int(math.ceil(byteCount / ETHER_MTU))
     sample.update({
-        'packetDeltaCount': processField('packetDeltaCount', packetCount)[1],
-        'layer2OctetDeltaCount': processField('layer2OctetDeltaCount', byteCount)[1],
+        'packetDeltaCount': __processPacketDeltaCount(packetCount)[1],
+        'layer2OctetDeltaCount': __processLayer2OctetDeltaCount(byteCount)[1],
     })
     return(sample)
 
@@ -19,6 +22,10 @@ POSTCOMPUTEFUNCTIONS = {
     L2TEMPLATE: __L2Traffic
 }
 
+def getPostComputeFunction(templateId):
+    # resolved once per template, e.g., by an IngestionPipeline; None if nothing to compute
+    return(POSTCOMPUTEFUNCTIONS.get(templateId))
+
 def postComputeFields(templateId, sample):
     func = POSTCOMPUTEFUNCTIONS.get(templateId)
     return(sample if(func is None) else func(sample))
@@ -0,0 +1,38 @@
+class TemplateLayout(object):
+    # Ordered Field Specifiers of a template, regardless of its Template Id. Templates with the
+    # same fields share one (interned) layout, so anything derived from the fields, e.g., a
+    # compiled decoder, is built once; records of templates with the same layout are alike.
+    # Layouts are immutable: fields are kept in a tuple.
+
+    def __init__(self, key, fields):
+        self.key = key
+        self.fields = tuple(fields)
+        self.names = tuple([field.name for field in self.fields])
+        self.validators = None
+        self.pagination = False
+
+    def getKey(self): return(self.key)
+    def getFields(self): return(self.fields)
+    def getNames(self): return(self.names)
+    def getNumFields(self): return(len(self.fields))
+
+    def getValidators(self):
+        # (fieldName, index of the value in a read DataRecord, validator) of the constrained
+        # fields; compiled on first use. Read records skip paddingOctets, so indexes skip it too.
+        if(self.validators is None):
+            validators = []
+            index = 0
+            for field in self.fields:
+                if(field.name == 'paddingOctets'): continue
+                validator = field.getValidator()
+                if(validator is not None): validators.append((field.name, index, validator))
+                index += 1
+            self.validators = tuple(validators)
+        return(self.validators)
+
+    def getPagination(self):
+        # PaginationLayout of paginated subTemplateLists (see Pagination), or None
+        if(self.pagination is False):
+            from Pagination import compilePagination
+            self.pagination = compilePagination(self.fields)
+        return(self.pagination)
@@ -22,28 +22,40 @@
 import struct, json
 from Lib.ParameterChecking import checkInteger, checkType
 from FieldSpecifier import FieldSpecifier
+from Interning import internTemplateLayout, internTemplateRecord
 
 class TemplateRecord(object):
+    # TemplateRecords are interned (see Interning): identical ones, even from different domains,
+    # share one instance, and templates with the same fields share one TemplateLayout whatever
+    # their Template Id. Fields are kept in the tuple of the layout.
     _str = struct.Struct('!HH')
     
     def __init__(self):
         self.templateId = None
         self.fieldCount = 0
-        self.fields = []
+        self.fields = ()
+        self.layout = None
     
     @classmethod
     def create(cls, templateId, fields):
         checkInteger('templateId', templateId, 1)
-        checkType('fields', (list,), fields)
+        checkType('fields', (list, tuple), fields)
         
         for field in fields:
             checkType('field', (FieldSpecifier,), field)
         
         obj = cls()
         obj.templateId = templateId
-        obj.fields = fields
-        obj.fieldCount = len(obj.fields)
-        return(obj)
+        obj._setLayout(fields)
+        return(internTemplateRecord(obj))
+
+    def _setLayout(self, fields):
+        self.layout = internTemplateLayout(fields)
+        self.fields = self.layout.fields
+        self.fieldCount = len(self.fields)
+
+    def _getInternKey(self):
+        return((self.templateId, self.layout.key))
 
     @staticmethod
     def checkJSON(fields):
@@ -69,10 +81,9 @@ class TemplateRecord(object):
     def read(cls, rawData):
         obj = cls()
         cls._readHeader(rawData, obj)
-        for _ in xrange(0, obj.fieldCount):
-            field = FieldSpecifier.read(rawData)
-            obj.fields.append(field)
-        return(obj)
+        fields = [FieldSpecifier.read(rawData) for _ in xrange(0, obj.fieldCount)]
+        obj._setLayout(fields)
+        return(internTemplateRecord(obj))
     
     @classmethod
     def _readHeader(cls, rawData, obj):
@@ -91,6 +102,7 @@ class TemplateRecord(object):
         return(length)
 
     def getId(self):        return(self.templateId)
+    def getLayout(self):    return(self.layout)
     def getLength(self):    return(self._computeLength())
     def getNumFields(self): return(self.fieldCount)
     
@@ -0,0 +1,79 @@
+import threading, heapq, time, logging
+
+class TemplateRefreshScheduler(object):
+    # Spreads the periodic template refresh of the domains of a Session evenly along the
+    # refresh interval, instead of refreshing all of them in the same tick.
+    # The list of domains is synchronized once per interval; new domains are assigned
+    # evenly spaced slots along the following interval.
+
+    def __init__(self, session, refreshFunction, interval):
+        self.__session = session
+        self.__refreshFunction = refreshFunction
+        self.__interval = float(interval)
+        self.__schedule = []    # heap of (dueTime, obsDomId); obsDomId=None stands for a domains sync
+        self.__scheduled = set()
+        self.__condition = threading.Condition()
+        self.__thread = None
+        self.__running = False
+
+    def isRunning(self): return(self.__running)
+
+    def start(self):
+        with self.__condition:
+            if(self.__running): return
+            self.__running = True
+            self.__schedule = [(time.time(), None)]
+            self.__scheduled = set()
+        self.__thread = threading.Thread(target=self._run)
+        self.__thread.setDaemon(True)
+        self.__thread.start()
+
+    def stop(self):
+        with self.__condition:
+            if(not self.__running): return
+            self.__running = False
+            self.__condition.notify()
+        if(self.__thread is not threading.current_thread()):
+            self.__thread.join()
+        self.__thread = None
+
+    def _syncDomains(self, now):
+        obsDomIds = [obsDomId for obsDomId in self.__session.getDomainIds() if obsDomId not in self.__scheduled]
+        numDomains = len(obsDomIds)
+        for i,obsDomId in enumerate(sorted(obsDomIds)):
+            dueTime = now + self.__interval * (i + 1) / numDomains
+            heapq.heappush(self.__schedule, (dueTime, obsDomId))
+            self.__scheduled.add(obsDomId)
+        heapq.heappush(self.__schedule, (now + self.__interval, None))
+
+    def _nextDueDomains(self):
+        with self.__condition:
+            while(self.__running):
+                now = time.time()
+                obsDomIds = []
+                while((len(self.__schedule) > 0) and (self.__schedule[0][0] <= now)):
+                    dueTime, obsDomId = heapq.heappop(self.__schedule)
+                    if(obsDomId is None):
+                        self._syncDomains(now)
+                        continue
+                    if(not self.__session.hasDomain(obsDomId)):
+                        self.__scheduled.discard(obsDomId)
+                        continue
+                    dueTime += self.__interval
+                    if(dueTime <= now): dueTime = now + self.__interval
+                    heapq.heappush(self.__schedule, (dueTime, obsDomId))
+                    obsDomIds.append(obsDomId)
+                if(len(obsDomIds) > 0): return(obsDomIds)
+                self.__condition.wait(self.__schedule[0][0] - now)
+            return(None)
+
+    def _run(self):
+        logger = logging.getLogger(__name__)
+        while(True):
+            obsDomIds = self._nextDueDomains()
+            if(obsDomIds is None): return
+            for obsDomId in obsDomIds:
+                try:
+                    self.__refreshFunction(obsDomId)
+                except Exception as e:
+                    logger.exception(e)
@@ -0,0 +1,198 @@
+import sys, time, threading, collections
+
+_entryBytes = sys.getsizeof((None, None, None))
+
+def estimateTemplateBytes(template):
+    # Measured footprint of the objects kept per template: the record, its attributes, its
+    # fields and the store entry. Interned fields shared with other templates are counted for
+    # each of them, so the estimate errs on the safe side.
+    size = _entryBytes + sys.getsizeof(template) + sys.getsizeof(template.__dict__) + sys.getsizeof(template.fields)
+    for field in template.fields:
+        size += sys.getsizeof(field) + sys.getsizeof(field.__dict__)
+    return(size)
+
+class TemplateBudget(object):
+    # Memory accounting shared by the TemplateStores of all the domains of a Session. When the
+    # estimated bytes of all of them exceed maxBytes, unpinned templates are evicted in least
+    # recently used order, whatever their store. Usage is kept in an OrderedDict sorted by the
+    # time templates were set; lookups do not touch it, so a template looked up after it was set
+    # is moved to the tail instead of evicted (second chance), and eviction is O(1) amortized.
+    # The lock serializes the writers of all the stores sharing the budget.
+
+    def __init__(self, maxBytes=None):
+        self.maxBytes = maxBytes
+        self.lock = threading.Lock()
+        self.bytes = 0
+        self.__usage = collections.OrderedDict() # (store, templateId) => time
+        self.__stats = {'evicted': 0}
+
+    def getStats(self):
+        stats = dict(self.__stats)
+        stats['bytes'] = self.bytes
+        stats['templates'] = len(self.__usage)
+        return(stats)
+
+    # called with lock held
+    def _add(self, store, templateId, size, pinned, now):
+        self.bytes += size
+        if(not pinned): self.__usage[(store, templateId)] = now
+
+    def _remove(self, store, templateId, size):
+        self.bytes -= size
+        self.__usage.pop((store, templateId), None)
+
+    def _evictOverBudget(self, keep=None):
+        if((self.maxBytes is None) or (self.bytes <= self.maxBytes)): return
+        usage = self.__usage
+        numChances = len(usage)
+        while((self.bytes > self.maxBytes) and (len(usage) > 0)):
+            key, setTime = next(usage.iteritems())
+            store, templateId = key
+            if(key == keep):
+                if(len(usage) == 1): break
+                del usage[key]
+                usage[key] = setTime
+                continue
+            lastUsed = store._getLastUsed(templateId)
+            if((numChances > 0) and (lastUsed > setTime)):
+                numChances -= 1
+                del usage[key]
+                usage[key] = lastUsed
+                continue
+            store._evict(templateId)
+            self.__stats['evicted'] += 1
+
+class TemplateStore(object):
+    # Collector-side table of templates of an ObservationDomain.
+    # - Templates not refreshed within 'lifetime' seconds are expired (RFC7011, section 8.4),
+    #   when templates are set and by expire(), which collectors call periodically.
+    #   Refresh times are kept in an OrderedDict sorted by refresh, so expiring only pops its head.
+    # - Memory is accounted in a TemplateBudget, usually shared by all the domains of a Session;
+    #   when it is exceeded, the least recently used templates of any store are evicted.
+    # Pinned templates (configured locally, not received from the exporter) never expire nor are evicted.
+    # Lookups read an immutable snapshot that writers replace on every change, so readers take no
+    # locks; writers (set, remove, expire, clear) are serialized by the lock of the budget.
+
+    def __init__(self, budget=None, lifetime=None):
+        if(budget is None): budget = TemplateBudget()
+        self.__budget = budget
+        self.__lifetime = lifetime
+        self.__snapshot = {}                            # templateId => (template, refreshTime, pinned)
+        self.__sizes = {}                               # templateId => estimated bytes
+        self.__refreshed = collections.OrderedDict()    # templateId => last refresh time, unpinned only
+        self.__lastUsed = {}                            # templateId => last lookup time
+        self.__bytes = 0
+        self.__stats = {'hits': 0, 'misses': 0, 'expired': 0, 'evicted': 0}
+
+    def __len__(self): return(len(self.__snapshot))
+
+    def getBudget(self): return(self.__budget)
+
+    def getStats(self):
+        stats = dict(self.__stats)
+        stats['templates'] = len(self.__snapshot)
+        stats['bytes'] = self.__bytes
+        return(stats)
+
+    def getSnapshot(self): return(self.__snapshot)
+    def getIds(self): return(self.__snapshot.keys())
+
+    def isPinned(self, templateId):
+        entry = self.__snapshot.get(templateId)
+        return((entry is not None) and entry[2])
+
+    def getRefreshTime(self, templateId):
+        entry = self.__snapshot.get(templateId)
+        return(None if(entry is None) else entry[1])
+
+    def _getLastUsed(self, templateId):
+        return(self.__lastUsed.get(templateId, 0))
+
+    def _isValid(self, entry, now):
+        if(entry is None): return(False)
+        if((self.__lifetime is None) or entry[2]): return(True)
+        return(now - entry[1] <= self.__lifetime)
+
+    def has(self, templateId, now=None):
+        entry = self.__snapshot.get(templateId)
+        if(entry is None): return(False)
+        if(now is None): now = time.time()
+        return(self._isValid(entry, now))
+
+    def get(self, templateId, now=None):
+        # counters and usage times are updated without locks; a lost update is harmless
+        entry = self.__snapshot.get(templateId)
+        if(entry is not None):
+            if(now is None): now = time.time()
+            if(self._isValid(entry, now)):
+                self.__lastUsed[templateId] = now
+                self.__stats['hits'] += 1
+                return(entry[0])
+        self.__stats['misses'] += 1
+        return(None)
+
+    def set(self, templateId, template, pinned=False, now=None):
+        if(now is None): now = time.time()
+        size = estimateTemplateBytes(template)
+        with self.__budget.lock:
+            snapshot = dict(self.__snapshot)
+            self._remove(snapshot, templateId)
+            snapshot[templateId] = (template, now, pinned)
+            self.__sizes[templateId] = size
+            if(not pinned): self.__refreshed[templateId] = now
+            self.__lastUsed[templateId] = now
+            self.__bytes += size
+            self.__budget._add(self, templateId, size, pinned, now)
+            self._expire(snapshot, now)
+            self.__snapshot = snapshot
+            self.__budget._evictOverBudget(keep=(self, templateId))
+
+    def _remove(self, snapshot, templateId):
+        if(templateId not in snapshot): return(False)
+        del snapshot[templateId]
+        self.__refreshed.pop(templateId, None)
+        self.__lastUsed.pop(templateId, None)
+        size = self.__sizes.pop(templateId)
+        self.__bytes -= size
+        self.__budget._remove(self, templateId, size)
+        return(True)
+
+    def _evict(self, templateId):
+        # called by the budget, with its lock held
+        snapshot = dict(self.__snapshot)
+        if(self._remove(snapshot, templateId)): self.__stats['evicted'] += 1
+        self.__snapshot = snapshot
+
+    def remove(self, templateId):
+        with self.__budget.lock:
+            if(templateId not in self.__snapshot): return(False)
+            snapshot = dict(self.__snapshot)
+            self._remove(snapshot, templateId)
+            self.__snapshot = snapshot
+        return(True)
+
+    def clear(self):
+        # releases all the templates, pinned ones included, e.g., when their domain is discarded
+        with self.__budget.lock:
+            snapshot = dict(self.__snapshot)
+            for templateId in snapshot.keys():
+                self._remove(snapshot, templateId)
+            self.__snapshot = snapshot
+
+    def expire(self, now=None):
+        if(self.__lifetime is None): return
+        if(now is None): now = time.time()
+        with self.__budget.lock:
+            snapshot = dict(self.__snapshot)
+            if(self._expire(snapshot, now) > 0): self.__snapshot = snapshot
+
+    def _expire(self, snapshot, now):
+        if(self.__lifetime is None): return(0)
+        numExpired = 0
+        while(len(self.__refreshed) > 0):
+            templateId, refreshTime = next(self.__refreshed.iteritems())
+            if(now - refreshTime <= self.__lifetime): break
+            self._remove(snapshot, templateId)
+            numExpired += 1
+        self.__stats['expired'] += numExpired
+        return(numExpired)
@@ -0,0 +1,63 @@
+# Reference: https://tools.ietf.org/html/rfc7011#section-8.1
+# Template Withdrawal Record Format:
+#  0                   1                   2                   3
+#  0 1 2 3 4 5 6 7 8 9 0 1 2 3 4 5 6 7 8 9 0 1 2 3 4 5 6 7 8 9 0 1
+# +-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+
+# |         Template ID N         |        Field Count = 0        |
+# +-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+
+#
+# Withdrawals are sent in (Option)TemplateSets. A Template ID equal to the Set ID (2 or 3)
+# withdraws all the (Option)Templates of the domain. They must not be sent over UDP.
+
+import struct, json
+from Lib.ParameterChecking import checkInteger
+
+class TemplateWithdrawal(object):
+    _str = struct.Struct('!HH')
+
+    def __init__(self):
+        self.templateId = None
+        self.fieldCount = 0
+
+    @classmethod
+    def create(cls, templateId):
+        checkInteger('templateId', templateId, 2, 65535)
+        if((templateId > 3) and (templateId < 256)): raise Exception('Template Id (%d) out of range' % (templateId))
+        obj = cls()
+        obj.templateId = templateId
+        return(obj)
+
+    @staticmethod
+    def peek(rawData):
+        # (templateId, fieldCount) of the next record, without consuming it
+        offset = rawData.tell()
+        data = rawData.read(TemplateWithdrawal._str.size)
+        rawData.seek(offset)
+        return(TemplateWithdrawal._str.unpack_from(data))
+
+    @classmethod
+    def read(cls, rawData, setId):
+        data = rawData.read(TemplateWithdrawal._str.size)
+        (templateId, fieldCount) = TemplateWithdrawal._str.unpack_from(data)
+        if(fieldCount != 0): raise Exception('Template Id (%d) is not a withdrawal' % (templateId))
+        if((templateId != setId) and ((templateId < 256) or (templateId > 65535))):
+            raise Exception('Withdrawn Template Id (%d) out of range' % (templateId))
+        obj = cls()
+        obj.templateId = templateId
+        return(obj)
+
+    def getId(self): return(self.templateId)
+
+    def withdrawsAll(self): return(self.templateId in (2, 3))
+
+    def _computeLength(self):
+        return(TemplateWithdrawal._str.size)
+
+    def write(self, rawData):
+        rawData.write(TemplateWithdrawal._str.pack(self.templateId, 0))
+
+    def toJSON(self):
+        return({'templateId': self.templateId, 'fieldCount': 0})
+
+    def __str__(self):
+        return(json.dumps(self.toJSON()))
@@ -1,66 +1,278 @@
-import os, json
-from Lib.ParameterChecking import checkType, checkRegex, checkInteger, checkAttr
+import os, json, hashlib, logging, threading, weakref
+from Lib.ParameterChecking import checkType, checkRegex, checkInteger, checkAttr, checkString, \
+                                  checkFloat
 from Lib.FileTools import readFile
 from Constants import VARIABLE_LENGTH, pen_alias
 from FieldSpecifier import FieldSpecifier
 from TemplateRecord import TemplateRecord
 
+# Definitions files are validated and compiled into the Field Specifiers of their templates in
+# a single pass, by loadDefinitions. The compiled definitions are kept in memory and in a cache
+# file (by default, next to the definitions file) holding each field as resolved from the
+# Information Elements registries: id, PEN, length, name, type, struct format and constraints.
+# The next start rebuilds the fields from it, without parsing the names nor looking up the
+# registries again. Both are keyed by the path, size, mtime and SHA-1 of the file.
+CACHE_VERSION = 2
+CACHE_SUFFIX = '.cache'
+
+_compiledLock = threading.Lock()
+_compiled = {} # absolute path => (stamp, {templateId: fields})
+
+def _compileDefinitions(templatesDefinitions):
+    # validates the definitions while building their fields; returns {templateId: fields}
+    checkType('templatesDefinitions', (dict,), templatesDefinitions)
+    compiled = {}
+    for strTemplateId,templateAttr in templatesDefinitions.iteritems():
+        checkRegex('templateId', '[0-9]+', strTemplateId)
+        templateId = int(strTemplateId)
+        checkInteger('templateId', templateId, 256, 65535)
+        checkType('templateAttr', (dict,), templateAttr)
+
+        fields = checkAttr('fields', templateAttr)
+        checkType('fields', (list,), fields)
+        fieldSpecifiers = []
+        for field in fields:
+            checkType('field', (dict,), field)
+            name = checkAttr('name', field)
+            checkRegex('name', '[a-zA-Z0-9]+', name)
+            enterprise = checkAttr('enterprise', field)
+            checkRegex('enterprise', '[a-zA-Z0-9]+', enterprise)
+            pen = pen_alias.get(enterprise)
+            length = field.get('length')
+            checkInteger('length', length, minValue=1, maxValue=VARIABLE_LENGTH, allowNone=True)
+            if(pen is None): raise Exception('Unknown Enterprise Alias(%s)' % enterprise)
+            if(pen == -1):
+                fieldSpecifiers.append(FieldSpecifier.newIANA(name, length))
+            else:
+                fieldSpecifiers.append(FieldSpecifier.newEnterprise(name, pen, length))
+        compiled[templateId] = tuple(fieldSpecifiers)
+    return(compiled)
+
+def _readCache(cacheFile, stamp):
+    # returns the compiled definitions in cacheFile if they match stamp, None otherwise
+    if(not os.path.isfile(cacheFile)): return(None)
+    logger = logging.getLogger(__name__)
+    try:
+        cache = json.loads(readFile(cacheFile))
+        if(cache.get('version') != CACHE_VERSION): return(None)
+        if(cache.get('stamp') != list(stamp)): return(None)
+        compiled = {}
+        for strTemplateId,fieldDefinitions in cache['templates'].iteritems():
+            compiled[int(strTemplateId)] = tuple([
+                FieldSpecifier.newFromResolved(fieldDefinition) for fieldDefinition in fieldDefinitions])
+        return(compiled)
+    except Exception as e:
+        logger.warning('Ignoring invalid TemplatesCatalog cache(%s): %s' % (cacheFile, str(e)))
+        return(None)
+
+def _writeCache(cacheFile, stamp, compiled):
+    # written to a temporary file and renamed, so readers never see a partial cache
+    cache = {
+        'version': CACHE_VERSION,
+        'stamp': list(stamp),
+        'templates': dict([(str(templateId), [
+            field.getResolvedDefinition() for field in fields
+        ]) for templateId,fields in compiled.iteritems()])
+    }
+    tmpFile = '%s.%d.tmp' % (cacheFile, os.getpid())
+    try:
+        f = open(tmpFile, 'w')
+        f.write(json.dumps(cache))
+        f.close()
+        os.rename(tmpFile, cacheFile)
+    except Exception as e:
+        logger = logging.getLogger(__name__)
+        logger.warning('Unable to write TemplatesCatalog cache(%s): %s' % (cacheFile, str(e)))
+        if(os.path.isfile(tmpFile)): os.remove(tmpFile)
+
+def loadDefinitions(definitionsFile, cacheFile=None):
+    # returns {templateId: fields} of definitionsFile; cacheFile None disables the cache file
+    path = os.path.abspath(definitionsFile)
+    data = readFile(path)
+    stat = os.stat(path)
+    stamp = (path, stat.st_size, stat.st_mtime, hashlib.sha1(data).hexdigest())
+
+    with _compiledLock:
+        entry = _compiled.get(path)
+    if((entry is not None) and (entry[0] == stamp)): return(entry[1])
+
+    compiled = None
+    if(cacheFile is not None): compiled = _readCache(cacheFile, stamp)
+    if(compiled is None):
+        compiled = _compileDefinitions(json.loads(data))
+        if(cacheFile is not None): _writeCache(cacheFile, stamp, compiled)
+
+    with _compiledLock:
+        _compiled[path] = (stamp, compiled)
+    return(compiled)
+
 class TemplatesCatalog(object):
+    # Catalogs can be reloaded while running: reload() compiles the definitions file again and
+    # applies only the differences (added, changed and removed Template Ids) to the registered
+    # Exporters and Collectors, in the domains they injected catalog templates into. Exporters
+    # send just the updated templates and remove the removed ones; Template Withdrawals are only
+    # sent over reliable transports, over UDP the removed templates are no longer refreshed and
+    # collectors let them expire (RFC7011, section 8.4). startWatching() reloads the catalog
+    # whenever the file changes.
     
     def __init__(self):
         self.__templates = {}
+        self.__config = None
+        self.__lock = threading.RLock()
+        self.__entities = []        # [(entity, obsDomainId)]
+        self.__injected = weakref.WeakKeyDictionary() # entity => {obsDomainId: set of Template Ids, or None for all}
+        self.__watchThread = None
+        self.__watchEvent = None
+
+    @staticmethod
+    def _getCacheFile(config):
+        useCache = config.get('useCache')
+        if((useCache is not None) and (not useCache)): return(None)
+        cacheFile = config.get('cacheFile')
+        if(cacheFile is None): cacheFile = config['definitionsFile'] + CACHE_SUFFIX
+        return(cacheFile)
     
     @staticmethod
     def checkConfiguration(config):
+        # the contents of the definitions file are validated when they are loaded, by configure
         checkType('config', (dict,), config)
 
         templatesDefinitionsFile = checkAttr('definitionsFile', config)
         if(not os.path.isfile(templatesDefinitionsFile)):
             raise Exception('templatesDefinitionsFile(%s) does not exist' % templatesDefinitionsFile)
-        templatesDefinitions = json.loads(readFile(templatesDefinitionsFile))
-
-        for strTemplateId,templateAttr in templatesDefinitions.iteritems():
-            checkRegex('templateId', '[0-9]+', strTemplateId)
-            checkInteger('templateId', int(strTemplateId), 256, 65535)
-            checkType('templateAttr', (dict,), templateAttr)
-            
-            fields = checkAttr('fields', templateAttr)
-            checkType('fields', (list,), fields)
-            for field in fields:
-                checkType('field', (dict,), field)
-                name = checkAttr('name', field)
-                checkRegex('name', '[a-zA-Z0-9]+', name)
-                enterprise = checkAttr('enterprise', field)
-                checkRegex('enterprise', '[a-zA-Z0-9]+', enterprise)
-                pen = pen_alias.get(enterprise)
-                length = field.get('length')
-                checkInteger('length', length, minValue=1, maxValue=VARIABLE_LENGTH, allowNone=True)
-                if(pen is None): raise Exception('Unknown Enterprise Alias(%s)' % enterprise)
-                if(pen == -1):
-                    FieldSpecifier.newIANA(name, length)
-                else:
-                    FieldSpecifier.newEnterprise(name, pen, length)
+        if(('useCache' in config) and (config['useCache'] is not None)):
+            checkType('useCache', (bool,), config['useCache'])
+        if(('cacheFile' in config) and (config['cacheFile'] is not None)):
+            checkString('cacheFile', config['cacheFile'], allowEmpty=False)
 
     def configure(self, config):
         TemplatesCatalog.checkConfiguration(config)
-        
-        templatesDefinitions = json.loads(readFile(config.get('definitionsFile')))
+        compiled = loadDefinitions(config['definitionsFile'], TemplatesCatalog._getCacheFile(config))
 
-        self.__templates = {}
-        for strTemplateId,templateAttr in templatesDefinitions.iteritems():
-            templateId = int(strTemplateId)
-            
-            fields = []
-            for field in templateAttr['fields']:
-                name = field.get('name')
-                pen = pen_alias.get(field.get('enterprise'))
-                length = field.get('length')
-                if(pen == -1):
-                    fields.append(FieldSpecifier.newIANA(name, length))
-                else:
-                    fields.append(FieldSpecifier.newEnterprise(name, pen, length))
+        with self.__lock:
+            self.__config = config
+            self.__templates = self._createTemplates(compiled)
+
+    @staticmethod
+    def _createTemplates(compiled):
+        # unchanged templates are the same (interned) TemplateRecords
+        return(dict([(templateId, TemplateRecord.create(templateId, fields))
+                     for templateId,fields in compiled.iteritems()]))
 
-            self.__templates[templateId] = TemplateRecord.create(templateId, fields)
+    def register(self, entity, obsDomainId=None):
+        # entity receives the differences applied by reload(), in obsDomainId or in all its domains
+        from Exporter import Exporter
+        from Collector import Collector
+        if(not isinstance(entity, (Exporter, Collector))): raise Exception('Invalid entity')
+        with self.__lock:
+            self.unregister(entity)
+            self.__entities.append((entity, obsDomainId))
+
+    def unregister(self, entity):
+        with self.__lock:
+            self.__entities = [(entity_, obsDomainId) for entity_,obsDomainId in self.__entities if entity_ is not entity]
+
+    def reload(self):
+        # returns the (added, changed, removed) Template Ids
+        with self.__lock:
+            if(self.__config is None): raise Exception('TemplatesCatalog is not configured')
+            compiled = loadDefinitions(self.__config['definitionsFile'], TemplatesCatalog._getCacheFile(self.__config))
+            templates = self._createTemplates(compiled)
+            oldTemplates = self.__templates
+            added = sorted([templateId for templateId in templates if templateId not in oldTemplates])
+            removed = sorted([templateId for templateId in oldTemplates if templateId not in templates])
+            changed = sorted([templateId for templateId,template in templates.iteritems()
+                              if (templateId in oldTemplates) and (oldTemplates[templateId] is not template)])
+            self.__templates = templates
+            if((len(added) > 0) or (len(changed) > 0) or (len(removed) > 0)):
+                logger = logging.getLogger(__name__)
+                logger.info('TemplatesCatalog reloaded: added(%s) changed(%s) removed(%s)' % (
+                            str(added), str(changed), str(removed)))
+                for entity,obsDomainId in self.__entities:
+                    try:
+                        self._applyDiff(entity, obsDomainId, added, changed, removed)
+                    except Exception as e:
+                        logger.exception(e)
+            return(added, changed, removed)
+
+    def _applyDiff(self, entity, obsDomainId, addedTemplateIds, changedTemplateIds, removedTemplateIds):
+        from Exporter import Exporter
+        session = entity.getSession()
+        injected = self.__injected.get(entity, {})
+        obsDomainIds = [obsDomainId_ for obsDomainId_ in session.getDomainIds() if obsDomainId_ in injected]
+        if(obsDomainId is not None):
+            if(obsDomainId not in obsDomainIds): return
+            obsDomainIds = [obsDomainId]
+
+        isExporter = isinstance(entity, (Exporter,))
+        for obsDomainId in obsDomainIds:
+            # domains injected with some templates only get the changes of those
+            injectedTemplateIds = injected[obsDomainId]
+            if(injectedTemplateIds is None):
+                updatedTemplateIds = addedTemplateIds + changedTemplateIds
+                removedTemplateIds_ = removedTemplateIds
+            else:
+                updatedTemplateIds = [templateId for templateId in changedTemplateIds if templateId in injectedTemplateIds]
+                removedTemplateIds_ = [templateId for templateId in removedTemplateIds if templateId in injectedTemplateIds]
+                injectedTemplateIds.difference_update(removedTemplateIds_)
+            domain = session.getDomain(obsDomainId)
+            if(isExporter):
+                for templateId in updatedTemplateIds:
+                    domain.updateExporterTemplate(self.__templates[templateId])
+                if((len(updatedTemplateIds) > 0) and entity.isRunning()):
+                    entity.refreshTemplates(obsDomainId, templateIds=updatedTemplateIds)
+                if(len(removedTemplateIds_) > 0):
+                    entity.withdrawTemplates(removedTemplateIds_, obsDomainId)
+                continue
+            # the domains of the transport sessions were seeded with the templates of the static
+            # domain (see Session); templates received from the exporters are kept
+            for domain_ in [domain] + session.getTransportDomains(obsDomainId):
+                for templateId in updatedTemplateIds:
+                    domain_.updateCollectorTemplate(self.__templates[templateId], pinned=True)
+                for templateId in removedTemplateIds_:
+                    domain_.removeCollectorTemplate(templateId, pinnedOnly=True)
+
+    def isWatching(self): return(self.__watchThread is not None)
+
+    def startWatching(self, interval=5.0):
+        # polls size and mtime of the definitions file every interval seconds
+        checkFloat('interval', interval, 0.1, 3600)
+        with self.__lock:
+            if(self.__config is None): raise Exception('TemplatesCatalog is not configured')
+            if(self.__watchThread is not None): return
+            self.__watchEvent = threading.Event()
+            self.__watchThread = threading.Thread(target=self._watch, args=(self.__watchEvent, float(interval)))
+            self.__watchThread.setDaemon(True)
+            self.__watchThread.start()
+
+    def stopWatching(self):
+        with self.__lock:
+            thread = self.__watchThread
+            if(thread is None): return
+            self.__watchEvent.set()
+            self.__watchThread = None
+        if(thread is not threading.current_thread()):
+            thread.join()
+
+    def _getFileStamp(self):
+        try:
+            stat = os.stat(self.__config['definitionsFile'])
+            return((stat.st_size, stat.st_mtime))
+        except OSError:
+            return(None)
+
+    def _watch(self, event, interval):
+        logger = logging.getLogger(__name__)
+        lastStamp = self._getFileStamp()
+        while(not event.wait(interval)):
+            stamp = self._getFileStamp()
+            if((stamp is None) or (stamp == lastStamp)): continue
+            lastStamp = stamp
+            try:
+                self.reload()
+            except Exception as e:
+                # the catalog keeps its templates until the file is fixed
+                logger.exception(e)
     
     def getTemplateIds(self): return(self.__templates.keys())
     
@@ -83,6 +295,7 @@ class TemplatesCatalog(object):
             if(obsDomainId not in obsDomainIds): return
             obsDomainIds = [obsDomainId]
 
+        allTemplateIds = (templateIds is None)
         if(templateIds is None):
             templateIds = self.getTemplateIds()
         else:
@@ -101,7 +314,13 @@ class TemplatesCatalog(object):
             for templateId in templateIds:
                 template = self.__templates.get(templateId)
                 if(isExporter): domain.updateExporterTemplate(template)
-                if(isCollector): domain.updateCollectorTemplate(template)
+                if(isCollector): domain.updateCollectorTemplate(template, pinned=True)
+            with self.__lock:
+                injected = self.__injected.setdefault(entity, {})
+                if(allTemplateIds or (injected.get(obsDomainId, set()) is None)):
+                    injected[obsDomainId] = None
+                else:
+                    injected[obsDomainId] = injected.get(obsDomainId, set()).union(templateIds)
         
         if(doRefreshTemplates):
             if(isCollector):
@@ -0,0 +1,75 @@
+import time, threading, collections
+from Lib.ParameterChecking import checkInteger, checkFloat
+
+class TransportSessions(object):
+    # Table of the ObservationDomains a collector keeps per exporter, keyed by
+    # (sourceIP, sourcePort, obsDomainId). Entries are kept in an OrderedDict sorted by last
+    # activity, so lookups are O(1) and both idle and least recently used entries are found
+    # at its head; the table never grows above maxSessions. Domains of discarded sessions are
+    # passed to domainRelease, e.g., to give back the memory accounted for their templates.
+
+    def __init__(self, domainFactory, maxSessions, idleTimeout, domainRelease=None):
+        checkInteger('maxSessions', maxSessions, 1)
+        checkFloat('idleTimeout', idleTimeout, 0)
+        self.__domainFactory = domainFactory
+        self.__domainRelease = domainRelease
+        self.__maxSessions = maxSessions
+        self.__idleTimeout = idleTimeout
+        self.__sessions = collections.OrderedDict() # key => [lastActivity, domain]
+        self.__lock = threading.Lock()
+        self.__stats = {'created': 0, 'evictedIdle': 0, 'evictedOverflow': 0}
+
+    def getStats(self):
+        stats = dict(self.__stats)
+        stats['sessions'] = len(self.__sessions)
+        return(stats)
+
+    def has(self, key): return(key in self.__sessions)
+
+    def getKeys(self):
+        with self.__lock: return(self.__sessions.keys())
+
+    def getDomains(self):
+        with self.__lock: return([entry[1] for entry in self.__sessions.itervalues()])
+
+    def getItems(self):
+        with self.__lock: return([(key, entry[1]) for key,entry in self.__sessions.iteritems()])
+
+    def get(self, key, now=None):
+        if(now is None): now = time.time()
+        with self.__lock:
+            self._evictIdle(now)
+            return(self._get(key, now))
+
+    def _get(self, key, now):
+        entry = self.__sessions.pop(key, None)
+        if(entry is None):
+            if(len(self.__sessions) >= self.__maxSessions):
+                _, evicted = self.__sessions.popitem(last=False)
+                self._release(evicted[1])
+                self.__stats['evictedOverflow'] += 1
+            entry = [now, self.__domainFactory(key[2])]
+            self.__stats['created'] += 1
+        else:
+            entry[0] = now
+        self.__sessions[key] = entry
+        return(entry[1])
+
+    def evictIdle(self, now=None):
+        if(now is None): now = time.time()
+        with self.__lock: self._evictIdle(now)
+
+    def _evictIdle(self, now):
+        while(len(self.__sessions) > 0):
+            key = next(iter(self.__sessions))
+            if(now - self.__sessions[key][0] < self.__idleTimeout): break
+            self._release(self.__sessions.pop(key)[1])
+            self.__stats['evictedIdle'] += 1
+
+    def _release(self, domain):
+        if(self.__domainRelease is not None): self.__domainRelease(domain)
+
+    def remove(self, key):
+        with self.__lock:
+            entry = self.__sessions.pop(key, None)
+            if(entry is not None): self._release(entry[1])
@@ -0,0 +1,61 @@
+import itertools
+from Lib.ParameterChecking import checkType, checkAttr, checkOptions, checkInteger
+
+VALIDATION_FULL = 'full'        # every record is checked
+VALIDATION_SAMPLED = 'sampled'  # one record out of sampleInterval is checked
+VALIDATION_TRUSTED = 'trusted'  # no record is checked, e.g., internal exporters
+VALIDATION_MODES = [VALIDATION_FULL, VALIDATION_SAMPLED, VALIDATION_TRUSTED]
+
+def compileFieldValidator(field):
+    # Returns a callable checking the minValue/maxValue/choose constraints of a FieldSpecifier
+    # on a value, or None when the field has no constraints. Choices are kept in a frozenset.
+    name = field.name
+    minValue = field.minValue
+    maxValue = field.maxValue
+    choices = None if(field.choose is None) else frozenset(field.choose)
+    if((minValue is None) and (maxValue is None)):
+        if(choices is None): return(None)
+        def validateChoice(value):
+            if(value not in choices): raise Exception('Invalid choice(%s) in field(%s)' % (str(value), name))
+        return(validateChoice)
+
+    def validate(value):
+        if((minValue is not None) and (value < minValue)): raise Exception('Underflow value(%s) < minValue(%s) in field(%s)' % (str(value), str(minValue), name))
+        if((maxValue is not None) and (value > maxValue)): raise Exception('Overflow value(%s) > maxValue(%s) in field(%s)' % (str(value), str(maxValue), name))
+        if((choices is not None) and (value not in choices)): raise Exception('Invalid choice(%s) in field(%s)' % (str(value), name))
+    return(validate)
+
+class ValidationPolicy(object):
+    # Decides which records get their values checked against the constraints of their fields.
+    # Checks are compiled once per template layout (see TemplateLayout.getValidators), so a
+    # trusted policy costs a single call per record.
+
+    def __init__(self, mode=VALIDATION_FULL, sampleInterval=None):
+        checkOptions('mode', mode, VALIDATION_MODES)
+        if(mode == VALIDATION_SAMPLED):
+            checkInteger('sampleInterval', sampleInterval, 1)
+        self.__mode = mode
+        self.__sampleInterval = sampleInterval
+        self.__counter = itertools.count()
+
+    @staticmethod
+    def checkConfiguration(config):
+        checkType('config', (dict,), config)
+        mode = checkAttr('mode', config)
+        checkOptions('mode', mode, VALIDATION_MODES)
+        if(mode == VALIDATION_SAMPLED):
+            checkInteger('sampleInterval', checkAttr('sampleInterval', config), 1)
+
+    @classmethod
+    def newFromConfig(cls, config):
+        ValidationPolicy.checkConfiguration(config)
+        return(cls(config['mode'], config.get('sampleInterval')))
+
+    def getMode(self): return(self.__mode)
+    def getSampleInterval(self): return(self.__sampleInterval)
+
+    def shouldValidate(self):
+        # called once per record; the counter is not locked, itertools.count is atomic under the GIL
+        if(self.__mode == VALIDATION_FULL): return(True)
+        if(self.__mode == VALIDATION_TRUSTED): return(False)
+        return((next(self.__counter) % self.__sampleInterval) == 0)
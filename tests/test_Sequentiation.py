@@ -0,0 +1,95 @@
+import os, sys, time, unittest
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from ObservationDomain import Sequentiation, SEQUENCE_NUMBER_MODULO, SEQUENCE_WINDOW_GAPS
+
+class TestSequentiation(unittest.TestCase):
+    def setUp(self):
+        self.seq = Sequentiation()
+        self.exportTime = time.gmtime(0)
+
+    def check(self, sequenceNumber, numRecords, complete=True):
+        self.seq.check(sequenceNumber, numRecords, self.exportTime, complete)
+        return(self.seq.getStats())
+
+    def test_in_order(self):
+        self.check(100, 10)
+        stats = self.check(110, 10)
+        self.assertEqual((stats['messages'], stats['received']), (2, 20))
+        self.assertEqual((stats['lost'], stats['duplicated'], stats['reordered']), (0, 0, 0))
+        self.assertEqual(self.seq.get()[0], 120)
+
+    def test_loss(self):
+        self.check(100, 10)
+        stats = self.check(130, 10)
+        self.assertEqual(stats['lost'], 20)
+        self.assertEqual(stats['pendingGaps'], 1)
+        self.assertEqual(self.seq.get()[0], 140)
+
+    def test_reorder_fills_gap(self):
+        self.check(100, 10)
+        self.check(130, 10)
+        self.check(120, 10)
+        stats = self.check(110, 10)
+        self.assertEqual((stats['lost'], stats['reordered'], stats['duplicated']), (0, 20, 0))
+        self.assertEqual(stats['pendingGaps'], 0)
+        self.assertEqual(self.seq.get()[0], 140)
+
+    def test_partial_fill_splits_gap(self):
+        self.check(100, 10)
+        self.check(130, 10)
+        stats = self.check(115, 5)
+        self.assertEqual((stats['lost'], stats['reordered']), (15, 5))
+        self.assertEqual(self.seq.gaps, [(110, 5), (120, 10)])
+
+    def test_duplicate(self):
+        self.check(100, 10)
+        self.check(110, 10)
+        stats = self.check(100, 10)
+        self.assertEqual((stats['lost'], stats['reordered'], stats['duplicated']), (0, 0, 10))
+        self.assertEqual(self.seq.get()[0], 120)
+
+    def test_refilled_gap_counts_duplicated(self):
+        self.check(100, 10)
+        self.check(120, 10)
+        self.check(110, 10)
+        stats = self.check(110, 10)
+        self.assertEqual((stats['lost'], stats['reordered'], stats['duplicated']), (0, 10, 10))
+
+    def test_gap_window(self):
+        self.check(0, 1)
+        for i in range(SEQUENCE_WINDOW_GAPS + 1):
+            self.check(2 * i + 2, 1)
+        stats = self.seq.getStats()
+        self.assertEqual(stats['pendingGaps'], SEQUENCE_WINDOW_GAPS)
+        self.assertEqual(stats['lost'], SEQUENCE_WINDOW_GAPS + 1)
+        # the oldest gap left the window: its record is a duplicate, not a reorder
+        stats = self.check(1, 1)
+        self.assertEqual((stats['lost'], stats['reordered'], stats['duplicated']), (SEQUENCE_WINDOW_GAPS + 1, 0, 1))
+        stats = self.check(3, 1)
+        self.assertEqual((stats['lost'], stats['reordered']), (SEQUENCE_WINDOW_GAPS, 1))
+
+    def test_wraparound(self):
+        self.check(SEQUENCE_NUMBER_MODULO - 5, 10)
+        stats = self.check(5, 3)
+        self.assertEqual((stats['lost'], stats['duplicated'], stats['resyncs']), (0, 0, 0))
+        self.assertEqual(self.seq.get()[0], 8)
+
+    def test_exporter_restart_resyncs(self):
+        self.check(1000, 10)
+        self.check(1, 10)
+        stats = self.check(11, 10)
+        self.assertEqual(stats['resyncs'], 1)
+        self.assertEqual(self.seq.get()[0], 21)
+        stats = self.check(21, 10)
+        self.assertEqual(stats['lost'], 0)
+
+    def test_incomplete_message_resyncs(self):
+        self.check(100, 10)
+        self.check(120, 3, complete=False)
+        stats = self.check(200, 10)
+        self.assertEqual(stats['lost'], 10)
+        self.assertEqual(stats['pendingGaps'], 0)
+        self.assertEqual(self.seq.get()[0], 210)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+import os, sys, unittest
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from TemplateStore import TemplateStore, TemplateBudget, estimateTemplateBytes
+from TemplateRecord import TemplateRecord
+from FieldSpecifier import FieldSpecifier
+
+def newTemplate(templateId):
+    return(TemplateRecord.create(templateId, [FieldSpecifier.newIANA('octetDeltaCount', 8)]))
+
+class TestTemplateBudget(unittest.TestCase):
+    def setUp(self):
+        self.size = estimateTemplateBytes(newTemplate(256))
+        self.budget = TemplateBudget(self.size * 3)
+        self.store1 = TemplateStore(self.budget)
+        self.store2 = TemplateStore(self.budget)
+
+    def test_accounting(self):
+        self.store1.set(256, newTemplate(256), now=0)
+        self.store2.set(257, newTemplate(257), now=1)
+        stats = self.budget.getStats()
+        self.assertEqual(stats['bytes'], self.size * 2)
+        self.assertEqual(stats['templates'], 2)
+        self.store1.remove(256)
+        self.assertEqual(self.budget.getStats()['bytes'], self.size)
+        self.store2.clear()
+        self.assertEqual(self.budget.getStats()['bytes'], 0)
+
+    def test_evicts_least_recently_set_across_stores(self):
+        self.store1.set(256, newTemplate(256), now=0)
+        self.store2.set(257, newTemplate(257), now=1)
+        self.store1.set(258, newTemplate(258), now=2)
+        self.store2.set(259, newTemplate(259), now=3)
+        self.assertEqual(sorted(self.store1.getIds()), [258])
+        self.assertEqual(sorted(self.store2.getIds()), [257, 259])
+        self.assertEqual(self.store1.getStats()['evicted'], 1)
+        self.assertEqual(self.budget.getStats()['evicted'], 1)
+        self.assertEqual(self.budget.getStats()['bytes'], self.size * 3)
+
+    def test_second_chance_for_used_templates(self):
+        self.store1.set(256, newTemplate(256), now=0)
+        self.store2.set(257, newTemplate(257), now=1)
+        self.store1.set(258, newTemplate(258), now=2)
+        self.assertIsNotNone(self.store1.get(256, now=3))
+        self.store2.set(259, newTemplate(259), now=4)
+        self.assertEqual(sorted(self.store1.getIds()), [256, 258])
+        self.assertEqual(sorted(self.store2.getIds()), [259])
+
+    def test_pinned_templates_are_not_evicted(self):
+        self.store1.set(256, newTemplate(256), pinned=True, now=0)
+        self.store1.set(257, newTemplate(257), pinned=True, now=1)
+        self.store2.set(258, newTemplate(258), now=2)
+        self.store2.set(259, newTemplate(259), now=3)
+        self.assertEqual(sorted(self.store1.getIds()), [256, 257])
+        self.assertEqual(sorted(self.store2.getIds()), [259])
+
+    def test_template_being_set_is_kept(self):
+        # over budget with only pinned templates left, the one just set stays
+        self.store1.set(256, newTemplate(256), pinned=True, now=0)
+        self.store1.set(257, newTemplate(257), pinned=True, now=1)
+        self.store1.set(258, newTemplate(258), pinned=True, now=2)
+        self.store2.set(259, newTemplate(259), now=3)
+        self.assertEqual(sorted(self.store2.getIds()), [259])
+        self.assertEqual(self.budget.getStats()['bytes'], self.size * 4)
+
+class TestTemplateStoreExpiry(unittest.TestCase):
+    def setUp(self):
+        self.store = TemplateStore(TemplateBudget(), lifetime=10)
+
+    def test_lookups_honor_lifetime(self):
+        self.store.set(256, newTemplate(256), now=0)
+        self.assertIsNotNone(self.store.get(256, now=10))
+        self.assertIsNone(self.store.get(256, now=11))
+        self.assertFalse(self.store.has(256, now=11))
+        self.assertEqual(self.store.getStats()['misses'], 1)
+
+    def test_expire(self):
+        self.store.set(256, newTemplate(256), now=0)
+        self.store.set(257, newTemplate(257), now=5)
+        self.store.set(258, newTemplate(258), pinned=True, now=0)
+        self.store.expire(now=12)
+        self.assertEqual(sorted(self.store.getIds()), [257, 258])
+        self.store.expire(now=100)
+        self.assertEqual(sorted(self.store.getIds()), [258])
+        self.assertEqual(self.store.getStats()['expired'], 2)
+        self.assertEqual(self.store.getBudget().getStats()['templates'], 0)
+
+    def test_refresh_extends_lifetime(self):
+        self.store.set(256, newTemplate(256), now=0)
+        self.store.set(257, newTemplate(257), now=1)
+        self.store.set(256, newTemplate(256), now=8)
+        self.store.expire(now=15)
+        self.assertEqual(sorted(self.store.getIds()), [256])
+        self.assertEqual(self.store.getRefreshTime(256), 8)
+
+    def test_set_expires_stale_templates(self):
+        self.store.set(256, newTemplate(256), now=0)
+        self.store.set(257, newTemplate(257), now=20)
+        self.assertEqual(sorted(self.store.getIds()), [257])
+        self.assertEqual(self.store.getStats()['expired'], 1)
+
+if __name__ == '__main__':
+    unittest.main()